@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+
+# bcl2fastq accepts --barcode-mismatches 0, 1 or 2
+MAX_BARCODE_MISMATCHES = 2
+# Rows of the all-pairs distance matrix computed at a time
+PAIR_BLOCK_ROWS = 512
+
+_CODES = np.full(256, 0, dtype=np.uint64)
+for _i, _base in enumerate("ACGT"):
+    _CODES[ord(_base)] = _i
+    _CODES[ord(_base.lower())] = _i
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+_LOW_BITS = np.uint64(0x5555555555555555)
+
+
+def pack_barcodes(sequences, length):
+    """
+    Packs barcodes 2 bits per base into uint64 (up to 32 bases), truncated to
+    length. Returns (packed, unknown) where unknown has both bits of every
+    base that is not A/C/G/T set, so an N never matches.
+    """
+    raw = np.frombuffer("".join(s[:length].ljust(length, "N") for s in sequences).encode("ascii"),
+                        dtype=np.uint8).reshape(len(sequences), length)
+    shifts = np.arange(length, dtype=np.uint64) * np.uint64(2)
+    packed = np.bitwise_or.reduce(_CODES[raw] << shifts, axis=1, initial=np.uint64(0))
+    unknown = ~np.isin(raw, np.frombuffer(b"ACGTacgt", dtype=np.uint8))
+    unknown = np.bitwise_or.reduce(unknown.astype(np.uint64) * np.uint64(3) << shifts, axis=1, initial=np.uint64(0))
+    return packed, unknown
+
+
+def _popcount(values):
+    return _POPCOUNT[values.view(np.uint8)].reshape(*values.shape, 8).sum(axis=-1, dtype=np.int64)
+
+
+def hamming_distances(packed, unknown):
+    """
+    All-pairs Hamming distance matrix, computed PAIR_BLOCK_ROWS rows at a time.
+    """
+    n = len(packed)
+    distance = np.empty((n, n), dtype=np.int64)
+    for start in range(0, n, PAIR_BLOCK_ROWS):
+        rows = slice(start, min(start + PAIR_BLOCK_ROWS, n))
+        diff = (packed[rows, None] ^ packed[None, :]) | unknown[rows, None] | unknown[None, :]
+        # A base differs if either of its two bits differs; collapse that onto the low bit
+        distance[rows] = _popcount((diff | (diff >> np.uint64(1))) & _LOW_BITS)
+    return distance
+
+
+def safe_mismatches(distance):
+    """
+    Largest mismatch setting that keeps two barcodes at this distance apart:
+    the mismatch spheres must not touch, i.e. distance > 2 * mismatches.
+    -1 means the barcodes are identical and cannot be told apart at all.
+    """
+    return np.clip((distance - 1) // 2, -1, MAX_BARCODE_MISMATCHES)
+
+
+def find_collisions(df, max_mismatches=MAX_BARCODE_MISMATCHES):
+    """
+    All pairs of samples within a lane whose barcodes are too close for
+    max_mismatches. bcl2fastq applies the mismatch tolerance to each index read
+    separately, so a pair is only ambiguous if i7 AND i5 are both within reach;
+    its safe setting is limited by the larger of the two distances.
+
+    Returns (pairs DataFrame, per-lane summary DataFrame).
+    """
+    lanes = df["Lane"] if "Lane" in df.columns else pd.Series("all", index=df.index)
+    index_columns = [c for c in ("index", "index2") if c in df.columns and (df[c] != "").any()]
+    pair_frames = []
+    summary = []
+    if not index_columns:
+        return pd.DataFrame(), pd.DataFrame()
+    for lane, group in df.groupby(lanes, sort=True):
+        distances = {}
+        for column in index_columns:
+            if (group[column] == "").any():
+                # Single-indexed samples in this lane: the i5 read is not used to demultiplex it
+                continue
+            sequences = group[column].fillna("").tolist()
+            # bcl2fastq only reads as many index cycles as the shortest barcode
+            length = min(32, min(len(s) for s in sequences))
+            distances[column] = hamming_distances(*pack_barcodes(sequences, length))
+        a, b = np.triu_indices(len(group), k=1)
+        pair_distance = np.max([d[a, b] for d in distances.values()], axis=0) if distances else np.zeros(len(a), np.int64)
+        safe = safe_mismatches(pair_distance)
+        close = pair_distance <= 2 * max_mismatches
+        recommended = int(safe.min()) if len(safe) else MAX_BARCODE_MISMATCHES
+        summary.append({
+            "Lane": lane,
+            "Samples": len(group),
+            "Min distance": int(pair_distance.min()) if len(pair_distance) else None,
+            "Close pairs": int(close.sum()),
+            "Recommended --barcode-mismatches": recommended if recommended >= 0 else None,
+        })
+        if close.any():
+            a, b = a[close], b[close]
+            barcodes = group[list(distances)].agg("+".join, axis=1).to_numpy()
+            sample_ids = group["Sample_ID"].to_numpy()
+            pairs = pd.DataFrame({"Lane": lane, "Sample A": sample_ids[a], "Sample B": sample_ids[b],
+                                  "Barcode A": barcodes[a], "Barcode B": barcodes[b]})
+            for column, distance in distances.items():
+                pairs[f"{'i7' if column == 'index' else 'i5'} distance"] = distance[a, b]
+            pairs["Max safe mismatches"] = safe[close]
+            pair_frames.append(pairs)
+    pairs = pd.concat(pair_frames, ignore_index=True) if pair_frames else pd.DataFrame()
+    return pairs, pd.DataFrame(summary)
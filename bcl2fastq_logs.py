@@ -0,0 +1,83 @@
+import os
+from collections import deque
+
+# Job logs rotate to .1 ... .N once they reach this size
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUPS = 5
+# Lines kept by the UI tail and the most bytes read per poll
+TAIL_LINES = 200
+TAIL_MAX_READ = 256 * 1024
+
+
+class RotatingLog:
+    """
+    Append-only job log written line by line, rotated to path.1 ... path.N by size.
+    """
+
+    def __init__(self, path, max_bytes=LOG_MAX_BYTES, backups=LOG_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._file = open(path, "ab")
+
+    def write_line(self, line):
+        self._file.write(line)
+        self._file.flush()
+        if self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        self._file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{i}"):
+                os.replace(f"{self.path}.{i}", f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+        self._file = open(self.path, "ab")
+
+    def close(self):
+        self._file.close()
+
+
+def new_tail(max_lines=TAIL_LINES):
+    """
+    State for tail_log: current file identity, read offset and the last lines seen.
+    """
+    return {"inode": None, "offset": 0, "partial": b"", "lines": deque(maxlen=max_lines)}
+
+
+def _read_from(path, offset, tail):
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        end = f.tell()
+        # Only the tail is kept, so skip anything that would be pushed out anyway
+        if end - offset > TAIL_MAX_READ:
+            offset = end - TAIL_MAX_READ
+            tail["partial"] = b""
+        f.seek(offset)
+        data = tail["partial"] + f.read(end - offset)
+    lines = data.split(b"\n")
+    tail["partial"] = lines.pop()
+    tail["lines"].extend(line.decode("utf-8", errors="replace") for line in lines)
+    return end
+
+
+def tail_log(path, tail):
+    """
+    Reads only the bytes appended to a rotating log since the last call and
+    returns the bounded list of most recent lines.
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return list(tail["lines"])
+    if tail["inode"] is not None and tail["inode"] != stat.st_ino:
+        # The log rotated since the last poll: finish the old file before starting the new one
+        rotated = f"{path}.1"
+        if os.path.exists(rotated) and os.stat(rotated).st_ino == tail["inode"]:
+            _read_from(rotated, tail["offset"], tail)
+        tail["offset"] = 0
+    elif stat.st_size < tail["offset"]:
+        tail["offset"] = 0
+    tail["inode"] = stat.st_ino
+    tail["offset"] = _read_from(path, tail["offset"], tail)
+    return list(tail["lines"])
@@ -0,0 +1,185 @@
+import json
+import os
+import re
+import struct
+import threading
+import time
+
+from run_folder import parse_run_info
+
+PROGRESS_NAME = "progress.json"
+# How often the runner refreshes progress.json and re-measures the FASTQ output
+PROGRESS_WRITE_SECONDS = 2.0
+FASTQ_SCAN_SECONDS = 10.0
+# No new tiles and no FASTQ growth for this long marks a job as possibly stalled
+STALL_SECONDS = 15 * 60
+
+# bcl2fastq mentions the lane and tile it is working on, e.g.
+# "... lane 1 tile 1101 ...", "... tile 1101 (lane 1) ..." or "... s_1_1101 ..."
+_LANE_TILE = re.compile(r"lane\s*:?\s*(\d+)\D{0,20}?tile\s*:?\s*(\d+)", re.IGNORECASE)
+_TILE_LANE = re.compile(r"tile\s*:?\s*(\d+)\D{0,20}?lane\s*:?\s*(\d+)", re.IGNORECASE)
+_TILE_NAME = re.compile(r"\bs_(\d+)_(\d{4,5})\b")
+_COMPLETED = re.compile(r"Processing completed with (\d+) errors", re.IGNORECASE)
+
+
+def expected_tiles(input_dir):
+    """
+    Number of (lane, tile) pairs in the run, from the RunInfo.xml flowcell layout, or None.
+    """
+    run_info = parse_run_info(input_dir)
+    return run_info["tiles"] if run_info else None
+
+
+def tile_clusters(input_dir, lane, tile):
+    """
+    Cluster count of one tile from its .filter file header, or None if there is none.
+    """
+    for name in (f"s_{lane}_{tile}.filter", f"s_{lane}_{int(tile):04d}.filter"):
+        path = os.path.join(input_dir, "Data", "Intensities", "BaseCalls", f"L{lane:03d}", name)
+        try:
+            with open(path, "rb") as f:
+                header = f.read(12)
+        except OSError:
+            continue
+        if len(header) == 12:
+            return struct.unpack("<III", header)[2]
+    return None
+
+
+def fastq_bytes(output_dir):
+    """
+    Total size of the FASTQ files written so far under output_dir.
+    """
+    total = 0
+    stack = [output_dir]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith((".fastq.gz", ".fastq")):
+                    total += entry.stat(follow_symlinks=False).st_size
+    return total
+
+
+class ProgressTracker:
+    """
+    Fed every bcl2fastq log line by the job runner; derives tile progress,
+    throughput and an ETA and writes them to progress.json in the job directory.
+    """
+
+    def __init__(self, job_dir, input_dir, output_dir, parts=1):
+        self.path = os.path.join(job_dir, PROGRESS_NAME)
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.tiles_total = expected_tiles(input_dir)
+        self.tiles = set()
+        self.clusters = 0
+        self.complete = False
+        # Lane-sharded jobs run one bcl2fastq per lane; each reports its own completion
+        self.parts = parts
+        self._completed_parts = 0
+        self.started_at = time.time()
+        self.last_progress_at = self.started_at
+        self.fastq_bytes = fastq_bytes(output_dir)
+        self.mb_per_s = 0.0
+        self._last_scan = self.started_at
+        self._last_write = 0.0
+        self._lock = threading.Lock()
+
+    def feed(self, line):
+        text = line.decode("utf-8", errors="replace") if isinstance(line, bytes) else line
+        match = _LANE_TILE.search(text)
+        if match:
+            key = (int(match.group(1)), int(match.group(2)))
+        else:
+            match = _TILE_LANE.search(text) or _TILE_NAME.search(text)
+            if match and match.re is _TILE_LANE:
+                key = (int(match.group(2)), int(match.group(1)))
+            elif match:
+                key = (int(match.group(1)), int(match.group(2)))
+            else:
+                key = None
+        if key is not None and key not in self.tiles:
+            self.tiles.add(key)
+            self.clusters += tile_clusters(self.input_dir, *key) or 0
+            self.last_progress_at = time.time()
+        if _COMPLETED.search(text):
+            self._completed_parts += 1
+            self.complete = self._completed_parts >= self.parts
+        self.maybe_write()
+
+    def _scan_output(self, now):
+        size = fastq_bytes(self.output_dir)
+        elapsed = now - self._last_scan
+        if elapsed > 0:
+            self.mb_per_s = (size - self.fastq_bytes) / elapsed / 1024 ** 2
+        if size > self.fastq_bytes:
+            self.last_progress_at = now
+        self.fastq_bytes = size
+        self._last_scan = now
+
+    def snapshot(self):
+        now = time.time()
+        elapsed = now - self.started_at
+        fraction = None
+        if self.complete:
+            fraction = 1.0
+        elif self.tiles_total:
+            fraction = min(len(self.tiles) / self.tiles_total, 0.99)
+        eta = None
+        if fraction and 0 < fraction < 1:
+            eta = elapsed / fraction * (1 - fraction)
+        return {
+            "tiles_done": len(self.tiles),
+            "tiles_total": self.tiles_total,
+            "fraction": fraction,
+            "eta_seconds": eta,
+            "clusters_done": self.clusters,
+            "clusters_per_s": self.clusters / elapsed if elapsed > 0 else 0.0,
+            "fastq_bytes": self.fastq_bytes,
+            "fastq_mb_per_s": self.mb_per_s,
+            "elapsed_seconds": elapsed,
+            "stalled": not self.complete and now - self.last_progress_at > STALL_SECONDS,
+            "complete": self.complete,
+            "updated_at": now,
+        }
+
+    def maybe_write(self, force=False):
+        """
+        Writes progress.json at most every PROGRESS_WRITE_SECONDS. Called for every
+        log line and from the runner's timer, so quiet phases are still reported.
+        """
+        with self._lock:
+            now = time.time()
+            if not force and now - self._last_write < PROGRESS_WRITE_SECONDS:
+                return
+            if force or now - self._last_scan >= FASTQ_SCAN_SECONDS:
+                self._scan_output(now)
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(self.snapshot(), f)
+            os.replace(temp_path, self.path)
+            self._last_write = now
+
+
+def read_progress(job_dir):
+    """
+    Latest progress written by the job runner, or None before the first update.
+    """
+    try:
+        with open(os.path.join(job_dir, PROGRESS_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return "unknown"
+    seconds = int(seconds)
+    return f"{seconds // 3600}h {seconds % 3600 // 60:02d}m {seconds % 60:02d}s"
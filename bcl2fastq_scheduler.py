@@ -0,0 +1,464 @@
+import fcntl
+import json
+import os
+import queue
+import signal
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+from contextlib import closing
+
+from bcl2fastq_logs import RotatingLog
+from bcl2fastq_progress import PROGRESS_WRITE_SECONDS, ProgressTracker
+from bcl2fastq_shards import merge_shards, shard_output_dir, shard_threads
+from bcl2fastq_tuning import uses_cores
+from run_folder import parse_run_info
+
+# Job table, sample sheets and logs live here so jobs survive server restarts
+JOB_ROOT_ENV = "BCL2FASTQ_JOB_ROOT"
+DEFAULT_JOB_ROOT = os.path.expanduser("~/.bcl2fastq_jobs")
+# Memory reserved per job when deciding whether another one fits on the box
+DEFAULT_JOB_MEMORY_GB = 16
+SCHEDULER_POLL_SECONDS = 2.0
+
+ACTIVE_STATUSES = ("queued", "running")
+# Executable to run; point this at benchmarks/bcl2fastq_stub.py to exercise the scheduler without a sequencer run
+BCL2FASTQ_BIN_ENV = "BCL2FASTQ_BIN"
+LOG_NAME = "bcl2fastq.log"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    input_dir TEXT NOT NULL,
+    output_dir TEXT NOT NULL,
+    threads INTEGER NOT NULL,
+    memory_gb REAL NOT NULL,
+    options TEXT NOT NULL DEFAULT '{}',
+    status TEXT NOT NULL,
+    pid INTEGER,
+    returncode INTEGER,
+    message TEXT NOT NULL DEFAULT '',
+    job_dir TEXT,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+)
+"""
+
+_scheduler_thread = None
+_scheduler_lock = threading.Lock()
+# Popen handles of jobs started by this server process, kept so they can be reaped
+_children = {}
+
+
+def job_root():
+    root = os.environ.get(JOB_ROOT_ENV, DEFAULT_JOB_ROOT)
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def _connect():
+    conn = sqlite3.connect(os.path.join(job_root(), "jobs.sqlite"), timeout=30)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(_SCHEMA)
+    return conn
+
+
+def _job_dict(row):
+    if row is None:
+        return None
+    job = dict(row)
+    job["options"] = json.loads(job["options"])
+    return job
+
+
+def job_threads(job):
+    """
+    Cores a job occupies: its processing threads plus the loading and writing
+    threads passed to bcl2fastq, except those waiting on network storage, which
+    tune_threads leaves out of the core budget too.
+    """
+    threads = job["threads"]
+    for stage, storage in (("loading_threads", "input_storage"), ("writing_threads", "output_storage")):
+        if uses_cores(job["options"].get(storage, "ssd")):
+            threads += job["options"].get(stage) or 0
+    return threads
+
+
+def sample_sheet_path(job):
+    return os.path.join(job["job_dir"], "SampleSheet.csv")
+
+
+def log_path(job):
+    return os.path.join(job["job_dir"], LOG_NAME)
+
+
+def build_bcl2fastq_command(job, output_dir=None, tiles=None, shards=1):
+    """
+    Builds the bcl2fastq command line for a job record, or for one of its
+    lane shards, which get an equal part of the job's threads.
+    """
+    cmd = [
+        os.environ.get(BCL2FASTQ_BIN_ENV, "bcl2fastq"),
+        "--input-dir", job["input_dir"],
+        "--output-dir", output_dir or job["output_dir"],
+        "--sample-sheet", sample_sheet_path(job),
+        "--no-lane-splitting",
+        "--processing-threads", str(shard_threads(job["threads"], shards))
+    ]
+    for option, flag in (("loading_threads", "--loading-threads"), ("writing_threads", "--writing-threads")):
+        if job["options"].get(option):
+            cmd += [flag, str(shard_threads(job["options"][option], shards))]
+    if tiles:
+        cmd += ["--tiles", tiles]
+    if job["options"].get("use_bases_mask"):
+        cmd += ["--use-bases-mask", job["options"]["use_bases_mask"]]
+    if job["options"].get("barcode_mismatches") is not None:
+        cmd += ["--barcode-mismatches", str(job["options"]["barcode_mismatches"])]
+    return cmd
+
+
+def build_job_spec(job):
+    """
+    What the runner executes: one command, or with the lane_shards option one
+    command per lane (--tiles s_N) writing to its own directory, merged afterwards.
+    """
+    spec = {"input_dir": job["input_dir"], "output_dir": job["output_dir"]}
+    run_info = parse_run_info(job["input_dir"]) if job["options"].get("lane_shards") else None
+    if run_info is None or run_info["lanes"] < 2:
+        spec["command"] = build_bcl2fastq_command(job)
+        return spec
+    spec["shards"] = [
+        {
+            "label": f"lane {lane}",
+            "output_dir": shard_output_dir(job["output_dir"], lane),
+            "command": build_bcl2fastq_command(job, shard_output_dir(job["output_dir"], lane), f"s_{lane}",
+                                               run_info["lanes"]),
+        }
+        for lane in range(1, run_info["lanes"] + 1)
+    ]
+    return spec
+
+
+def active_job_count():
+    with closing(_connect()) as conn:
+        return conn.execute(
+            f"SELECT COUNT(*) FROM jobs WHERE status IN ({', '.join('?' * len(ACTIVE_STATUSES))})", ACTIVE_STATUSES
+        ).fetchone()[0]
+
+
+def submit_job(input_dir, output_dir, sample_sheet_content, threads=4, memory_gb=DEFAULT_JOB_MEMORY_GB, options=None):
+    """
+    Queues a demultiplexing job and returns its id.
+    The sample sheet is copied into the job directory.
+    """
+    with closing(_connect()) as conn, conn:
+        cursor = conn.execute(
+            "INSERT INTO jobs (input_dir, output_dir, threads, memory_gb, options, status, submitted_at) "
+            "VALUES (?, ?, ?, ?, ?, 'queued', ?)",
+            (input_dir, output_dir, int(threads), float(memory_gb), json.dumps(options or {}), time.time())
+        )
+        job_id = cursor.lastrowid
+        job_dir = os.path.join(job_root(), f"job_{job_id:06d}")
+        os.makedirs(job_dir, exist_ok=True)
+        with open(os.path.join(job_dir, "SampleSheet.csv"), "w") as f:
+            f.write(sample_sheet_content)
+        conn.execute("UPDATE jobs SET job_dir = ? WHERE id = ?", (job_dir, job_id))
+    ensure_scheduler()
+    return job_id
+
+
+def get_job(job_id):
+    with closing(_connect()) as conn:
+        return _job_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+
+
+def list_jobs(limit=200):
+    with closing(_connect()) as conn:
+        rows = conn.execute("SELECT * FROM jobs ORDER BY id DESC LIMIT ?", (limit,)).fetchall()
+    return [_job_dict(row) for row in rows]
+
+
+def _set_status(conn, job_id, status, **fields):
+    fields["status"] = status
+    columns = ", ".join(f"{name} = ?" for name in fields)
+    conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+
+def cancel_job(job_id):
+    """
+    Cancels a queued job or terminates the process group of a running one.
+    Returns False if the job had already finished.
+    """
+    with closing(_connect()) as conn, conn:
+        job = _job_dict(conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+        if job is None or job["status"] not in ACTIVE_STATUSES:
+            return False
+        if job["status"] == "running" and job["pid"]:
+            try:
+                os.killpg(job["pid"], signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        _set_status(conn, job_id, "cancelled", finished_at=time.time(), message="Cancelled by user")
+    return True
+
+
+def retry_job(job_id):
+    """
+    Queues a new job with the same parameters and sample sheet. Returns the new id.
+    """
+    job = get_job(job_id)
+    with open(sample_sheet_path(job)) as f:
+        content = f.read()
+    return submit_job(job["input_dir"], job["output_dir"], content, job["threads"], job["memory_gb"], job["options"])
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def memory_gb():
+    """
+    Returns (total, available) memory in GB from /proc/meminfo, or None where it is not available.
+    """
+    try:
+        with open("/proc/meminfo") as f:
+            info = {line.split(":")[0]: int(line.split()[1]) for line in f}
+        return info["MemTotal"] / 1024 ** 2, info["MemAvailable"] / 1024 ** 2
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_exit_code(job):
+    try:
+        with open(os.path.join(job["job_dir"], "exit_code")) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _reconcile_running(conn):
+    """
+    Marks running jobs as finished once their runner has written an exit code
+    or their process has disappeared (e.g. the machine was rebooted).
+    """
+    for job in map(_job_dict, conn.execute("SELECT * FROM jobs WHERE status = 'running'").fetchall()):
+        child = _children.get(job["id"])
+        if child is not None and child.poll() is not None:
+            del _children[job["id"]]
+        returncode = _read_exit_code(job)
+        if returncode is None and (child is not None and child.returncode is None or _pid_alive(job["pid"])):
+            continue
+        if returncode == 0:
+            _set_status(conn, job["id"], "succeeded", returncode=0, finished_at=time.time(),
+                        message="bcl2fastq completed successfully.")
+        elif returncode is not None:
+            _set_status(conn, job["id"], "failed", returncode=returncode, finished_at=time.time(),
+                        message=f"bcl2fastq failed with error code {returncode}")
+        else:
+            _set_status(conn, job["id"], "failed", finished_at=time.time(),
+                        message="Job process disappeared without reporting an exit code")
+    # Reap runners of jobs that were cancelled
+    for job_id, child in list(_children.items()):
+        if child.poll() is not None:
+            del _children[job_id]
+
+
+def _admit_queued(conn):
+    """
+    Starts queued jobs in submission order while their threads and memory fit
+    next to the running jobs. A job is always admitted onto an idle box so
+    oversized requests cannot starve.
+    """
+    running = list(map(_job_dict, conn.execute("SELECT * FROM jobs WHERE status = 'running'").fetchall()))
+    used_threads = sum(job_threads(job) for job in running)
+    reserved_gb = sum(job["memory_gb"] for job in running)
+    memory = memory_gb()
+    for job in map(_job_dict, conn.execute("SELECT * FROM jobs WHERE status = 'queued' ORDER BY id").fetchall()):
+        if running:
+            fits_cores = used_threads + job_threads(job) <= available_cores()
+            fits_memory = memory is None or (
+                reserved_gb + job["memory_gb"] <= memory[0] and job["memory_gb"] <= memory[1]
+            )
+            if not (fits_cores and fits_memory):
+                break
+        if not _launch(conn, job):
+            continue
+        running.append(job)
+        used_threads += job_threads(job)
+        reserved_gb += job["memory_gb"]
+
+
+def _launch(conn, job):
+    """
+    Claims a queued job and starts its runner. Returns False if the job was
+    cancelled since it was read, or its runner could not be started.
+    """
+    claimed = conn.execute(
+        "UPDATE jobs SET status = 'running', started_at = ?, message = 'Job started...' "
+        "WHERE id = ? AND status = 'queued'", (time.time(), job["id"])
+    ).rowcount == 1
+    # Committed before the runner exists, so no runner is started for a job a cancel got to first
+    conn.commit()
+    if not claimed:
+        return False
+    try:
+        with open(os.path.join(job["job_dir"], "job.json"), "w") as f:
+            json.dump(build_job_spec(job), f)
+        # The runner writes the bcl2fastq log itself; its own errors go to runner.err
+        with open(os.path.join(job["job_dir"], "runner.err"), "ab") as err:
+            # The runner gets its own session so it outlives a server restart and can be cancelled as a group
+            child = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "--run", job["job_dir"]],
+                stdout=err, stderr=subprocess.STDOUT, stdin=subprocess.DEVNULL,
+                cwd=job["job_dir"], start_new_session=True
+            )
+    except OSError as e:
+        _set_status(conn, job["id"], "failed", finished_at=time.time(), message=f"Could not start the job: {e}")
+        conn.commit()
+        return False
+    _children[job["id"]] = child
+    started = conn.execute("UPDATE jobs SET pid = ? WHERE id = ? AND status = 'running'",
+                           (child.pid, job["id"])).rowcount == 1
+    conn.commit()
+    if not started:
+        # Cancelled while the runner was starting, before its pid was known to cancel_job
+        os.killpg(child.pid, signal.SIGTERM)
+    return started
+
+
+def _scheduler_loop():
+    lock_file = open(os.path.join(job_root(), "scheduler.lock"), "w")
+    leader = False
+    while True:
+        try:
+            if not leader:
+                # Only one server process schedules a job root at a time; the others keep trying
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    leader = True
+                except BlockingIOError:
+                    pass
+            if leader:
+                with closing(_connect()) as conn, conn:
+                    _reconcile_running(conn)
+                    _admit_queued(conn)
+        except Exception as e:
+            print(f"bcl2fastq scheduler error: {e}", file=sys.stderr)
+        time.sleep(SCHEDULER_POLL_SECONDS)
+
+
+def ensure_scheduler():
+    """
+    Starts the scheduler thread of this server process if it is not running yet.
+    """
+    global _scheduler_thread
+    with _scheduler_lock:
+        if _scheduler_thread is None or not _scheduler_thread.is_alive():
+            _scheduler_thread = threading.Thread(target=_scheduler_loop, name="bcl2fastq-scheduler", daemon=True)
+            _scheduler_thread.start()
+
+
+def _pump_output(index, process, lines):
+    for line in process.stdout:
+        lines.put((index, line))
+    lines.put((index, None))
+
+
+def _terminate(processes):
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+
+
+def _write_exit_code(job_dir, returncode):
+    temp_path = os.path.join(job_dir, "exit_code.tmp")
+    with open(temp_path, "w") as f:
+        f.write(str(returncode))
+    os.replace(temp_path, os.path.join(job_dir, "exit_code"))
+
+
+def _run_job(job_dir):
+    """
+    Runner process: executes the job command (or its lane shards side by side),
+    streams their output line by line into the rotating job log and records the
+    exit code for the scheduler. The exit code is written whatever fails, so
+    the scheduler never mistakes a crashed runner for a vanished process.
+    """
+    with open(os.path.join(job_dir, "job.json")) as f:
+        spec = json.load(f)
+    shards = spec.get("shards") or [{"label": None, "command": spec["command"]}]
+    log = RotatingLog(os.path.join(job_dir, LOG_NAME))
+    tracker = ProgressTracker(job_dir, spec["input_dir"], spec["output_dir"], parts=len(shards))
+    finished = threading.Event()
+
+    def _progress_timer():
+        while not finished.wait(PROGRESS_WRITE_SECONDS):
+            tracker.maybe_write()
+
+    threading.Thread(target=_progress_timer, daemon=True).start()
+    processes = []
+    returncode = 1
+    try:
+        lines = queue.Queue()
+        for index, shard in enumerate(shards):
+            process = subprocess.Popen(shard["command"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            processes.append(process)
+            threading.Thread(target=_pump_output, args=(index, process, lines), daemon=True).start()
+        running = len(processes)
+        failed_returncode = None
+        while running:
+            index, line = lines.get()
+            if line is None:
+                running -= 1
+                if processes[index].wait() != 0 and failed_returncode is None:
+                    # One failed shard fails the job with its exit code; stop the others instead of letting them finish
+                    failed_returncode = processes[index].returncode
+                    _terminate(processes)
+                continue
+            label = shards[index]["label"]
+            log.write_line(f"[{label}] ".encode() + line if label else line)
+            tracker.feed(line)
+        returncode = failed_returncode or 0
+        if returncode == 0 and spec.get("shards"):
+            try:
+                summary = merge_shards(spec["output_dir"], [shard["output_dir"] for shard in shards])
+            except OSError as e:
+                summary = f"Failed to merge the lane shards: {e}"
+                returncode = 1
+            log.write_line(f"{summary}\n".encode())
+    except Exception as e:
+        _terminate(processes)
+        returncode = 127 if isinstance(e, OSError) else 1
+        log.write_line(f"Failed to run bcl2fastq: {e}\n".encode())
+    finally:
+        finished.set()
+        try:
+            tracker.complete = tracker.complete or returncode == 0
+            tracker.maybe_write(force=True)
+        finally:
+            log.close()
+            _write_exit_code(job_dir, returncode)
+    return returncode
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 3 and sys.argv[1] == "--run":
+        sys.exit(_run_job(sys.argv[2]))
+    sys.exit("usage: bcl2fastq_scheduler.py --run JOB_DIR")
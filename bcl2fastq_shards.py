@@ -0,0 +1,90 @@
+import json
+import os
+import shutil
+
+# Shard outputs are written below the job's output directory and removed after the merge
+SHARD_DIR_NAME = "_shards"
+MERGE_BUFFER_BYTES = 16 * 1024 * 1024
+
+
+def shard_output_dir(output_dir, lane):
+    return os.path.join(output_dir, SHARD_DIR_NAME, f"lane{lane}")
+
+
+def shard_threads(threads, shards):
+    """
+    Splits the job's processing threads over its shards, at least one each.
+    """
+    return max(1, threads // max(1, shards))
+
+
+def merge_fastqs(output_dir, shard_dirs):
+    """
+    Concatenates each FASTQ that appears in the shard outputs into the same
+    relative path under output_dir, in shard (lane) order. Concatenated gzip
+    members are a valid gzip file, so nothing is recompressed.
+    Returns the number of merged files.
+    """
+    relative_paths = {}
+    for shard_dir in shard_dirs:
+        for root, _, names in os.walk(shard_dir):
+            for name in names:
+                if name.endswith((".fastq.gz", ".fastq")):
+                    relative = os.path.relpath(os.path.join(root, name), shard_dir)
+                    relative_paths.setdefault(relative, []).append(os.path.join(root, name))
+    for relative, sources in relative_paths.items():
+        target = os.path.join(output_dir, relative)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_path = target + ".tmp"
+        with open(temp_path, "wb") as out:
+            for source in sources:
+                with open(source, "rb") as f:
+                    shutil.copyfileobj(f, out, MERGE_BUFFER_BYTES)
+        os.replace(temp_path, target)
+    return len(relative_paths)
+
+
+def combine_stats_json(output_dir, shard_dirs):
+    """
+    Writes Stats/Stats.json for the whole run from the per-lane shard stats:
+    the lane lists are concatenated, the run fields taken from the first shard.
+    """
+    combined = None
+    for shard_dir in shard_dirs:
+        try:
+            with open(os.path.join(shard_dir, "Stats", "Stats.json")) as f:
+                stats = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if combined is None:
+            combined = {**stats, "ConversionResults": [], "ReadInfosForLanes": [], "UnknownBarcodes": []}
+        for field in ("ConversionResults", "ReadInfosForLanes", "UnknownBarcodes"):
+            combined[field].extend(stats.get(field, []))
+    if combined is None:
+        return False
+    for field in ("ConversionResults", "ReadInfosForLanes", "UnknownBarcodes"):
+        combined[field].sort(key=lambda entry: entry.get("LaneNumber", entry.get("Lane", 0)))
+    stats_dir = os.path.join(output_dir, "Stats")
+    os.makedirs(stats_dir, exist_ok=True)
+    temp_path = os.path.join(stats_dir, "Stats.json.tmp")
+    with open(temp_path, "w") as f:
+        json.dump(combined, f, indent=4)
+    os.replace(temp_path, os.path.join(stats_dir, "Stats.json"))
+    return True
+
+
+def merge_shards(output_dir, shard_dirs):
+    """
+    Merges the shard outputs into output_dir and removes the shard FASTQs.
+    The shard directories keep their reports and remaining stats files.
+    Returns a one-line summary for the job log.
+    """
+    merged = merge_fastqs(output_dir, shard_dirs)
+    stats = combine_stats_json(output_dir, shard_dirs)
+    for shard_dir in shard_dirs:
+        for root, _, names in os.walk(shard_dir):
+            for name in names:
+                if name.endswith((".fastq.gz", ".fastq")):
+                    os.remove(os.path.join(root, name))
+    return f"Merged {merged} FASTQ files from {len(shard_dirs)} lane shards" + \
+        ("" if stats else " (no Stats.json found in the shards)")
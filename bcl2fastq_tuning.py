@@ -0,0 +1,83 @@
+import os
+
+# Network file systems: high latency per read, so more loading/writing threads pay off
+NETWORK_FS_TYPES = ("nfs", "nfs4", "cifs", "smb3", "smbfs", "lustre", "gpfs", "beegfs", "glusterfs", "cephfs", "fuse.sshfs")
+
+# Loading/writing threads per storage type: a share of the thread budget within
+# [min_threads, max_threads]. bcl2fastq's defaults are 4 and 4; spinning disks thrash
+# with more concurrent streams, network storage needs many requests in flight. Threads
+# waiting on network I/O hardly use a core, so they do not reduce the processing threads.
+STORAGE_PROFILES = {
+    "ssd": {"share": 1 / 8, "min_threads": 1, "max_threads": 4, "uses_cores": True},
+    "hdd": {"share": 1 / 16, "min_threads": 1, "max_threads": 2, "uses_cores": True},
+    "network": {"share": 1 / 4, "min_threads": 4, "max_threads": 8, "uses_cores": False},
+}
+
+
+def uses_cores(storage):
+    """
+    Whether loading or writing threads on this storage type occupy a core.
+    """
+    return STORAGE_PROFILES.get(storage, STORAGE_PROFILES["ssd"])["uses_cores"]
+
+
+def _mount_for(path):
+    """
+    Returns (device, fs type) of the mount holding path, from /proc/mounts, or None.
+    """
+    path = os.path.realpath(path)
+    best = None
+    try:
+        with open("/proc/mounts") as f:
+            for line in f:
+                device, mount_point, fs_type = line.split()[:3]
+                mount_point = mount_point.replace("\\040", " ")
+                if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and \
+                        (best is None or len(mount_point) > len(best[0])):
+                    best = (mount_point, device, fs_type)
+    except OSError:
+        return None
+    return best[1:] if best else None
+
+
+def storage_type(path):
+    """
+    'network', 'hdd' or 'ssd' for the storage holding path. Local devices are
+    classified by /sys/class/block/<dev>/queue/rotational; unknown means 'ssd'.
+    """
+    mount = _mount_for(path)
+    if mount is None:
+        return "ssd"
+    device, fs_type = mount
+    if fs_type in NETWORK_FS_TYPES or ":" in device or device.startswith("//"):
+        return "network"
+    name = os.path.basename(os.path.realpath(device))
+    for candidate in (name, os.path.basename(os.path.dirname(os.path.realpath(f"/sys/class/block/{name}")))):
+        try:
+            with open(f"/sys/class/block/{candidate}/queue/rotational") as f:
+                return "hdd" if f.read().strip() == "1" else "ssd"
+        except OSError:
+            continue
+    return "ssd"
+
+
+def tune_threads(cores, input_storage="ssd", output_storage="ssd", concurrent_jobs=0, samples=None):
+    """
+    Loading/processing/writing thread counts for one job: the cores are shared
+    with the jobs already running or queued, loading threads are sized for the
+    input storage and writing threads for the output storage (never more than
+    there are samples to write), the rest goes to processing. Lane-sharded jobs
+    split these counts over their shards when the commands are built.
+    """
+    budget = max(1, cores // (concurrent_jobs + 1))
+    processing = budget
+    counts = {}
+    for stage, storage in (("loading", input_storage), ("writing", output_storage)):
+        profile = STORAGE_PROFILES.get(storage, STORAGE_PROFILES["ssd"])
+        counts[stage] = min(profile["max_threads"], max(profile["min_threads"], round(budget * profile["share"])))
+        if stage == "writing" and samples:
+            counts[stage] = min(counts[stage], samples)
+        if uses_cores(storage):
+            processing -= counts[stage]
+    return {"loading": counts["loading"], "processing": max(1, processing), "writing": counts["writing"],
+            "budget": budget}
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Stand-in for the bcl2fastq executable, for benchmarking the thread settings
+and exercising the scheduler without a sequencer run.
+
+Accepts the options the app passes to bcl2fastq and runs the same three-stage
+pipeline: loading threads read tiles from simulated storage, processing threads
+burn CPU per tile (hashing, which releases the GIL like bcl2fastq's native
+threads) and writing threads compress and write to simulated storage. Storage
+is modelled by per-request latency and how well it copes with parallel requests.
+
+Point the app at it with BCL2FASTQ_BIN=benchmarks/bcl2fastq_stub.py.
+
+Environment:
+    STUB_TILES              tiles per lane (default 24)
+    STUB_CPU_MB             MB hashed per tile (default 16)
+    STUB_INPUT_STORAGE      ssd, hdd or network (default ssd)
+    STUB_OUTPUT_STORAGE     ssd, hdd or network (default: input storage)
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import queue
+import sys
+import threading
+import time
+import zlib
+
+# latency per request (s), requests served in parallel, extra latency per additional waiting request
+STORAGE = {
+    "ssd": {"latency": 0.002, "parallel": 8, "contention": 0.0},
+    "hdd": {"latency": 0.012, "parallel": 1, "contention": 0.004},
+    "network": {"latency": 0.040, "parallel": 16, "contention": 0.0},
+}
+_BUFFER = bytes(range(256)) * 4096
+
+
+class Storage:
+    def __init__(self, kind):
+        self.profile = STORAGE[kind]
+        self.slots = threading.Semaphore(self.profile["parallel"])
+        self.waiting = 0
+        self.lock = threading.Lock()
+
+    def request(self):
+        with self.lock:
+            self.waiting += 1
+            # Seeks between many interleaved streams make every request slower
+            delay = self.profile["latency"] + self.profile["contention"] * (self.waiting - 1)
+        with self.slots:
+            time.sleep(delay)
+        with self.lock:
+            self.waiting -= 1
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input-dir", "-R", required=True)
+    parser.add_argument("--output-dir", "-o", required=True)
+    parser.add_argument("--sample-sheet")
+    parser.add_argument("--loading-threads", "-r", type=int, default=4)
+    parser.add_argument("--processing-threads", "-p", type=int, default=os.cpu_count())
+    parser.add_argument("--writing-threads", "-w", type=int, default=4)
+    parser.add_argument("--tiles")
+    parser.add_argument("--no-lane-splitting", action="store_true")
+    parser.add_argument("--use-bases-mask")
+    parser.add_argument("--barcode-mismatches")
+    args = parser.parse_args()
+
+    tiles = int(os.environ.get("STUB_TILES", 24))
+    cpu_bytes = int(float(os.environ.get("STUB_CPU_MB", 16)) * 1024 * 1024)
+    input_kind = os.environ.get("STUB_INPUT_STORAGE", "ssd")
+    input_storage = Storage(input_kind)
+    output_storage = Storage(os.environ.get("STUB_OUTPUT_STORAGE", input_kind))
+    lanes = [int(args.tiles.split("_")[1])] if args.tiles else [1]
+    work = [(lane, 1101 + tile) for lane in lanes for tile in range(tiles)]
+
+    loaded, processed = queue.Queue(maxsize=16), queue.Queue(maxsize=16)
+    to_load = queue.Queue()
+    for item in work:
+        to_load.put(item)
+    print(f"bcl2fastq stub: {len(work)} tiles, threads r={args.loading_threads} "
+          f"p={args.processing_threads} w={args.writing_threads}", flush=True)
+
+    def load():
+        while True:
+            try:
+                item = to_load.get_nowait()
+            except queue.Empty:
+                return
+            for _ in range(4):
+                input_storage.request()
+            loaded.put(item)
+
+    def process():
+        while True:
+            item = loaded.get()
+            if item is None:
+                return
+            digest = hashlib.sha256()
+            for _ in range(max(1, cpu_bytes // len(_BUFFER))):
+                digest.update(_BUFFER)
+            processed.put(item)
+
+    def write():
+        while True:
+            item = processed.get()
+            if item is None:
+                return
+            zlib.compress(_BUFFER, 1)
+            for _ in range(2):
+                output_storage.request()
+            print(f"INFO: Finished processing lane {item[0]} tile {item[1]}", flush=True)
+
+    stages = []
+    for target, count in ((load, args.loading_threads), (process, args.processing_threads), (write, args.writing_threads)):
+        threads = [threading.Thread(target=target, daemon=True) for _ in range(max(1, count))]
+        for thread in threads:
+            thread.start()
+        stages.append(threads)
+    for handoff, (threads, downstream) in zip((loaded, processed), ((stages[0], stages[1]), (stages[1], stages[2]))):
+        for thread in threads:
+            thread.join()
+        for _ in downstream:
+            handoff.put(None)
+    for thread in stages[2]:
+        thread.join()
+
+    sample_dir = os.path.join(args.output_dir, "Stub")
+    os.makedirs(sample_dir, exist_ok=True)
+    os.makedirs(os.path.join(args.output_dir, "Stats"), exist_ok=True)
+    for read in ("R1", "R2"):
+        with gzip.open(os.path.join(sample_dir, f"Stub_S1_{read}_001.fastq.gz"), "wt") as f:
+            for lane, tile in work:
+                f.write(f"@STUB:1:FC:{lane}:{tile}:1:1 1:N:0:ACGTACGT\nACGT\n+\nFFFF\n")
+    with open(os.path.join(args.output_dir, "Stats", "Stats.json"), "w") as f:
+        json.dump({"Flowcell": "STUB", "ConversionResults": [
+            {"LaneNumber": lane, "DemuxResults": [{"SampleId": "Stub", "SampleName": "Stub", "NumberReads": tiles}]}
+            for lane in lanes
+        ]}, f)
+    print("Processing completed with 0 errors and 0 warnings.", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
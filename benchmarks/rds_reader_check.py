@@ -0,0 +1,331 @@
+"""
+Checks rds_reader against the small RDS fixtures in benchmarks/rds_fixtures.
+
+Each fixture covers one part of the format: XDR and native streams,
+serialization versions 2 and 3, gzip, bzip2 and xz compression, ALTREP compact
+sequences, wrappers and deferred strings, a factor, a dgCMatrix and an
+ExpressionSet (environment assayData, AnnotatedDataFrame slots, compact
+row.names).
+make_fixtures.R writes them with R. Where R is not installed, --write writes
+streams with the same layout from the small serializer below, which follows
+R's serialize.c. The decoded values must match EXPECTED either way.
+
+Usage:
+    python benchmarks/rds_reader_check.py [--write]
+"""
+import argparse
+import bz2
+import functools
+import gzip
+import lzma
+import os
+import struct
+import sys
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURE_DIR = os.path.join(REPO_DIR, "benchmarks", "rds_fixtures")
+sys.path.insert(0, REPO_DIR)
+
+from rds_reader import (ALTREP_SXP, EMPTYENV_SXP, ENVSXP, INTSXP, LISTSXP, NA_INTEGER, NILVALUE_SXP,  # noqa: E402
+                        REALSXP, REFSXP, S4SXP, STRSXP, SYMSXP, VECSXP, REnvironment, RObject, RSymbol,
+                        read_expression_set, read_rds, sparse_expression_matrix, vector_to_numpy)
+
+# Fixed gzip timestamp, so rewriting the fixtures does not change them
+GZIP = functools.partial(gzip.compress, mtime=0)
+# R's NA_real_: a NaN with payload 1954
+NA_REAL = struct.unpack(">d", bytes.fromhex("7ff00000000007a2"))[0]
+
+EXPECTED = {
+    "int_xdr_v3.rds": {"values": [1, None, 3]},
+    "double_native_v3.rds": {"values": [1.5, None, -2.0]},
+    "factor_xdr_v2.rds": {"values": ["b", "a", None, "b"], "levels": ["a", "b"]},
+    "compact_intseq.rds": {"values": [1, 2, 3, 4, 5]},
+    "wrap_integer.rds": {"values": [3, 1, 2]},
+    "deferred_string.rds": {"values": ["1", "2", "3"]},
+    "dgCMatrix.rds": {
+        "X": [[1.5, 0.0, 2.0, 0.0], [0.0, -1.0, 0.0, 0.0], [0.0, 0.0, 0.0, 4.0]],
+        "features": ["f1", "f2", "f3", "f4"],
+        "samples": ["s1", "s2", "s3"],
+    },
+    "expression_set.rds": {
+        "X": [[1.5, 2.0, None], [4.0, 5.0, 6.0]],
+        "samples": ["1", "2"],
+        "features": ["1", "2", "3"],
+        "sample_meta": {"Class": ["a", "b"], "Survival_in_days": [10.5, 20.0], "Status": [1, None]},
+        "feature_meta": {},
+    },
+}
+
+
+class Altrep:
+    """
+    An ALTREP value to write: class name, type it stands for, and its state.
+    A tuple state is written as a dotted CONS(car, cdr), like R's wrappers.
+    """
+
+    def __init__(self, class_name, sexp_type, state):
+        self.class_name = class_name
+        self.sexp_type = sexp_type
+        self.state = state
+
+
+class Writer:
+    """
+    Minimal R serializer for the fixtures: atomic vectors, lists, S4 objects,
+    symbols and environments (with back references) and ALTREP.
+    """
+
+    def __init__(self, version=3, xdr=True):
+        self.endian = ">" if xdr else "<"
+        self.out = bytearray(b"X\n" if xdr else b"B\n")
+        # Symbols and environments share R's reference table
+        self.refs = {}
+        self.int(version)
+        self.int(0x040301)  # written by R 4.3.1
+        self.int(0x030500 if version == 3 else 0x020300)
+        if version == 3:
+            self.int(5)
+            self.out += b"UTF-8"
+
+    def int(self, value):
+        self.out += struct.pack(f"{self.endian}i", value)
+
+    def flags(self, sexp_type, is_object=False, has_attr=False, has_tag=False, levels=0):
+        self.int(sexp_type | is_object << 8 | has_attr << 9 | has_tag << 10 | levels << 12)
+
+    def charsxp(self, value):
+        if value is None:
+            self.flags(9)
+            self.int(-1)
+            return
+        data = value.encode("utf-8")
+        self.flags(9, levels=64 if data.isascii() else 8)
+        self.int(len(data))
+        self.out += data
+
+    def reference(self, key):
+        """
+        Writes a back reference and returns True if key was written before, else adds it to the table.
+        """
+        if key in self.refs:
+            self.int(self.refs[key] << 8 | REFSXP)
+            return True
+        self.refs[key] = len(self.refs) + 1
+        return False
+
+    def symbol(self, name):
+        if not self.reference(("symbol", name)):
+            self.flags(SYMSXP)
+            self.charsxp(name)
+
+    def environment(self, env):
+        # A locked, hashed environment enclosed by the empty environment, like Biobase's assayData
+        if self.reference(("environment", id(env))):
+            return
+        self.flags(ENVSXP)
+        self.int(1)
+        self.int(EMPTYENV_SXP)
+        self.int(NILVALUE_SXP)  # frame: bindings are in the hash table
+        self.item(RObject(VECSXP, [RObject(LISTSXP, list(env.bindings.items()))]))
+        self.int(NILVALUE_SXP)  # attributes
+
+    def attributes(self, attributes):
+        for name, value in dict(attributes).items():
+            self.flags(LISTSXP, has_tag=True)
+            self.symbol(name)
+            self.item(value)
+        self.int(NILVALUE_SXP)
+
+    def item(self, obj):
+        if obj is None:
+            self.int(NILVALUE_SXP)
+        elif isinstance(obj, RSymbol):
+            self.symbol(str(obj))
+        elif isinstance(obj, Altrep):
+            self.altrep(obj)
+        elif isinstance(obj, REnvironment):
+            self.environment(obj)
+        elif isinstance(obj, tuple):
+            self.flags(LISTSXP)
+            self.item(obj[0])
+            self.item(obj[1])
+        elif obj.type == LISTSXP:
+            self.attributes(obj.value)
+        else:
+            self.vector(obj)
+
+    def vector(self, obj):
+        has_attr = bool(obj.attributes)
+        is_object = "class" in obj.attributes
+        self.flags(obj.type, is_object, has_attr, levels=16 if obj.type == S4SXP else 0)
+        if obj.type == S4SXP:
+            pass
+        elif obj.type in (INTSXP, REALSXP):
+            self.int(len(obj.value))
+            code = "i" if obj.type == INTSXP else "d"
+            self.out += struct.pack(f"{self.endian}{len(obj.value)}{code}", *obj.value)
+        elif obj.type == STRSXP:
+            self.int(len(obj.value))
+            for value in obj.value:
+                self.charsxp(value)
+        elif obj.type == VECSXP:
+            self.int(len(obj.value))
+            for value in obj.value:
+                self.item(value)
+        else:
+            raise ValueError(f"Cannot write SEXP type {obj.type}")
+        if has_attr:
+            self.attributes(obj.attributes)
+
+    def altrep(self, obj):
+        self.flags(ALTREP_SXP)
+        # Class info is the pairlist (class symbol, package symbol, type)
+        self.flags(LISTSXP)
+        self.symbol(obj.class_name)
+        self.flags(LISTSXP)
+        self.symbol("base")
+        self.flags(LISTSXP)
+        self.item(RObject(INTSXP, [obj.sexp_type]))
+        self.int(NILVALUE_SXP)
+        self.item(obj.state)
+        self.int(NILVALUE_SXP)
+
+
+def strings(*values):
+    return RObject(STRSXP, list(values))
+
+
+def compact_intseq(n, start):
+    return Altrep("compact_intseq", INTSXP, RObject(REALSXP, [n, start, 1]))
+
+
+def data_frame(columns, n_rows):
+    """
+    A data.frame with automatic (compact) row.names.
+    """
+    return RObject(VECSXP, list(columns.values()), {
+        "names": strings(*columns),
+        "row.names": RObject(INTSXP, [NA_INTEGER, -n_rows]),
+        "class": strings("data.frame"),
+    })
+
+
+def annotated_data_frame(data, n_rows):
+    return RObject(S4SXP, None, {
+        "varMetadata": data_frame({"labelDescription": strings(*[None] * len(data))}, len(data)),
+        "data": data_frame(data, n_rows),
+        "dimLabels": strings("rowNames", "columnNames"),
+        "class": RObject(STRSXP, ["AnnotatedDataFrame"], {"package": strings("Biobase")}),
+    })
+
+
+def expression_set():
+    """
+    ExpressionSet(m, AnnotatedDataFrame(pheno)) as in make_fixtures.R: a matrix
+    without dimnames, so sample and feature names come from the row.names.
+    """
+    assay_data = REnvironment()
+    assay_data.bindings["exprs"] = RObject(REALSXP, [1.5, 2.0, NA_REAL, 4.0, 5.0, 6.0], {"dim": RObject(INTSXP, [3, 2])})
+    pheno = {
+        "Class": RObject(INTSXP, [1, 2], {"levels": strings("a", "b"), "class": strings("factor")}),
+        "Survival_in_days": RObject(REALSXP, [10.5, 20.0]),
+        "Status": RObject(INTSXP, [1, NA_INTEGER]),
+    }
+    return RObject(S4SXP, None, {
+        "assayData": assay_data,
+        "phenoData": annotated_data_frame(pheno, 2),
+        "featureData": annotated_data_frame({}, 3),
+        "annotation": strings(),
+        "class": RObject(STRSXP, ["ExpressionSet"], {"package": strings("Biobase")}),
+    })
+
+
+def fixture_objects():
+    """
+    The values of make_fixtures.R, with the serialization options R writes them with:
+    name -> (object, version, xdr, compress).
+    """
+    factor = RObject(INTSXP, [2, 1, NA_INTEGER, 2], {"levels": strings("a", "b"), "class": strings("factor")})
+    dgc_matrix = RObject(S4SXP, None, {
+        "i": RObject(INTSXP, [0, 2, 1, 3]),
+        "p": RObject(INTSXP, [0, 2, 3, 4]),
+        "Dim": RObject(INTSXP, [4, 3]),
+        "Dimnames": RObject(VECSXP, [strings("f1", "f2", "f3", "f4"), strings("s1", "s2", "s3")]),
+        "x": RObject(REALSXP, [1.5, 2.0, -1.0, 4.0]),
+        "factors": RObject(VECSXP, []),
+        "class": RObject(STRSXP, ["dgCMatrix"], {"package": strings("Matrix")}),
+    })
+    return {
+        "int_xdr_v3.rds": (RObject(INTSXP, [1, NA_INTEGER, 3]), 3, True, GZIP),
+        "double_native_v3.rds": (RObject(REALSXP, [1.5, NA_REAL, -2.0]), 3, False, bz2.compress),
+        "factor_xdr_v2.rds": (factor, 2, True, lzma.compress),
+        "compact_intseq.rds": (compact_intseq(5, 1), 3, True, GZIP),
+        "wrap_integer.rds": (Altrep("wrap_integer", INTSXP, (RObject(INTSXP, [3, 1, 2]), RObject(INTSXP, [0, 0]))),
+                             3, True, GZIP),
+        "deferred_string.rds": (Altrep("deferred_string", STRSXP, (compact_intseq(3, 1), RObject(INTSXP, [0]))),
+                                3, True, GZIP),
+        "dgCMatrix.rds": (dgc_matrix, 3, True, GZIP),
+        "expression_set.rds": (expression_set(), 3, True, GZIP),
+    }
+
+
+def write_fixtures():
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    for name, (obj, version, xdr, compress) in fixture_objects().items():
+        writer = Writer(version, xdr)
+        writer.item(obj)
+        with open(os.path.join(FIXTURE_DIR, name), "wb") as f:
+            f.write(compress(bytes(writer.out)))
+
+
+def as_list(values):
+    return [None if pd.isna(value) else value for value in np.asarray(values, dtype=object)]
+
+
+def decoded(path):
+    """
+    The decoded fixture in the form of EXPECTED.
+    """
+    obj = read_rds(path)
+    if "ExpressionSet" in obj.classes:
+        eset = read_expression_set(path)
+        return {
+            "X": [as_list(row) for row in eset["X"]],
+            "samples": eset["samples"],
+            "features": eset["features"],
+            "sample_meta": {column: as_list(values) for column, values in eset["sample_meta"].items()},
+            "feature_meta": {column: as_list(values) for column, values in eset["feature_meta"].items()},
+        }
+    if "dgCMatrix" in obj.classes:
+        X, features, samples = sparse_expression_matrix(obj)
+        return {"X": X.toarray().tolist(), "features": features, "samples": samples}
+    values = vector_to_numpy(obj)
+    result = {"values": as_list(values)}
+    if isinstance(values, pd.Categorical):
+        result["levels"] = list(values.categories)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--write", action="store_true", help="rewrite the fixtures without R before checking")
+    args = parser.parse_args()
+    if args.write:
+        write_fixtures()
+    failures = 0
+    for name, expected in EXPECTED.items():
+        try:
+            actual = decoded(os.path.join(FIXTURE_DIR, name))
+        except Exception as e:
+            actual = f"{type(e).__name__}: {e}"
+        ok = actual == expected
+        failures += not ok
+        print(f"{'ok' if ok else 'FAIL':4}  {name}" + ("" if ok else f"\n      expected {expected}\n      got      {actual}"))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
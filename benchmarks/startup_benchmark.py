@@ -0,0 +1,72 @@
+"""
+Measures time-to-first-paint for each page of the launcher.
+
+Every page is run once in a fresh interpreter (cold start, including imports)
+and then again in the same process (warm rerun) with streamlit's AppTest
+harness. The first script run without any inputs is what a user sees when
+opening the page.
+
+Usage:
+    python benchmarks/startup_benchmark.py [--repeat 3] [--timeout 60]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PAGES = {
+    "SafeSeq combine": "first_step_process_streamlit_pord_v2.py",
+    "SafeSeq processor": "second_step_process_streamlit_prod_v3.py",
+    "BCL2FASTQ": "streamlit_bcl2fastq.py",
+    "BCL2FASTQ jobs": "streamlit_bcl2fastq_jobs.py",
+    "ExpressionSet viewer": "streamlit_review_robj_v2.py",
+}
+
+
+def time_page(script, timeout):
+    """Runs one page in this process and returns (cold_seconds, warm_seconds, n_exceptions)."""
+    start = time.perf_counter()
+    from streamlit.testing.v1 import AppTest
+    at = AppTest.from_file(os.path.join(REPO_DIR, script), default_timeout=timeout)
+    at.run()
+    cold = time.perf_counter() - start
+    start = time.perf_counter()
+    at.run()
+    warm = time.perf_counter() - start
+    return cold, warm, len(at.exception)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="cold starts per page")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds allowed per script run")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        cold, warm, errors = time_page(args.child, args.timeout)
+        print(json.dumps({"cold": cold, "warm": warm, "errors": errors}))
+        return
+
+    print(f"{'Page':<24}{'cold median (s)':>16}{'cold max (s)':>14}{'warm (s)':>10}{'errors':>8}")
+    for title, script in PAGES.items():
+        results = []
+        for _ in range(args.repeat):
+            out = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--child", script, "--timeout", str(args.timeout)],
+                cwd=REPO_DIR, capture_output=True, text=True, check=True
+            )
+            results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        cold = [r["cold"] for r in results]
+        warm = statistics.median(r["warm"] for r in results)
+        errors = max(r["errors"] for r in results)
+        print(f"{title:<24}{statistics.median(cold):>16.3f}{max(cold):>14.3f}{warm:>10.3f}{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
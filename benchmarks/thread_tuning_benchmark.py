@@ -0,0 +1,100 @@
+"""
+Measures bcl2fastq thread settings against the stand-in executable.
+
+For each storage scenario the stub is run with bcl2fastq's default settings
+(4 loading, all cores processing, 4 writing threads), with the auto-tuned
+settings from bcl2fastq_tuning and with a small grid of loading/writing
+splits of the same thread budget. Commands are built by the scheduler, so the
+thread options the app would pass are what gets measured.
+
+With --check the run fails if the median of the auto-tuned setting is more
+than --tolerance (relative) plus --slack (seconds) slower than the best grid
+setting in any scenario, which makes the tuning logic regression-testable
+without a sequencer run. Single runs of the small stub are too noisy for that,
+so --check needs --repeat 3 or more.
+
+Usage:
+    python benchmarks/thread_tuning_benchmark.py [--cores 16] [--storage ssd hdd network]
+        [--concurrent-jobs 0] [--repeat 1] [--check] [--tolerance 0.25] [--slack 0.1]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUB = os.path.join(REPO_DIR, "benchmarks", "bcl2fastq_stub.py")
+sys.path.insert(0, REPO_DIR)
+
+import bcl2fastq_scheduler as scheduler  # noqa: E402
+from bcl2fastq_tuning import tune_threads  # noqa: E402
+
+
+def run_stub(work_dir, storage, loading, processing, writing):
+    """Runs the stub once through the scheduler's command builder and returns the wall time."""
+    job = {
+        "input_dir": work_dir,
+        "output_dir": os.path.join(work_dir, "out"),
+        "job_dir": work_dir,
+        "threads": processing,
+        "options": {"loading_threads": loading, "writing_threads": writing},
+    }
+    env = {**os.environ, "STUB_INPUT_STORAGE": storage, "STUB_OUTPUT_STORAGE": storage}
+    # The executable the scheduler would call is replaced by the stub
+    command = [sys.executable, STUB] + scheduler.build_bcl2fastq_command(job)[1:]
+    start = time.perf_counter()
+    subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def configurations(cores, storage, concurrent_jobs):
+    tuned = tune_threads(cores, storage, storage, concurrent_jobs)
+    budget = tuned["budget"]
+    configs = {
+        "bcl2fastq defaults": (4, budget, 4),
+        "auto-tuned": (tuned["loading"], tuned["processing"], tuned["writing"]),
+    }
+    for loading in (1, 2, 4, 8):
+        for writing in (1, 2, 4, 8):
+            if loading + writing < budget:
+                configs.setdefault(f"grid r={loading} w={writing}", (loading, budget - loading - writing, writing))
+    return configs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cores", type=int, default=scheduler.available_cores())
+    parser.add_argument("--storage", nargs="+", default=["ssd", "hdd", "network"])
+    parser.add_argument("--concurrent-jobs", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=1, help="runs per setting (median is reported)")
+    parser.add_argument("--check", action="store_true", help="fail if auto-tuning is clearly worse than the best setting")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--slack", type=float, default=0.1, help="seconds allowed on top of --tolerance")
+    args = parser.parse_args()
+    if args.check and args.repeat < 3:
+        parser.error("--check needs --repeat 3 or more to compare medians")
+
+    failures = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        with open(os.path.join(work_dir, "SampleSheet.csv"), "w") as f:
+            f.write("[Header]\n[Data]\nSample_ID,Sample_Name,index\nStub,Stub,ACGTACGT\n")
+        for storage in args.storage:
+            print(f"\n{storage} storage, {args.cores} cores, {args.concurrent_jobs} other jobs")
+            print(f"{'Setting':<24}{'r/p/w':>12}{'median (s)':>12}")
+            results = {}
+            for name, (loading, processing, writing) in configurations(args.cores, storage, args.concurrent_jobs).items():
+                times = [run_stub(work_dir, storage, loading, processing, writing) for _ in range(args.repeat)]
+                results[name] = statistics.median(times)
+                print(f"{name:<24}{f'{loading}/{processing}/{writing}':>12}{results[name]:>12.2f}")
+            best = min(results.values())
+            if results["auto-tuned"] > best * (1 + args.tolerance) + args.slack:
+                failures.append(f"{storage}: auto-tuned {results['auto-tuned']:.2f}s vs best {best:.2f}s")
+    if args.check and failures:
+        sys.exit("Auto-tuning regression:\n" + "\n".join(failures))
+
+
+if __name__ == "__main__":
+    main()
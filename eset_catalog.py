@@ -0,0 +1,187 @@
+"""
+Catalog of ExpressionSet RDS files: files are ingested into the extraction
+cache (one pool job per file) and summarized into an index, so datasets can
+be compared without reading their matrices again.
+"""
+import fcntl
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from eset_dataset import event_indicator
+from eset_loader import _read_names, _read_table, cache_root, extract, file_digest
+
+CATALOG_INDEX = "catalog_index.json"
+FEATURE_HASH_DIR = "catalog_features"
+
+
+def index_path():
+    return os.path.join(cache_root(), CATALOG_INDEX)
+
+
+def load_index():
+    """
+    Index entries by absolute RDS path.
+    """
+    try:
+        with open(index_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_index(index):
+    tmp_path = f"{index_path()}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, index_path())
+
+
+def update_index(entries):
+    """
+    Adds entries to the index under a file lock, so sessions ingesting at the
+    same time do not drop each other's entries. Returns the updated index.
+    """
+    with open(f"{index_path()}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        index = load_index()
+        index.update(entries)
+        save_index(index)
+    return index
+
+
+def scan_rds_files(directory):
+    """
+    RDS files under directory (recursively), sorted.
+    """
+    paths = []
+    for root, _, files in os.walk(directory):
+        paths.extend(os.path.join(root, name) for name in files if name.lower().endswith(".rds"))
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+def is_current(entry, path):
+    """
+    True if the index entry was made from the file as it is now and its
+    feature hashes are still on disk.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return entry is not None and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size \
+        and os.path.exists(feature_hash_path(entry["digest"]))
+
+
+def feature_hashes(features):
+    """
+    Sorted unique 64-bit hashes of feature names; overlaps are computed on these.
+    """
+    return np.unique(pd.util.hash_array(np.asarray(features, dtype=object)))
+
+
+def feature_hash_path(digest):
+    directory = os.path.join(cache_root(), FEATURE_HASH_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, f"{digest}.npy")
+
+
+def summarize(path, digest, directory):
+    """
+    Index entry of one extraction: shape, class balance and survival availability.
+    """
+    with open(os.path.join(directory, "basic_info.json")) as f:
+        basic_info = json.load(f)
+    sample_meta = _read_table(directory, "sample_metadata")
+    if sample_meta is None:
+        sample_meta = pd.DataFrame()
+    entry = {
+        "name": os.path.splitext(os.path.basename(path))[0],
+        "digest": digest,
+        "num_samples": basic_info["num_samples"],
+        "num_features": basic_info["num_features"],
+        "matrix_format": basic_info.get("matrix_format", "dense"),
+        "nnz": basic_info.get("nnz"),
+        "class_counts": None,
+        "has_survival": False,
+        "events": None,
+        "median_survival_days": None,
+        "num_groups": int(sample_meta["Group"].nunique()) if "Group" in sample_meta else None,
+    }
+    if "Class" in sample_meta:
+        counts = sample_meta["Class"].astype(str).value_counts()
+        entry["class_counts"] = {str(label): int(count) for label, count in counts.items()}
+    if {"Status", "Survival_in_days"} <= set(sample_meta.columns):
+        entry["has_survival"] = True
+        entry["events"] = int(event_indicator(sample_meta["Status"]).sum())
+        median = pd.to_numeric(sample_meta["Survival_in_days"], errors="coerce").median()
+        entry["median_survival_days"] = None if pd.isna(median) else float(median)
+    return entry
+
+
+def ingest_rds(path, mtime_ns=None, refresh=None):
+    """
+    Pool job: extracts one RDS file into the cache (a no-op if its content was
+    seen before), stores its feature name hashes and returns its index entry.
+    mtime_ns and refresh only make the job id change: when the file changes,
+    and when an entry is rebuilt for an unchanged file (its hashes were removed).
+    """
+    stat = os.stat(path)
+    digest = file_digest(path)
+    directory = extract(digest, rds_path=path)
+    np.save(feature_hash_path(digest), feature_hashes(_read_names(directory, "feature_names.txt")))
+    entry = summarize(path, digest, directory)
+    entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+    return entry
+
+
+def dataset_labels(entries, directory):
+    """
+    Display name of every entry: its path relative to the scanned directory,
+    since files in different subdirectories can share a name.
+    """
+    return {path: os.path.relpath(path, directory) for path in entries}
+
+
+def catalog_table(entries, directory):
+    """
+    One row per dataset for the comparison view, from index entries only.
+    """
+    labels = dataset_labels(entries, directory)
+    rows = []
+    for path, entry in entries.items():
+        counts = entry["class_counts"] or {}
+        total = sum(counts.values())
+        rows.append({
+            "Dataset": labels[path],
+            "Samples": entry["num_samples"],
+            "Features": entry["num_features"],
+            "Format": entry["matrix_format"],
+            "Classes": ", ".join(f"{label}: {count}" for label, count in counts.items()) or None,
+            "Minority class share": min(counts.values()) / total if total else None,
+            "Survival": entry["has_survival"],
+            "Events": entry["events"],
+            "Median survival (days)": entry["median_survival_days"],
+            "Groups": entry["num_groups"],
+            "Path": path,
+        })
+    return pd.DataFrame(rows)
+
+
+def feature_overlap(entries, directory):
+    """
+    Pairwise shared feature counts between datasets, and the number of
+    features present in all of them, from the stored feature hashes.
+    """
+    names = list(dataset_labels(entries, directory).values())
+    hashes = [np.load(feature_hash_path(entry["digest"])) for entry in entries.values()]
+    shared = np.zeros((len(hashes), len(hashes)), dtype=int)
+    for i in range(len(hashes)):
+        for j in range(i, len(hashes)):
+            shared[i, j] = shared[j, i] = len(np.intersect1d(hashes[i], hashes[j], assume_unique=True))
+    common = hashes[0] if hashes else np.array([], dtype=np.uint64)
+    for values in hashes[1:]:
+        common = np.intersect1d(common, values, assume_unique=True)
+    return pd.DataFrame(shared, index=names, columns=names), len(common)
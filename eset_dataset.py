@@ -0,0 +1,194 @@
+"""
+Model-ready arrays from an ExpressionSet RDS file:
+
+    from eset_dataset import load_dataset
+    data = load_dataset("brca.rds", analysis="surv")
+    data["X"], data["y"], data["groups"], data["sample_weights"]
+
+Extractions are cached by file hash (see eset_loader), and the arrays can be
+saved as an .npz bundle that loads without pickling or R.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from eset_loader import extract, file_digest, is_sparse, load_expression_set
+
+ANALYSES = ("clf", "surv")
+# Same field layout as sksurv.util.Surv, so y can be passed to scikit-survival as is
+SURV_DTYPE = [("Status", "?"), ("Survival_in_days", "<f8")]
+# Group of samples whose Group is missing
+MISSING_GROUP = "NA"
+# Part of the bundle file name, so bundles written with older contents are not served
+BUNDLE_VERSION = 2
+
+
+def encode_labels(values):
+    """
+    Integer codes for class labels (already-integer labels are kept) and the label of each code.
+    """
+    values = pd.Series(values)
+    if pd.api.types.is_integer_dtype(values) and not values.isna().any():
+        return values.to_numpy(dtype=int), np.unique(values.to_numpy())
+    codes, labels = pd.factorize(values, sort=True)
+    return codes, np.asarray(labels)
+
+
+def event_indicator(status):
+    """
+    Status as booleans: 1/TRUE is an event, 0/FALSE and missing values are censored.
+    """
+    return (pd.to_numeric(status, errors="coerce") == 1).fillna(False).to_numpy(dtype=bool)
+
+
+def survival_target(sample_meta):
+    y = np.empty(len(sample_meta), dtype=SURV_DTYPE)
+    y["Status"] = event_indicator(sample_meta["Status"])
+    y["Survival_in_days"] = sample_meta["Survival_in_days"].to_numpy(dtype=float)
+    return y
+
+
+def sample_groups(group_column):
+    """
+    Group labels as an array. Missing groups become MISSING_GROUP, and all
+    labels become strings then, so np.unique can sort them.
+    """
+    missing = group_column.isna()
+    if not missing.any():
+        return group_column.to_numpy(), 0
+    return group_column.astype(str).where(~missing, MISSING_GROUP).to_numpy(dtype=object), int(missing.sum())
+
+
+def _select_samples(X, samples, sample_meta, keep):
+    rows = np.flatnonzero(keep)
+    X = X[rows] if is_sparse(X) else X.iloc[rows]
+    return X, samples[rows], sample_meta.iloc[rows]
+
+
+def group_sample_weights(groups):
+    """
+    Weights that give every group the same total weight as the largest group.
+    """
+    _, group_indices, group_counts = np.unique(groups, return_inverse=True, return_counts=True)
+    return (group_counts.max() / group_counts)[group_indices]
+
+
+def model_inputs(eset, analysis="clf"):
+    """
+    X, y, groups, group_weights and sample_weights from a loaded extraction.
+    y is integer class codes for 'clf' and a (Status, Survival_in_days)
+    structured array for 'surv'. X is a DataFrame, or a scipy CSR matrix for
+    sparse datasets, with its labels in samples and features. For 'clf',
+    samples without a Class are left out (counted in dropped_samples); samples
+    without a Group form the MISSING_GROUP group (counted in missing_groups).
+    """
+    if analysis not in ANALYSES:
+        raise ValueError(f"analysis must be one of {ANALYSES}")
+    sample_meta = eset["sample_meta"] if eset["sample_meta"] is not None else pd.DataFrame(index=eset["samples"])
+    X, samples = eset["X"], eset["samples"]
+    class_labels = None
+    dropped_samples = missing_groups = 0
+    if analysis == "clf" and "Class" in sample_meta:
+        labelled = sample_meta["Class"].notna().to_numpy()
+        dropped_samples = int((~labelled).sum())
+        if dropped_samples:
+            X, samples, sample_meta = _select_samples(X, samples, sample_meta, labelled)
+    if analysis == "surv":
+        if eset["survival_data"] is None:
+            raise ValueError("Sample metadata has no Status and Survival_in_days columns")
+        y = survival_target(sample_meta)
+    elif "Class" in sample_meta:
+        y, class_labels = encode_labels(sample_meta["Class"])
+    else:
+        raise ValueError("Sample metadata has no Class column")
+    groups = group_weights = sample_weights = None
+    if "Group" in sample_meta:
+        groups, missing_groups = sample_groups(sample_meta["Group"])
+        sample_weights = group_sample_weights(groups)
+        if "GroupWeight" in sample_meta:
+            group_weights = sample_meta["GroupWeight"].to_numpy(dtype=float)
+    return {
+        "dataset_name": eset["basic_info"]["dataset_name"],
+        "X": X,
+        "samples": samples,
+        "features": eset["features"],
+        "y": y,
+        "class_labels": class_labels,
+        "groups": groups,
+        "group_weights": group_weights,
+        "sample_weights": sample_weights,
+        "sample_meta": sample_meta,
+        "feature_meta": eset["feature_meta"],
+        "dropped_samples": dropped_samples,
+        "missing_groups": missing_groups,
+    }
+
+
+def load_dataset(rds_path, analysis="clf"):
+    """
+    Model-ready arrays for an ExpressionSet RDS file. The file is only decoded
+    the first time its content is seen.
+    """
+    digest = file_digest(rds_path)
+    eset = load_expression_set(digest, os.path.splitext(os.path.basename(rds_path))[0], rds_path=rds_path)
+    return model_inputs(eset, analysis)
+
+
+def bundle_path(digest, analysis):
+    return os.path.join(extract(digest), f"bundle_{analysis}_v{BUNDLE_VERSION}.npz")
+
+
+def write_bundle(data, path_or_file):
+    """
+    Saves the arrays of model_inputs as a compressed .npz. Strings are stored as fixed-width
+    unicode and y as a structured array, so np.load needs no pickling. A sparse
+    X is stored as its CSR arrays (X_data, X_indices, X_indptr, X_shape).
+    """
+    arrays = {
+        "y": data["y"],
+        "samples": np.asarray(data["samples"], dtype=str),
+        "features": np.asarray(data["features"], dtype=str),
+        "dataset_name": np.asarray(data["dataset_name"]),
+    }
+    if is_sparse(data["X"]):
+        X = data["X"].tocsr()
+        arrays.update(X_data=X.data, X_indices=X.indices, X_indptr=X.indptr, X_shape=np.asarray(X.shape))
+    else:
+        arrays["X"] = np.asarray(data["X"], dtype=np.float64)
+    if data["class_labels"] is not None:
+        arrays["class_labels"] = np.asarray(data["class_labels"]).astype(str)
+    for name in ("groups", "group_weights", "sample_weights"):
+        if data[name] is not None:
+            arrays[name] = data[name] if data[name].dtype != object else data[name].astype(str)
+    np.savez_compressed(path_or_file, **arrays)
+
+
+def bundle_bytes(digest, data, analysis):
+    """
+    The .npz bundle of a dataset, written next to its extraction the first time.
+    It is written straight to disk and only the compressed file is read back.
+    """
+    path = bundle_path(digest, analysis)
+    if not os.path.exists(path):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            write_bundle(data, f)
+        os.replace(tmp_path, path)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def load_bundle(path):
+    """
+    Reads a bundle written by write_bundle back into a dict of arrays; a sparse X comes back as CSR.
+    """
+    with np.load(path) as bundle:
+        data = {name: bundle[name] for name in bundle.files}
+    if "X_data" in data:
+        from scipy.sparse import csr_matrix
+
+        data["X"] = csr_matrix((data.pop("X_data"), data.pop("X_indices"), data.pop("X_indptr")),
+                               shape=tuple(data.pop("X_shape")))
+    data["dataset_name"] = str(data["dataset_name"])
+    return data
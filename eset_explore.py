@@ -0,0 +1,93 @@
+import numpy as np
+import pandas as pd
+
+# scipy is imported inside clustered_heatmap so loading the viewer does not pay for it
+
+
+def variance_ranked_features(stats, n_features):
+    """
+    Positions of the n_features features with the largest standard deviation,
+    skipping constant and all-missing ones.
+    """
+    std = stats["std"].to_numpy()
+    candidates = np.flatnonzero(np.nan_to_num(std) > 0)
+    n_features = min(n_features, len(candidates))
+    top = candidates[np.argpartition(-std[candidates], n_features - 1)[:n_features]] if n_features else candidates
+    return np.sort(top)
+
+
+def _centered(values):
+    """
+    Columns centered on their mean, with missing values set to the mean (0 after centering).
+    """
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        values = values - np.nanmean(values, axis=0)
+    return np.nan_to_num(values, copy=False)
+
+
+def randomized_pca(values, n_components=2, oversamples=10, n_iter=4, seed=0):
+    """
+    Principal component scores of a samples x features matrix by randomized
+    truncated SVD (Halko, Martinsson & Tropp): project onto a random subspace,
+    sharpen it with a few power iterations and take the exact SVD of the small
+    projected matrix. Returns (scores, explained variance ratio per component).
+    """
+    A = _centered(values)
+    n_samples = A.shape[0]
+    rank = min(n_components + oversamples, *A.shape)
+    rng = np.random.default_rng(seed)
+    Q, _ = np.linalg.qr(A @ rng.standard_normal((A.shape[1], rank)))
+    for _ in range(n_iter):
+        Q, _ = np.linalg.qr(A.T @ Q)
+        Q, _ = np.linalg.qr(A @ Q)
+    U, S, _ = np.linalg.svd(Q.T @ A, full_matrices=False)
+    U = (Q @ U)[:, :n_components]
+    S = S[:n_components]
+    # Deterministic signs: the largest loading of each component is positive
+    signs = np.sign(U[np.abs(U).argmax(axis=0), np.arange(U.shape[1])])
+    U *= np.where(signs == 0, 1, signs)
+    total_variance = (A * A).sum()
+    explained = S ** 2 / total_variance if total_variance > 0 else np.zeros_like(S)
+    return U * S, explained
+
+
+def store_pca(store, n_features=2000, n_components=10, seed=0):
+    """
+    PCA of the samples on the n_features most variable features of an
+    ExpressionStore. Returns (scores DataFrame indexed by sample, explained
+    variance ratios, number of features used).
+    """
+    features = variance_ranked_features(store.feature_stats(), n_features)
+    n_components = min(n_components, len(features), store.shape[0])
+    if n_components < 1:
+        return pd.DataFrame(index=store.samples), np.array([]), len(features)
+    scores, explained = randomized_pca(store.columns(features), n_components, seed=seed)
+    columns = [f"PC{i + 1}" for i in range(n_components)]
+    return pd.DataFrame(scores, index=store.samples, columns=columns), explained, len(features)
+
+
+def _leaf_order(values):
+    from scipy.cluster.hierarchy import leaves_list, linkage
+
+    if len(values) < 3:
+        return np.arange(len(values))
+    return leaves_list(linkage(values, method="average", metric="euclidean"))
+
+
+def clustered_heatmap(store, n_features=50, n_samples=100, seed=0):
+    """
+    z-scored values of the most variable features on a random sample of
+    samples, with rows and columns in hierarchical clustering order. Both
+    dimensions are bounded so clustering stays interactive on any cohort.
+    """
+    features = variance_ranked_features(store.feature_stats(), n_features)
+    rng = np.random.default_rng(seed)
+    rows = np.sort(rng.choice(store.shape[0], min(n_samples, store.shape[0]), replace=False))
+    values = _centered(store.columns(features, rows))
+    std = values.std(axis=0)
+    values /= np.where(std > 0, std, 1)
+    row_order = _leaf_order(values)
+    column_order = _leaf_order(values.T)
+    return pd.DataFrame(values[row_order][:, column_order], index=store.samples[rows][row_order],
+                        columns=store.features[features][column_order])
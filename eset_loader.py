@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from r_worker import RWorkerError, get_worker
+from rds_reader import RDSError, read_expression_set
+
+# Extractions are kept here per RDS content hash, so a file is only decoded once
+ESET_CACHE_ENV = "ESET_CACHE_DIR"
+DEFAULT_ESET_CACHE = os.path.expanduser("~/.eset_cache")
+EXTRACTION_VERSION = 3
+# Matrices with at most this share of nonzero values are stored sparse (CSR)
+SPARSE_DENSITY = 0.3
+
+
+def cache_root():
+    root = os.environ.get(ESET_CACHE_ENV, DEFAULT_ESET_CACHE)
+    os.makedirs(root, exist_ok=True)
+    return root
+
+
+def content_digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def file_digest(path, chunk_size=8 * 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def extraction_dir(digest):
+    return os.path.join(cache_root(), f"{digest}.v{EXTRACTION_VERSION}")
+
+
+def extract(digest, data=None, rds_path=None):
+    """
+    Returns the directory holding the extraction of an RDS file, decoding it
+    only if this content has not been extracted before. The RDS is given
+    either as bytes or as a path. It is read in Python first; the R worker is
+    only started for files the Python reader cannot decode.
+    """
+    target = extraction_dir(digest)
+    if os.path.exists(os.path.join(target, "basic_info.json")):
+        return target
+    work_dir = tempfile.mkdtemp(prefix=".extract_", dir=cache_root())
+    try:
+        try:
+            write_extraction(read_expression_set(rds_path if rds_path is not None else data), work_dir)
+        except RDSError as rds_error:
+            if rds_path is None:
+                rds_path = os.path.join(work_dir, "input.rds")
+                with open(rds_path, "wb") as f:
+                    f.write(data)
+            try:
+                get_worker().extract(os.path.abspath(rds_path), work_dir, feather=_has_pyarrow(),
+                                     sparse_density=SPARSE_DENSITY)
+            except RWorkerError as e:
+                # Without R the Python reader's error is usually the one that explains the file
+                raise RWorkerError(f"{e}; the Python reader failed with: {rds_error}") from e
+            if os.path.exists(os.path.join(work_dir, "input.rds")):
+                os.remove(os.path.join(work_dir, "input.rds"))
+        try:
+            os.rename(work_dir, target)
+        except OSError:
+            # Another session finished the same file first
+            if not os.path.exists(os.path.join(target, "basic_info.json")):
+                raise
+            shutil.rmtree(work_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    return target
+
+
+def _has_pyarrow():
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _write_table(df, directory, name, feather):
+    df = df.reset_index(names="row_name")
+    if feather:
+        df.columns = [str(column) for column in df.columns]
+        df.to_feather(os.path.join(directory, f"{name}.feather"))
+    else:
+        df.to_csv(os.path.join(directory, f"{name}.csv"), index=False)
+
+
+def is_sparse(X):
+    from scipy.sparse import issparse
+
+    return issparse(X)
+
+
+def write_extraction(eset, directory):
+    """
+    Writes an ExpressionSet decoded by rds_reader in the same layout as the R
+    worker, so both paths share the cache and the loading code. Mostly-zero
+    matrices are written as CSR arrays (exprs_data, exprs_indices, exprs_indptr).
+    """
+    X = eset["X"]
+    if not is_sparse(X) and X.size and np.count_nonzero(X) <= SPARSE_DENSITY * X.size:
+        from scipy.sparse import csr_matrix
+
+        X = csr_matrix(X)
+    if is_sparse(X):
+        X = X.tocsr()
+        X.sort_indices()
+        X.data.astype("<f8", copy=False).tofile(os.path.join(directory, "exprs_data.f64"))
+        X.indices.astype("<i4", copy=False).tofile(os.path.join(directory, "exprs_indices.i32"))
+        if X.nnz < 2 ** 31:
+            X.indptr.astype("<i4", copy=False).tofile(os.path.join(directory, "exprs_indptr.i32"))
+        else:
+            X.indptr.astype("<i8", copy=False).tofile(os.path.join(directory, "exprs_indptr.i64"))
+    else:
+        X.astype("<f8", copy=False).tofile(os.path.join(directory, "exprs.f64"))
+    for name, values in (("sample_names.txt", eset["samples"]), ("feature_names.txt", eset["features"])):
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as f:
+            f.writelines(f"{value}\n" for value in values)
+    feather = _has_pyarrow()
+    _write_table(eset["sample_meta"], directory, "sample_metadata", feather)
+    _write_table(eset["feature_meta"], directory, "feature_metadata", feather)
+    basic_info = {
+        "num_samples": eset["X"].shape[0],
+        "num_features": eset["X"].shape[1],
+        "metadata_format": "feather" if feather else "csv",
+        "matrix_format": "csr" if is_sparse(X) else "dense",
+    }
+    if is_sparse(X):
+        basic_info["nnz"] = int(X.nnz)
+    with open(os.path.join(directory, "basic_info.json"), "w") as f:
+        json.dump(basic_info, f)
+
+
+def _read_names(directory, name):
+    with open(os.path.join(directory, name), encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def _read_table(directory, name):
+    """
+    Metadata table written as Feather or CSV, indexed by row name.
+    """
+    path = os.path.join(directory, f"{name}.feather")
+    if os.path.exists(path):
+        df = pd.read_feather(path)
+    elif os.path.exists(os.path.join(directory, f"{name}.csv")):
+        df = pd.read_csv(os.path.join(directory, f"{name}.csv"))
+    else:
+        return None
+    return df.set_index("row_name").rename_axis(None)
+
+
+def _memmap(path, dtype, length):
+    if length == 0:
+        return np.zeros(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=(length,))
+
+
+def read_expression_matrix(directory, basic_info=None):
+    """
+    Memory-maps the raw float64 expression matrix (samples x features),
+    read-only. Sparse extractions give a scipy CSR matrix over memory-mapped
+    arrays, so memory use follows the number of nonzeros.
+    """
+    if basic_info is None:
+        with open(os.path.join(directory, "basic_info.json")) as f:
+            basic_info = json.load(f)
+    shape = (basic_info["num_samples"], basic_info["num_features"])
+    if basic_info.get("matrix_format") == "csr":
+        from scipy.sparse import csr_matrix
+
+        nnz = basic_info["nnz"]
+        indptr_path = os.path.join(directory, "exprs_indptr.i64")
+        indptr = _memmap(indptr_path, "<i8", shape[0] + 1) if os.path.exists(indptr_path) else \
+            _memmap(os.path.join(directory, "exprs_indptr.i32"), "<i4", shape[0] + 1)
+        return csr_matrix((_memmap(os.path.join(directory, "exprs_data.f64"), "<f8", nnz),
+                           _memmap(os.path.join(directory, "exprs_indices.i32"), "<i4", nnz), indptr), shape=shape)
+    if 0 in shape:
+        return np.zeros(shape)
+    return np.memmap(os.path.join(directory, "exprs.f64"), dtype="<f8", mode="r", shape=shape)
+
+
+def read_extraction(directory, dataset_name):
+    """
+    Loads an extraction directory into the pieces the viewer shows. The
+    expression matrix is memory-mapped, not read. X is a DataFrame, or a
+    scipy CSR matrix for sparse extractions (samples and features label it).
+    """
+    with open(os.path.join(directory, "basic_info.json")) as f:
+        basic_info = json.load(f)
+    basic_info["dataset_name"] = dataset_name
+    samples = pd.Index(_read_names(directory, "sample_names.txt"))
+    features = pd.Index(_read_names(directory, "feature_names.txt"))
+    X = read_expression_matrix(directory, basic_info)
+    if not is_sparse(X):
+        X = pd.DataFrame(X, index=samples, columns=features, copy=False)
+    sample_meta = _read_table(directory, "sample_metadata")
+    survival_columns = ["Status", "Survival_in_days"]
+    return {
+        "basic_info": basic_info,
+        "X": X,
+        "samples": samples,
+        "features": features,
+        "sample_meta": sample_meta,
+        "feature_meta": _read_table(directory, "feature_metadata"),
+        "classes": sample_meta["Class"].values if sample_meta is not None and "Class" in sample_meta else None,
+        "survival_data": sample_meta[survival_columns]
+        if sample_meta is not None and set(survival_columns) <= set(sample_meta.columns) else None,
+    }
+
+
+def load_expression_set(digest, dataset_name, data=None, rds_path=None):
+    return read_extraction(extract(digest, data, rds_path), dataset_name)
@@ -0,0 +1,120 @@
+import os
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+import streamlit as st
+
+from job_pool import get_executor
+
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Finished exports kept for polling before the oldest are dropped
+MAX_FINISHED_EXPORTS = 64
+
+# One writer queue per server process, shared by every session and page.
+# Its threads only track status; the workbooks themselves are written in the job pool.
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="excel-export")
+_exports = OrderedDict()
+_lock = threading.Lock()
+
+
+def write_workbook_atomic(output_path, sheets):
+    """
+    Writes the (sheet_name, DataFrame) pairs to a temporary file next to
+    output_path and renames it into place once the workbook is complete.
+    """
+    directory = os.path.dirname(os.path.abspath(output_path))
+    fd, temp_path = tempfile.mkstemp(prefix=".export_", suffix=".xlsx", dir=directory)
+    os.close(fd)
+    try:
+        with pd.ExcelWriter(temp_path, engine='openpyxl') as writer:
+            for sheet_name, df in sheets:
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+
+def _run_export(export_id, output_path, sheets):
+    with _lock:
+        _exports[export_id]["status"] = "writing"
+    try:
+        # The openpyxl write is CPU bound, so it runs in the shared worker pool
+        get_executor().submit(write_workbook_atomic, output_path, sheets).result()
+    except Exception as e:
+        with _lock:
+            _exports[export_id].update(status="failed", error=str(e))
+    else:
+        with _lock:
+            _exports[export_id]["status"] = "done"
+
+
+def submit_export(output_path, sheets):
+    """
+    Queues an Excel export and returns its export id immediately.
+    The DataFrames are copied so later edits in the session cannot race the writer.
+    """
+    export_id = uuid.uuid4().hex
+    sheets = [(sheet_name, df.copy()) for sheet_name, df in sheets]
+    with _lock:
+        _exports[export_id] = {"path": output_path, "status": "queued", "error": None}
+        finished = [key for key, record in _exports.items() if record["status"] in ("done", "failed")]
+        for key in finished[:max(0, len(finished) - MAX_FINISHED_EXPORTS)]:
+            del _exports[key]
+    _executor.submit(_run_export, export_id, output_path, sheets)
+    return export_id
+
+
+def export_status(export_id):
+    """
+    Returns a copy of the export record (path, status, error) or None if unknown.
+    """
+    with _lock:
+        record = _exports.get(export_id)
+        return dict(record) if record else None
+
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def render_export_status(export_id, download_label, key, poll_interval=1.0):
+    """
+    Shows the state of a queued export and offers the file for download once it is on disk.
+    While the export is pending only this fragment is re-run on poll_interval.
+    """
+    def _status_fragment():
+        record = export_status(export_id)
+        if record is None:
+            return
+        if record["status"] in ("queued", "writing"):
+            st.info(f"⏳ Export {record['status']}: {record['path']}")
+            st.session_state[f"{key}_pending"] = True
+        elif record["status"] == "failed":
+            st.error(f"Failed to save the file locally: {record['error']}")
+        else:
+            if st.session_state.pop(f"{key}_pending", False):
+                # Drop the polling fragment now that the file is ready
+                st.rerun()
+            if not os.path.exists(record["path"]):
+                st.warning(f"⚠️ The saved file is no longer at {record['path']}; it was moved or deleted.")
+                return
+            st.success(f"File saved successfully to: {record['path']}")
+            # The workbook is only read when the download is clicked
+            st.download_button(
+                label=download_label,
+                data=lambda: _read_file(record["path"]),
+                file_name=os.path.basename(record["path"]),
+                mime=XLSX_MIME,
+                key=f"{key}_download"
+            )
+
+    record = export_status(export_id)
+    pending = record is not None and record["status"] in ("queued", "writing")
+    st.fragment(_status_fragment, run_every=poll_interval if pending else None)()
@@ -0,0 +1,235 @@
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from eset_loader import _read_names, is_sparse, read_expression_matrix
+
+# Features per chunk file, and bytes of the source matrix read per pass step
+DEFAULT_CHUNK_COLUMNS = 1024
+ROW_BLOCK_BYTES = 64 * 1024 * 1024
+STORE_DTYPES = ("float32", "float64")
+
+
+def block_stats(block):
+    """
+    Per-column count, mean, sum of squared deviations, min, max and nonzero
+    count of one block of rows, ignoring NaNs.
+    """
+    present = ~np.isnan(block)
+    n = present.sum(axis=0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(present, block, 0).sum(axis=0) / n
+    deviations = np.where(present, block - mean, 0)
+    return {
+        "n": n,
+        "mean": np.nan_to_num(mean),
+        "m2": (deviations * deviations).sum(axis=0),
+        "min": np.where(present, block, np.inf).min(axis=0),
+        "max": np.where(present, block, -np.inf).max(axis=0),
+        "nonzero": (present & (block != 0)).sum(axis=0),
+    }
+
+
+def merge_stats(a, b):
+    """
+    Combines the statistics of two blocks of rows (Chan et al.'s pairwise update),
+    so a matrix can be summarized in one pass without holding it in memory.
+    """
+    n = a["n"] + b["n"]
+    delta = b["mean"] - a["mean"]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        weight = np.where(n > 0, b["n"] / n, 0)
+        m2 = a["m2"] + b["m2"] + np.where(n > 0, delta * delta * a["n"] * weight, 0)
+    return {
+        "n": n,
+        "mean": a["mean"] + delta * weight,
+        "m2": m2,
+        "min": np.minimum(a["min"], b["min"]),
+        "max": np.maximum(a["max"], b["max"]),
+        "nonzero": a["nonzero"] + b["nonzero"],
+    }
+
+
+def sparse_column_stats(csc):
+    """
+    The statistics of block_stats for a CSC matrix, from its stored values
+    only: implicit zeros enter through the counts, so memory follows nnz.
+    """
+    n_samples, n_features = csc.shape
+    data = np.asarray(csc.data, dtype=np.float64)
+    column = np.repeat(np.arange(n_features), np.diff(csc.indptr))
+    missing = np.isnan(data)
+    n = n_samples - np.bincount(column[missing], minlength=n_features)
+    values = np.where(missing, 0, data)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.nan_to_num(np.bincount(column, weights=values, minlength=n_features) / n)
+    deviations = np.where(missing, 0, data - mean[column])
+    implicit_zeros = n - np.bincount(column[~missing], minlength=n_features)
+    minimum = np.full(n_features, np.inf)
+    maximum = np.full(n_features, -np.inf)
+    np.minimum.at(minimum, column[~missing], data[~missing])
+    np.maximum.at(maximum, column[~missing], data[~missing])
+    return {
+        "n": n,
+        "mean": mean,
+        "m2": np.bincount(column, weights=deviations * deviations, minlength=n_features) + implicit_zeros * mean * mean,
+        "min": np.where(implicit_zeros > 0, np.minimum(minimum, 0), minimum),
+        "max": np.where(implicit_zeros > 0, np.maximum(maximum, 0), maximum),
+        "nonzero": np.bincount(column[~missing & (data != 0)], minlength=n_features),
+    }
+
+
+def store_dir(extraction_directory, dtype):
+    return os.path.join(extraction_directory, f"store_{dtype}")
+
+
+def _write_chunks(X, directory, dtype, chunk_columns):
+    """
+    Column chunks of a dense matrix, with the statistics merged over row blocks.
+    """
+    n_samples, n_features = X.shape
+    bounds = [(start, min(start + chunk_columns, n_features)) for start in range(0, n_features, chunk_columns)]
+    chunks = [np.lib.format.open_memmap(os.path.join(directory, f"chunk_{i:05d}.npy"), mode="w+", dtype=dtype,
+                                        shape=(n_samples, end - start))
+              for i, (start, end) in enumerate(bounds)]
+    stats = None
+    row_block = max(1, ROW_BLOCK_BYTES // max(1, n_features * 8))
+    for row in range(0, n_samples, row_block):
+        block = np.asarray(X[row:row + row_block], dtype=np.float64)
+        for chunk, (start, end) in zip(chunks, bounds):
+            chunk[row:row + len(block)] = block[:, start:end]
+        partial = block_stats(block)
+        stats = partial if stats is None else merge_stats(stats, partial)
+    for chunk in chunks:
+        chunk.flush()
+    return stats if stats is not None else block_stats(np.zeros((0, n_features)))
+
+
+def _write_csc(X, directory, dtype):
+    """
+    A sparse matrix is kept compressed by column, which is already column-chunked.
+    """
+    csc = X.tocsc()
+    csc.sort_indices()
+    np.save(os.path.join(directory, "csc_data.npy"), csc.data.astype(dtype, copy=False))
+    np.save(os.path.join(directory, "csc_indices.npy"), csc.indices)
+    np.save(os.path.join(directory, "csc_indptr.npy"), csc.indptr)
+    return sparse_column_stats(csc)
+
+
+def build_store(extraction_directory, dtype="float32", chunk_columns=DEFAULT_CHUNK_COLUMNS):
+    """
+    Rewrites the extracted samples x features matrix as column chunks of
+    chunk_columns features (or as CSC arrays for a sparse extraction), and
+    computes the per-feature statistics in the same single pass. Does nothing
+    if the store already exists.
+    """
+    target = store_dir(extraction_directory, dtype)
+    if os.path.exists(os.path.join(target, "store.json")):
+        return target
+    X = read_expression_matrix(extraction_directory)
+    sparse = is_sparse(X)
+    work_dir = tempfile.mkdtemp(prefix=".store_", dir=extraction_directory)
+    try:
+        stats = _write_csc(X, work_dir, dtype) if sparse else _write_chunks(X, work_dir, dtype, chunk_columns)
+        np.savez(os.path.join(work_dir, "stats.npz"), **stats)
+        with open(os.path.join(work_dir, "store.json"), "w") as f:
+            json.dump({"shape": list(X.shape), "dtype": dtype, "chunk_columns": chunk_columns,
+                       "format": "csc" if sparse else "chunked", "nnz": int(X.nnz) if sparse else None}, f)
+        try:
+            os.rename(work_dir, target)
+        except OSError:
+            # Another session built the same store first
+            if not os.path.exists(os.path.join(target, "store.json")):
+                raise
+            shutil.rmtree(work_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        raise
+    return target
+
+
+class ExpressionStore:
+    """
+    Column-chunked, lazily loaded expression matrix (samples x features).
+    Chunks are memory-mapped when first touched, so viewing a window of the
+    matrix only reads the chunks holding its columns. Sparse matrices are held
+    as a memory-mapped CSC matrix and only windows are made dense.
+    """
+
+    def __init__(self, extraction_directory, dtype="float32", chunk_columns=DEFAULT_CHUNK_COLUMNS):
+        if dtype not in STORE_DTYPES:
+            raise ValueError(f"dtype must be one of {STORE_DTYPES}")
+        self.directory = build_store(extraction_directory, dtype, chunk_columns)
+        with open(os.path.join(self.directory, "store.json")) as f:
+            info = json.load(f)
+        self.shape = tuple(info["shape"])
+        self.dtype = np.dtype(info["dtype"])
+        self.chunk_columns = info["chunk_columns"]
+        self.sparse = info.get("format") == "csc"
+        self.nnz = info.get("nnz")
+        self._csc = None
+        self.samples = pd.Index(_read_names(extraction_directory, "sample_names.txt"))
+        self.features = pd.Index(_read_names(extraction_directory, "feature_names.txt"))
+        self._chunks = {}
+        self._stats = None
+
+    def chunk(self, index):
+        if index not in self._chunks:
+            self._chunks[index] = np.load(os.path.join(self.directory, f"chunk_{index:05d}.npy"), mmap_mode="r")
+        return self._chunks[index]
+
+    def csc(self):
+        if self._csc is None:
+            from scipy.sparse import csc_matrix
+
+            arrays = [np.load(os.path.join(self.directory, f"csc_{name}.npy"), mmap_mode="r")
+                      for name in ("data", "indices", "indptr")]
+            self._csc = csc_matrix(tuple(arrays), shape=self.shape)
+        return self._csc
+
+    def columns(self, columns, rows=slice(None)):
+        """
+        Values for the given feature positions (and optionally row positions) as a dense array.
+        """
+        columns = np.arange(self.shape[1])[columns] if isinstance(columns, slice) else np.asarray(columns, dtype=int)
+        if self.sparse:
+            return self.csc()[:, columns][rows].toarray()
+        out = np.empty((len(np.arange(self.shape[0])[rows]), len(columns)), dtype=self.dtype)
+        chunk_ids = columns // self.chunk_columns
+        for chunk_id in np.unique(chunk_ids):
+            selected = chunk_ids == chunk_id
+            out[:, selected] = self.chunk(int(chunk_id))[rows][:, columns[selected] - chunk_id * self.chunk_columns]
+        return out
+
+    def window(self, rows=slice(0, 20), columns=slice(0, 20)):
+        """
+        A window of the matrix as a DataFrame labelled with sample and feature names.
+        """
+        column_positions = np.arange(self.shape[1])[columns]
+        return pd.DataFrame(self.columns(column_positions, rows), index=self.samples[rows],
+                            columns=self.features[column_positions])
+
+    def feature_stats(self):
+        """
+        Per-feature summary computed while the store was built: mean, std,
+        min, max, nonzero and missing counts.
+        """
+        if self._stats is None:
+            with np.load(os.path.join(self.directory, "stats.npz")) as stats:
+                n = stats["n"]
+                with np.errstate(invalid="ignore", divide="ignore"):
+                    std = np.where(n > 1, np.sqrt(stats["m2"] / np.maximum(n - 1, 1)), np.nan)
+                self._stats = pd.DataFrame({
+                    "mean": np.where(n > 0, stats["mean"], np.nan),
+                    "std": std,
+                    "min": np.where(n > 0, stats["min"], np.nan),
+                    "max": np.where(n > 0, stats["max"], np.nan),
+                    "nonzero": stats["nonzero"],
+                    "missing": self.shape[0] - n,
+                }, index=self.features)
+        return self._stats
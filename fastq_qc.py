@@ -0,0 +1,160 @@
+import gzip
+import json
+import os
+import re
+import xml.etree.ElementTree as ET
+from itertools import islice
+
+import numpy as np
+import pandas as pd
+
+PHRED_OFFSET = 33
+# Quality lines decoded per numpy batch
+QC_BATCH_READS = 200000
+# Samples this far below the run median (in robust z-scores) are flagged
+OUTLIER_Z = 3.0
+MIN_PCT_Q30 = 75.0
+
+# bcl2fastq names: {Sample}_S{n}_L{lane}_R{read}_001.fastq.gz, without _L{lane} when lanes are merged
+_FASTQ_NAME = re.compile(r"^(?P<sample>.+)_S(?P<number>\d+)(?:_L(?P<lane>\d{3}))?_(?P<read>[RI]\d)_\d{3}\.fastq(?:\.gz)?$")
+
+
+def sample_fastqs(output_dir):
+    """
+    Demultiplexed sample FASTQs below output_dir as a list of dicts with
+    path, sample, lane and read. Undetermined reads are left out.
+    """
+    found = []
+    for root, _, names in os.walk(output_dir):
+        for name in names:
+            match = _FASTQ_NAME.match(name)
+            if match is None or name.startswith("Undetermined_"):
+                continue
+            found.append({
+                "path": os.path.join(root, name),
+                "sample": match.group("sample"),
+                "lane": str(int(match.group("lane"))) if match.group("lane") else "all",
+                "read": match.group("read"),
+            })
+    return sorted(found, key=lambda f: f["path"])
+
+
+def fastq_stats(path, mtime_ns=None, phred_offset=PHRED_OFFSET):
+    """
+    Streams one FASTQ(.gz) and returns reads, bases, the quality sum and the
+    number of bases at Q30 or above. Quality lines are decoded in batches with
+    numpy. mtime_ns only makes the job id change when the file is rewritten.
+    """
+    reads = bases = quality_sum = q30 = 0
+    threshold = 30 + phred_offset
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        qualities = islice(f, 3, None, 4)
+        while True:
+            batch = [line.rstrip(b"\r\n") for line in islice(qualities, QC_BATCH_READS)]
+            if not batch:
+                break
+            values = np.frombuffer(b"".join(batch), dtype=np.uint8)
+            reads += len(batch)
+            bases += values.size
+            quality_sum += int(values.sum(dtype=np.int64)) - phred_offset * values.size
+            q30 += int(np.count_nonzero(values >= threshold))
+    return {"reads": reads, "bases": bases, "quality_sum": quality_sum, "q30_bases": q30}
+
+
+def read_stats_json(output_dir):
+    """
+    Per sample and lane read counts and yield from Stats/Stats.json, or an empty DataFrame.
+    """
+    try:
+        with open(os.path.join(output_dir, "Stats", "Stats.json")) as f:
+            stats = json.load(f)
+    except (OSError, ValueError):
+        return pd.DataFrame()
+    rows = []
+    for lane in stats.get("ConversionResults", []):
+        for result in lane.get("DemuxResults", []):
+            metrics = result.get("ReadMetrics", [])
+            rows.append({
+                "sample": result.get("SampleName") or result.get("SampleId"),
+                "lane": str(lane["LaneNumber"]),
+                "Stats.json reads": result.get("NumberReads", 0),
+                "Stats.json yield": result.get("Yield", 0),
+                "Stats.json Q30 yield": sum(m.get("YieldQ30", 0) for m in metrics),
+            })
+    return pd.DataFrame(rows)
+
+
+def read_conversion_stats(output_dir):
+    """
+    Raw and passing-filter cluster counts per sample and lane from
+    Stats/ConversionStats.xml, or an empty DataFrame.
+    """
+    try:
+        root = ET.parse(os.path.join(output_dir, "Stats", "ConversionStats.xml")).getroot()
+    except (OSError, ET.ParseError):
+        return pd.DataFrame()
+    rows = []
+    for project in root.iter("Project"):
+        # The "all" project repeats every sample
+        if project.get("name") == "all":
+            continue
+        for sample in project.iter("Sample"):
+            for barcode in sample.iter("Barcode"):
+                if barcode.get("name") != "all":
+                    continue
+                for lane in barcode.iter("Lane"):
+                    rows.append({
+                        "sample": sample.get("name"),
+                        "lane": lane.get("number"),
+                        "Raw clusters": sum(int(c.text) for c in lane.iterfind("Tile/Raw/ClusterCount")),
+                        "PF clusters": sum(int(c.text) for c in lane.iterfind("Tile/Pf/ClusterCount")),
+                    })
+    return pd.DataFrame(rows)
+
+
+def _robust_z(values):
+    median = values.median()
+    mad = (values - median).abs().median() * 1.4826
+    if not mad:
+        return pd.Series(0.0, index=values.index)
+    return (values - median) / mad
+
+
+def qc_table(files, results, output_dir=None):
+    """
+    Combines the per-file statistics into one row per sample and lane, joined
+    with Stats.json and ConversionStats.xml when present, with outlier flags.
+    files are sample_fastqs() entries, results the matching fastq_stats() dicts.
+    """
+    if not files:
+        return pd.DataFrame()
+    df = pd.DataFrame([{**{k: f[k] for k in ("sample", "lane", "read")}, **r} for f, r in zip(files, results)])
+    # Index read FASTQs (--create-fastq-for-index-reads) are not part of the yield
+    df = df[df["read"].str.startswith("R")]
+    # Reads are counted once (read 1); bases and qualities over all sequenced reads
+    read1 = df[df["read"] == "R1"].groupby(["sample", "lane"])["reads"].sum()
+    table = df.groupby(["sample", "lane"])[["bases", "quality_sum", "q30_bases"]].sum()
+    table["reads"] = read1.reindex(table.index).fillna(0).astype(np.int64)
+    table["Mean quality"] = table["quality_sum"] / table["bases"].where(table["bases"] > 0)
+    table["% >= Q30"] = 100 * table["q30_bases"] / table["bases"].where(table["bases"] > 0)
+    table = table.reset_index()[["sample", "lane", "reads", "bases", "Mean quality", "% >= Q30"]]
+
+    if output_dir is not None:
+        for extra in (read_stats_json(output_dir), read_conversion_stats(output_dir)):
+            if not extra.empty:
+                if (table["lane"] == "all").all():
+                    # --no-lane-splitting: FASTQs cover all lanes, the stats are per lane
+                    extra["lane"] = "all"
+                extra = extra.groupby(["sample", "lane"], as_index=False).sum()
+                table = table.merge(extra, on=["sample", "lane"], how="left")
+
+    flags = pd.Series("", index=table.index)
+    log_reads = np.log10(table["reads"].clip(lower=1))
+    flags[_robust_z(log_reads) < -OUTLIER_Z] += "low yield; "
+    flags[table["reads"] == 0] += "no reads; "
+    q30 = table["% >= Q30"]
+    flags[(q30 < MIN_PCT_Q30) | (_robust_z(q30.fillna(0)) < -OUTLIER_Z)] += "low %Q30; "
+    table["Flags"] = flags.str.rstrip("; ")
+    table["% of reads"] = 100 * table["reads"] / table["reads"].sum() if table["reads"].sum() else 0.0
+    return table.rename(columns={"sample": "Sample", "lane": "Lane", "reads": "Reads", "bases": "Bases"})
@@ -1,9 +1,5 @@
 import pandas as pd
 import streamlit as st
-from io import BytesIO
-import altair as alt
-import os
-from scipy.stats import fisher_exact
 from pandas.api.types import (
     is_categorical_dtype,
     is_datetime64_any_dtype,
@@ -11,19 +7,29 @@ from pandas.api.types import (
     is_object_dtype,
 )
 
-from statsmodels.stats.proportion import proportions_ztest
-from scipy.stats import chi2_contingency
+# altair is imported inside plot_chip_data so opening this page does not pay for it
+
+from export_queue import submit_export, render_export_status
+from job_pool import submit_job, render_job_status
+from path_ingest import file_input, job_input
+from safeseq_combine import DEFAULT_GENE_PANEL, combine_safeseq_files
 
 
 # Streamlit app title
 st.title("Combine SafeSeq Results into a Single Output File")
 
+# Large runs can be read straight from the server instead of going through the browser upload
+input_mode = st.radio("Input source", ["Upload files", "Server paths"], horizontal=True)
+server_path = input_mode == "Server paths"
+
 # File upload widgets
-raw_summary_file = st.file_uploader("Upload the raw summary file (.tab format)", type="tab")
-run_summary_file = st.file_uploader("Upload the run summary file (.xlsm format)", type="xlsm")
-sample_list_file = st.file_uploader("Upload the sample list file (.xlsm format)", type="xlsm")
+raw_summary_file = file_input("Upload the raw summary file (.tab format)", "tab", "raw_summary_file", server_path)
+run_summary_file = file_input("Upload the run summary file (.xlsm format)", "xlsm", "run_summary_file", server_path)
+sample_list_file = file_input("Upload the sample list file (.xlsm format)", "xlsm", "sample_list_file", server_path)
 #CHIP data file would not be always available, if not, the whole function would not be changed. 
-chipdatafile = st.file_uploader("Upload the CHIP data file (.tab format)", type="tab")
+chipdatafile = file_input("Upload the CHIP data file (.tab format)", "tab", "chipdatafile", server_path)
+gene_panel_text = st.text_input("CHIP back-check gene panel (comma separated)", ", ".join(DEFAULT_GENE_PANEL))
+gene_panel = [gene.strip() for gene in gene_panel_text.split(',') if gene.strip()] or DEFAULT_GENE_PANEL
 
 # Text input to specify custom output file path and name
 output_file_path = st.text_input("Enter the full path for the output file (e.g., /Users/username/Downloads/Combined_Output.xlsx)", "/Users/dafualt_path/Combined_Output.xlsx")
@@ -38,116 +44,6 @@ def display_dataframe_with_filter(df, title):
     df = filter_dataframe(df)
     st.dataframe(df)
 
-def read_raw_data(tabfile):
-    df = pd.read_csv(tabfile, sep='\t')
-    df = df[~df['SampleId'].str.contains('PC')]
-    df = df[~df['SampleId'].str.contains('NC')]
-    return df
-
-def calculate_p_value_and_odds_ratio_MM(row):
-    tumor_var = row['MM_Safeseq_t']
-    tumor_ref = row['MM_Safeseq_ref']
-    normal_var = row['MM_BC_t']
-    normal_ref = row['MM_BC_ref']
-    # Add continuity correction to avoid zeros
-    tumor_var += 0.1
-    tumor_ref += 0.1
-    normal_var += 0.1
-    normal_ref += 0.1
-    # Construct contingency table
-    contingency_table = [
-        [tumor_var, tumor_ref],
-        [normal_var, normal_ref]
-        ]
-    # Perform Fisher's Exact Test
-    odds_ratio, p_value = fisher_exact(contingency_table, alternative='greater')
-    return pd.Series({'p_value': p_value, 'odds_ratio': odds_ratio})
-
-def two_proportion_ztest(row):
-    tumor_var = row['MM_Safeseq_t']
-    tumor_ref = row['MM_Safeseq_ref']
-    normal_var = row['MM_BC_t']
-    normal_ref = row['MM_BC_ref']    
-    # Number of "successes" in each group
-    count = np.array([tumor_var, normal_var])
-    # Total observations in each group
-    nobs = np.array([tumor_var + tumor_ref, normal_var + normal_ref])
-    stat, p_value = proportions_ztest(count, nobs, alternative='larger')
-    return pd.Series({'z_stat': stat, 'p_value': p_value})
-
-def chi_squared_test(row):
-    tumor_var = row['MM_Safeseq_t']
-    tumor_ref = row['MM_Safeseq_ref']
-    normal_var = row['MM_BC_t']
-    normal_ref = row['MM_BC_ref']
-    contingency_table = [[tumor_var, tumor_ref],
-                         [normal_var, normal_ref]]
-    chi2, p_value, dof, expected = chi2_contingency(contingency_table)
-    return pd.Series({'chi2': chi2, 'p_value': p_value, 'dof': dof})
-
-
-def update_result_review(df):
-    """
-    Updates the dataframe based on specific conditions for 'fisher_p_value', 'fisher_odds_ratio', and 'Call' columns.
-    Parameters:
-        df (pd.DataFrame): The input dataframe.
-    Returns:
-        pd.DataFrame: The updated dataframe.
-    """
-    # Define conditions
-    condition = (
-        (df['fisher_p_value'] > 0.01) | (df['fisher_odds_ratio'] < 2)
-    ) & (df['Call'] == 'MD')
-    # Identify rows to be changed
-    changed_rows = df[condition]
-    # Print rows that will be changed
-    print("Rows that have been changed:")
-    print(changed_rows)
-    # Apply updates based on conditions
-    df.loc[condition, 'Call'] = 'NMD'
-    df.loc[condition, 'Comment Call (Internal)'] = (
-        df['Comment Call (Internal)'].fillna('') +
-        " BC experiment did not support this mutant being detected"
-    )
-    return df, changed_rows
-
-def chip_data_process(chipdatafile, df_ResultReview_import):
-    df_chip = read_raw_data(chipdatafile)
-    df_chip['SampleId']= df_chip['SampleId'].astype(str).str.replace(r'BC', '', regex=True)
-    df_chip_filter=df_chip[df_chip['Gene Name'].isin(['TP53', 'KRAS'])]
-    df_chip_filter_selected = df_chip_filter[['SampleId','CDSChange', 'AAChange', '#UIDs/Amplicon','#Supermutants', 'Gene Name', 'Call', 'MAF[%]', 'MutantMolecules', 'GE']]
-    df_chip_filter_selected = df_chip_filter_selected.rename(columns={"SampleId":"SampleID"})
-    df_ResultReview_import_selected = df_ResultReview_import[((df_ResultReview_import['Call']=='MD') & (df_ResultReview_import['Gene Name'].isin(['TP53', 'KRAS'])))]
-    merged_df = pd.merge(
-        df_ResultReview_import_selected,
-        df_chip_filter_selected,
-        on=['SampleID', 'CDSChange', 'AAChange'],
-        suffixes=('_tumor', '_normal'),
-        how='left'
-        )
-    merged_df_wBC = merged_df[~merged_df['#UIDs/Amplicon_normal'].isna()]
-    merged_df_nBC = merged_df[merged_df['#UIDs/Amplicon_normal'].isna()]
-    merged_df_wBC['MM_Safeseq_t'] = merged_df_wBC['#Supermutants_tumor']*merged_df_wBC['GE_tumor']/merged_df_wBC['#UIDs/Amplicon_tumor'] 
-    merged_df_wBC['MM_Safeseq_ref'] = (merged_df_wBC['#UIDs/Amplicon_tumor'] - merged_df_wBC['#Supermutants_tumor'])*merged_df_wBC['GE_tumor']/merged_df_wBC['#UIDs/Amplicon_tumor']
-    merged_df_wBC['MM_BC_t'] = merged_df_wBC['#Supermutants_normal']*merged_df_wBC['GE_normal']/merged_df_wBC['#UIDs/Amplicon_normal'] 
-    merged_df_wBC['MM_BC_ref'] = (merged_df_wBC['#UIDs/Amplicon_normal'] - merged_df_wBC['#Supermutants_normal'])*merged_df_wBC['GE_normal']/merged_df_wBC['#UIDs/Amplicon_normal']
-    # Combine the columns into one list
-    columns_to_fill = ['MM_Safeseq_t', 'MM_Safeseq_ref', 'MM_BC_t', 'MM_BC_ref']
-    merged_df_wBC[['fisher_p_value', 'fisher_odds_ratio']] = merged_df_wBC.apply(calculate_p_value_and_odds_ratio_MM, axis=1)
-    rows_to_update = merged_df_wBC[(merged_df_wBC['fisher_p_value'] > 0.01) | (merged_df_wBC['fisher_odds_ratio'] < 2)]
-    merged_df_wBC['key'] = merged_df_wBC['SampleID'] + '_' + merged_df_wBC['CDSChange'] + '_' + merged_df_wBC['AAChange']
-    df_ResultReview_import['key'] = df_ResultReview_import['SampleID'] + '_' + df_ResultReview_import['CDSChange'] + '_' + df_ResultReview_import['AAChange']
-    df_ResultReview_import_wBC = df_ResultReview_import.merge(
-        merged_df_wBC[['key', 'fisher_p_value', 'fisher_odds_ratio']],
-        on='key',
-        how='left'
-        )
-    df_ResultReview_import_wBC_upaded, changed_rows = update_result_review(df_ResultReview_import_wBC)
-    if changed_rows.shape == 0:  # Check if the number of rows is 0
-        print("No data need to update in this Run")
-    df_ResultReview_import.drop(columns=['key'], inplace=True)
-    return df_ResultReview_import_wBC_upaded, merged_df_wBC, rows_to_update, merged_df_nBC
-
 
 def filter_dataframe(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -218,6 +114,7 @@ def plot_chip_data(df):
     Create a grouped bar chart to visualize tumor vs. normal counts and show
     fisher_p_value & fisher_odds_ratio in tooltips.
     """
+    import altair as alt
     required_cols = [
         'SampleID',
         '#UIDs/Amplicon_tumor', '#Supermutants_tumor',
@@ -253,7 +150,7 @@ def plot_chip_data(df):
         .properties(width=600, height=400)
         .interactive()
     )
-    st.altair_chart(chart, use_container_width=True)
+    st.altair_chart(chart, width="stretch")
 
 if "df1_summary_tab" not in st.session_state:
     st.session_state.df1_summary_tab = None
@@ -276,116 +173,50 @@ if "rows_to_update" not in st.session_state:
 if "merged_df_nBC" not in st.session_state:
     st.session_state.merged_df_nBC = None
 
+if "combine_job_id" not in st.session_state:
+    st.session_state.combine_job_id = None
+    st.session_state.combine_output_path = None
+
+if "export_id" not in st.session_state:
+    st.session_state.export_id = None
+    st.session_state.export_label = None
+
 # Button to process the files
 if st.button("Combine Files") and raw_summary_file and run_summary_file and sample_list_file:
-    # Read and preprocess the raw summary file
-    df1_summary_tab = pd.read_csv(raw_summary_file, sep='\t')
-    df1_summary_tab = df1_summary_tab[~df1_summary_tab['SampleId'].str.contains('PC')]
-    df1_summary_tab = df1_summary_tab[~df1_summary_tab['SampleId'].str.contains('NTC')]
-    st.session_state.df1_summary_tab = df1_summary_tab
-    Samplelist = list(set(df1_summary_tab['SampleId'].to_list()))
-        
-    # Read the run summary file
-    df_RunSumm = pd.read_excel(run_summary_file, sheet_name='7 Run Summary').dropna()
-    df_AE_input = pd.read_excel(run_summary_file, sheet_name='9 SafeSEQ AE input')
-    FlowCellID = df_AE_input.loc[df_AE_input['[Header]'] == 'Description', 'Unnamed: 1'].values[0]
-    df_RunSumm.loc[:, 'FlowcellID'] = FlowCellID
-    df_RunSumm = df_RunSumm.drop(columns=['#'])
-    st.session_state.df_RunSumm = df_RunSumm
-
-    # Read the sample list file
-    dfs_slf_samplelist = pd.read_excel(sample_list_file, sheet_name='Sample List 2.1', skiprows=4)
-    filtered_df = dfs_slf_samplelist[dfs_slf_samplelist['Inostics ID'].isin(Samplelist)]
-    filtered_df = filtered_df[['Inostics ID', 'External ID1\n(Patient ID-Visit)',
-                               'External ID2\n(Collection datetime)', 'Scan External Barcode ']]
-    filtered_df['External ID2\n(Collection datetime)'] = filtered_df['External ID2\n(Collection datetime)'].astype(str).str.replace(r'\.0$', '', regex=True)
-    Sample_mapping = filtered_df.groupby("Inostics ID", as_index=False).first()
-    sample_mapping_df = Sample_mapping.rename(columns={
-        'Inostics ID': 'Inostics ID',
-        'External ID1\n(Patient ID-Visit)': 'External ID1',
-        'External ID2\n(Collection datetime)': 'External ID2',
-        'Scan External Barcode ': 'External ID3'
-    })
-    st.session_state.sample_mapping_df = sample_mapping_df    
-
-    # Display sample_mapping_df
-#    display_dataframe(st.session_state.sample_mapping_df, "Sample List File Data")
-    
-    df_ResultsReview = df1_summary_tab.rename(columns={'Sample ID':'SampleID', 'Total DNA Amount (GE)':'GE', 'Amplicon ID':'AmpliconID', 'CDS Change':'CDSChange', 'AA Change':'AAChange', 'MAF [%]':'MAF[%]', 'Mutant Molecules':'MutantMolecules', 'COSMIC ID':'COSMICID', 'Base specific Cut-off':'Cutoff', 'Comment Call':'UpdateComment'})
-    merged_df = df_ResultsReview.merge(sample_mapping_df, left_on='SampleId', right_on='Inostics ID', how='right')
-    columns_to_drop = ['Raw Call', 'Reference Transcript ID', 'RUNID', 'SWVersion', 'Config File Name', 'userid', 'machineid', 'ChangeType', 'AvgMutantBaseQuality', 'CoverageStatus', '#positiveWells', 'LoB', 'LoQ', 'MutationHash', 'Mutation classification', 'timestamp', 'indexPlate', 'ampliconPosition', 'ML Plasma', 'MM/ML Plasma', 'MM corrected']
-    merged_df = merged_df.drop(columns=columns_to_drop)
-    merged_df2 = merged_df.merge(df_RunSumm, left_on='SampleId', right_on='Sample_ID', how='left')
-    merged_df2 = merged_df2.rename(columns={'SampleId':'SampleID'})
-    columns_to_drop2 = ['Inostics ID','External ID2', 'External ID3', 'Sample_ID', 'Plasma Vol. [mL]', 'FlowcellID']
-    merged_df2 = merged_df2.drop(columns=columns_to_drop2)
-    Order_list = ['FlowCellID', 'SampleID', 'Comment Call (Internal)', 'Comment Call (External)', 'Call', 'AmpliconID', 'GE', 'Gene Name', 'CDSChange', 'AAChange', 'MAF[%]', 'MutantMolecules', 'CosmicID', 'dbSNP', 'ClinVar', 'Raw Call', 'OOS', 'hg19Pos', '#UIDs/Amplicon', '#Supermutants', 'Cutoff', 'UpdateComment', 'Assay variant', 'Qubit Run ID', 'UID-PCR input (ng/116µl)', 'UID-PCR ID', 'UID-PCR wells', 'Index-PCR ID', 'NextSeq ID']
-    df_ResultReview_import = merged_df2.reindex(columns=Order_list)    
-#    st.session_state.df_ResultReview_import = df_ResultReview_import    
-    st.success("Data combined successfully!")
-    # Display ResultsReview imported sheet
-    ###Add integrate code after this step if CHIP data is available
-    if chipdatafile is not None:
-        # Process the uploaded file
-        df_ResultReview_import, merged_df_wBC ,rows_to_update, merged_df_nBC = chip_data_process(chipdatafile, df_ResultReview_import) 
-        st.session_state.df_ResultReview_import = df_ResultReview_import
-        st.session_state.rows_to_update = rows_to_update
-        st.session_state.merged_df_nBC = merged_df_nBC
-        st.session_state.merged_df_wBC = merged_df_wBC
-#        display_dataframe(rows_to_update, "CHIP data Review")
-        # Provide download link with the exact custom file name provided
-        with pd.ExcelWriter(output_file_path, engine='openpyxl') as writer:
-            df1_summary_tab.to_excel(writer, sheet_name="Import_Raw Data", index=False)
-            df_RunSumm.to_excel(writer, sheet_name="Import_Run Summary", index=False)
-            sample_mapping_df.to_excel(writer, sheet_name="Sample Mapping", index=False)
-            df_ResultReview_import.to_excel(writer, sheet_name="Results Review", index=False)
-            # Add more sheets if needed
-        st.success(f"File saved successfully to: {output_file_path}")
-        
-        # Optionally, provide the output in BytesIO for download
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df1_summary_tab.to_excel(writer, sheet_name="Import_Raw Data", index=False)
-            df_RunSumm.to_excel(writer, sheet_name="Import_Run Summary", index=False)
-            sample_mapping_df.to_excel(writer, sheet_name="Sample Mapping", index=False)
-            df_ResultReview_import.to_excel(writer, sheet_name="Results Review", index=False)
-        output.seek(0)
-        download_file_name = os.path.basename(output_file_path)
-        st.download_button(
-            label="Download Combined Output File with CHIP Data",
-            data=output,
-            file_name=download_file_name,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
+    # Parsing, merging and statistics run in the shared worker pool and survive reruns
+    st.session_state.combine_job_id = submit_job(
+        combine_safeseq_files,
+        job_input(raw_summary_file),
+        job_input(run_summary_file),
+        job_input(sample_list_file),
+        job_input(chipdatafile) if chipdatafile is not None else None,
+        gene_panel
+    )
+    st.session_state.combine_output_path = output_file_path
+    # Identical inputs reuse the finished job, so make sure its results are applied and exported again
+    st.session_state.combine_job_applied = None
+
+def apply_combined_results(results):
+    for name, df in results.items():
+        st.session_state[name] = df
+    if "rows_to_update" in results:
+        st.session_state.export_label = "Download Combined Output File with CHIP Data"
     else:
-        st.session_state.df_ResultReview_import = df_ResultReview_import
-        with pd.ExcelWriter(output_file_path, engine='openpyxl') as writer:
-            df1_summary_tab.to_excel(writer, sheet_name="Import_Raw Data", index=False)
-            df_RunSumm.to_excel(writer, sheet_name="Import_Run Summary", index=False)
-            sample_mapping_df.to_excel(writer, sheet_name="Sample Mapping", index=False)
-            df_ResultReview_import.to_excel(writer, sheet_name="Results Review", index=False)
-            # Add more sheets if needed
-
-        # Notify user of the saved file
-        st.success(f"File saved successfully to: {output_file_path}")
-
-        # Optionally, provide the output in BytesIO for download
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df1_summary_tab.to_excel(writer, sheet_name="Import_Raw Data", index=False)
-            df_RunSumm.to_excel(writer, sheet_name="Import_Run Summary", index=False)
-            sample_mapping_df.to_excel(writer, sheet_name="Sample Mapping", index=False)
-            df_ResultReview_import.to_excel(writer, sheet_name="Results Review", index=False)
-        output.seek(0)
-        # Provide download link with the exact custom file name provided
-        download_file_name = os.path.basename(output_file_path)
-        st.download_button(
-            label="Download Combined Output File",
-            data=output,
-            file_name=download_file_name,
-            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-        )
-
+        st.session_state.export_label = "Download Combined Output File"
+    # Queue the workbook in the background writer; the download appears once it is on disk
+    st.session_state.export_id = submit_export(st.session_state.combine_output_path, [
+        ("Import_Raw Data", results["df1_summary_tab"]),
+        ("Import_Run Summary", results["df_RunSumm"]),
+        ("Sample Mapping", results["sample_mapping_df"]),
+        ("Results Review", results["df_ResultReview_import"]),
+        # Add more sheets if needed
+    ])
+
+if st.session_state.combine_job_id is not None:
+    render_job_status(st.session_state.combine_job_id, "combine_job", apply_combined_results, "Data combined successfully!")
+
+if st.session_state.export_id is not None:
+    render_export_status(st.session_state.export_id, st.session_state.export_label, key="combined_export")
 
 if st.session_state.df1_summary_tab is not None:
     display_dataframe(
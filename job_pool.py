@@ -0,0 +1,115 @@
+import hashlib
+import multiprocessing
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import streamlit as st
+
+# Worker processes shared by every page and session of this server
+POOL_WORKERS_ENV = "SAFESEQ_POOL_WORKERS"
+# Finished jobs kept for polling before the oldest are dropped
+MAX_FINISHED_JOBS = 64
+
+_executor = None
+_jobs = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Returns the shared process pool, starting it on first use.
+    Workers are spawned rather than forked so they never inherit the server's threads.
+    """
+    global _executor
+    with _lock:
+        if _executor is None:
+            workers = int(os.environ.get(POOL_WORKERS_ENV, 0)) or os.cpu_count() or 1
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _executor
+
+
+def job_key(fn, *args, **kwargs):
+    """
+    Job id derived from the function and its pickled arguments, so identical
+    submissions from several reruns or sessions map to the same job.
+    """
+    digest = hashlib.sha256(f"{fn.__module__}.{fn.__qualname__}".encode())
+    digest.update(pickle.dumps((args, sorted(kwargs.items())), protocol=pickle.HIGHEST_PROTOCOL))
+    return digest.hexdigest()
+
+
+def submit_job(fn, *args, **kwargs):
+    """
+    Submits fn(*args, **kwargs) to the shared pool and returns its job id.
+    fn must be importable by name (defined in a module, not in a page script).
+    A job that is pending, running or done is reused; a failed one is resubmitted.
+    """
+    job_id = job_key(fn, *args, **kwargs)
+    executor = get_executor()
+    with _lock:
+        future = _jobs.get(job_id)
+        if future is not None and not (future.done() and future.exception() is not None):
+            _jobs.move_to_end(job_id)
+            return job_id
+        _jobs[job_id] = executor.submit(fn, *args, **kwargs)
+        finished = [key for key, f in _jobs.items() if f.done()]
+        for key in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del _jobs[key]
+    return job_id
+
+
+def job_state(job_id):
+    """
+    Returns 'pending', 'running', 'done', 'failed' or None if the job is unknown.
+    """
+    with _lock:
+        future = _jobs.get(job_id)
+    if future is None:
+        return None
+    if not future.done():
+        return "running" if future.running() else "pending"
+    return "failed" if future.exception() is not None else "done"
+
+
+def job_result(job_id):
+    """
+    Returns the result of a finished job (re-raises its exception if it failed).
+    """
+    with _lock:
+        future = _jobs[job_id]
+    return future.result()
+
+
+def job_error(job_id):
+    with _lock:
+        future = _jobs.get(job_id)
+    if future is None or not future.done():
+        return None
+    return future.exception()
+
+
+def render_job_status(job_id, key, on_done, done_message=None, poll_interval=1.0):
+    """
+    Polls a job in a fragment and calls on_done(result) once when it finishes,
+    then reruns the page so the results are rendered.
+    """
+    def _status_fragment():
+        state = job_state(job_id)
+        if state is None:
+            st.warning("This job is no longer available, please submit it again.")
+        elif state in ("pending", "running"):
+            st.info(f"⏳ Job {state}...")
+        elif state == "failed":
+            st.error(f"❌ Job failed: {job_error(job_id)}")
+        elif st.session_state.get(f"{key}_applied") != job_id:
+            st.session_state[f"{key}_applied"] = job_id
+            on_done(job_result(job_id))
+            st.rerun()
+        elif done_message:
+            st.success(done_message)
+
+    pending = job_state(job_id) in ("pending", "running")
+    st.fragment(_status_fragment, run_every=poll_interval if pending else None)()
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+
+QUANTILES = [0.0, 0.25, 0.5, 0.75, 1.0]
+QUANTILE_COLUMNS = ["min", "25%", "50%", "75%", "max"]
+# Numeric columns with more distinct values are summarized by quantiles only
+TOP_VALUES_MAX_DISTINCT = 20
+
+
+def column_kind(series):
+    if pd.api.types.is_bool_dtype(series):
+        return "boolean"
+    if pd.api.types.is_numeric_dtype(series):
+        return "numeric"
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime"
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        return "categorical"
+    return "text"
+
+
+def top_values(df, top_k=5):
+    """
+    The top_k most frequent values of every column, from one grouped count
+    over the stacked columns rather than a value_counts() per column.
+    """
+    if df.empty or not len(df.columns):
+        return pd.Series(dtype=object)
+    stacked = df.astype(str).where(df.notna()).melt(var_name="column", value_name="value").dropna()
+    counts = stacked.groupby(["column", "value"], sort=False).size().sort_values(ascending=False, kind="stable")
+    top = counts.groupby(level="column", sort=False).head(top_k).reset_index(name="count")
+    top["label"] = top["value"] + " (" + top["count"].astype(str) + ")"
+    return top.groupby("column", sort=False)["label"].agg(", ".join)
+
+
+def profile_metadata(df, top_k=5):
+    """
+    One row per column: kind, dtype, missing values, distinct values, the
+    top_k most frequent values and, for numeric columns, mean and quantiles.
+    Counts and quantiles are computed for all columns at once.
+    """
+    kinds = pd.Series({column: column_kind(df[column]) for column in df.columns}, dtype=object)
+    profile = pd.DataFrame({
+        "kind": kinds,
+        "dtype": df.dtypes.astype(str),
+        "missing": df.isna().sum(),
+        "missing %": df.isna().mean() * 100 if len(df) else 0.0,
+        "distinct": df.nunique(dropna=True),
+    }, index=df.columns)
+    discrete = [column for column in df.columns
+                if kinds[column] != "numeric" or profile.at[column, "distinct"] <= TOP_VALUES_MAX_DISTINCT]
+    profile["top values"] = top_values(df[discrete], top_k).reindex(df.columns)
+    numeric = df.loc[:, list(kinds[kinds == "numeric"].index)].astype("float64")
+    if len(numeric.columns) and len(df):
+        profile["mean"] = numeric.mean()
+        quantiles = numeric.quantile(QUANTILES).T
+        quantiles.columns = QUANTILE_COLUMNS
+        profile = profile.join(quantiles)
+    else:
+        for column in ["mean"] + QUANTILE_COLUMNS:
+            profile[column] = np.nan
+    return profile.rename_axis("column")
+
+
+def column_detail(series, top_k=50):
+    """
+    Drill-down of one column: full value counts, or a histogram for numbers.
+    """
+    if column_kind(series) == "numeric" and series.nunique() > top_k:
+        counts, edges = np.histogram(series.dropna().astype("float64"), bins=30)
+        return pd.DataFrame({"from": edges[:-1], "to": edges[1:], "samples": counts})
+    return series.value_counts(dropna=False).head(top_k).rename_axis("value").reset_index(name="samples")
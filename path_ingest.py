@@ -0,0 +1,121 @@
+import os
+from io import BytesIO
+
+import pandas as pd
+import streamlit as st
+
+# Server directories that may be read directly, separated by os.pathsep
+INGEST_ROOTS_ENV = "SAFESEQ_INGEST_ROOTS"
+
+
+def allowed_roots():
+    """
+    Returns the configured allowlist of server-side input roots as real paths.
+    """
+    value = os.environ.get(INGEST_ROOTS_ENV, "")
+    return [os.path.realpath(os.path.expanduser(root)) for root in value.split(os.pathsep) if root.strip()]
+
+
+def is_allowed(real_path, roots):
+    return any(os.path.commonpath([real_path, root]) == root for root in roots)
+
+
+def _resolve_in_roots(path):
+    real_path = os.path.realpath(os.path.expanduser(path.strip()))
+    roots = allowed_roots()
+    if not roots:
+        raise ValueError(f"No server input roots are configured (set {INGEST_ROOTS_ENV})")
+    if not is_allowed(real_path, roots):
+        raise ValueError(f"Path is outside the allowed input roots: {path}")
+    return real_path
+
+
+def resolve_allowed_path(path, file_type=None):
+    """
+    Resolves a server-local path and checks it lies inside one of the allowed roots.
+    Returns the real path, raises ValueError or FileNotFoundError otherwise.
+    """
+    real_path = _resolve_in_roots(path)
+    if not os.path.isfile(real_path):
+        raise FileNotFoundError(f"File does not exist: {path}")
+    if file_type is not None:
+        extensions = [file_type] if isinstance(file_type, str) else list(file_type)
+        if not any(real_path.lower().endswith("." + ext.lower()) for ext in extensions):
+            raise ValueError(f"Expected a {'/'.join(extensions)} file: {path}")
+    return real_path
+
+
+def resolve_allowed_dir(path):
+    """
+    Same as resolve_allowed_path for a directory.
+    """
+    real_path = _resolve_in_roots(path)
+    if not os.path.isdir(real_path):
+        raise FileNotFoundError(f"Directory does not exist: {path}")
+    return real_path
+
+
+def file_input(label, file_type, key, server_path=False):
+    """
+    Returns either a browser upload or, in server path mode, a validated local path.
+    Both can be passed straight to pandas readers.
+    """
+    if not server_path:
+        return st.file_uploader(label, type=file_type, key=key)
+    path = st.text_input(f"{label} - server path", key=f"{key}_path")
+    if not path:
+        return None
+    try:
+        return resolve_allowed_path(path, file_type)
+    except (ValueError, FileNotFoundError) as e:
+        st.error(f"❌ {e}")
+        return None
+
+
+def source_name(source):
+    """
+    Display name for an uploaded file or a server path.
+    """
+    return source if isinstance(source, str) else source.name
+
+
+def job_input(source):
+    """
+    Picklable form of an input for the job pool: the file bytes for uploads and
+    (path, mtime) for server paths, so an edited file is not served from an old job.
+    """
+    if isinstance(source, str):
+        return (source, os.stat(source).st_mtime_ns)
+    return source.getvalue()
+
+
+def input_key(source):
+    """
+    Cheap identity of an input for caching in st.session_state: the upload's
+    file_id, or (path, mtime) for a server path.
+    """
+    if isinstance(source, str):
+        return (source, os.stat(source).st_mtime_ns)
+    return source.file_id
+
+
+def open_source(source):
+    """
+    Turns an upload, a server path or a job_input value into something pandas can read.
+    """
+    if isinstance(source, bytes):
+        return BytesIO(source)
+    if isinstance(source, tuple):
+        return source[0]
+    return source
+
+
+def read_tab(source, **kwargs):
+    """
+    Reads a tab separated file. Server paths are memory mapped instead of
+    being copied into the upload buffer first.
+    """
+    source = open_source(source)
+    if isinstance(source, str):
+        kwargs.setdefault("memory_map", True)
+    return pd.read_csv(source, sep='\t', **kwargs)
@@ -0,0 +1,183 @@
+import itertools
+import json
+import os
+import selectors
+import subprocess
+import tempfile
+import threading
+
+# Seconds to wait for R to load its packages, and for one extraction
+R_STARTUP_TIMEOUT = 120
+R_REQUEST_TIMEOUT = 1800
+
+# Long-lived R process: loads Biobase and jsonlite once, then answers one JSON
+# request per stdin line with one JSON line on stdout. Everything else R prints
+# goes to stderr so it cannot be mistaken for a reply.
+R_WORKER_SCRIPT = r"""
+suppressPackageStartupMessages({
+    library(Biobase)
+    library(jsonlite)
+})
+
+reply <- function(x) {
+    cat(toJSON(x, auto_unbox = TRUE, null = "null"), "\n", sep = "", file = stdout())
+    flush(stdout())
+}
+
+write_table <- function(df, output_dir, name, feather) {
+    # Row names travel as the first column; feather keeps the column types
+    df <- cbind(data.frame(row_name = rownames(df), stringsAsFactors = FALSE), df)
+    if (feather) {
+        arrow::write_feather(df, file.path(output_dir, paste0(name, ".feather")))
+    } else {
+        write.csv(df, file.path(output_dir, paste0(name, ".csv")), row.names = FALSE)
+    }
+}
+
+write_bin <- function(x, output_dir, name, size) {
+    con <- file(file.path(output_dir, name), "wb")
+    writeBin(x, con, size = size, endian = "little")
+    close(con)
+}
+
+extract_eset <- function(rds_file, output_dir, feather, sparse_density) {
+    eset <- readRDS(rds_file)
+    feather <- isTRUE(feather) && requireNamespace("arrow", quietly = TRUE)
+
+    expr <- exprs(eset)
+    sparse <- requireNamespace("Matrix", quietly = TRUE) && (is(expr, "sparseMatrix") ||
+        (length(expr) > 0 && sum(expr != 0, na.rm = TRUE) + sum(is.na(expr)) <= sparse_density * length(expr)))
+    if (sparse) {
+        # A dgCMatrix is features x samples compressed by column, which is
+        # exactly CSR of samples x features: its slots are written as they are
+        m <- as(as(as(expr, "CsparseMatrix"), "generalMatrix"), "dMatrix")
+        write_bin(as.double(m@x), output_dir, "exprs_data.f64", 8)
+        write_bin(m@i, output_dir, "exprs_indices.i32", 4)
+        write_bin(m@p, output_dir, "exprs_indptr.i32", 4)
+        nnz <- length(m@x)
+    } else {
+        # exprs is features x samples in column-major order, which is exactly a
+        # row-major samples x features matrix: written as raw little-endian doubles
+        storage.mode(expr) <- "double"
+        write_bin(as.vector(expr), output_dir, "exprs.f64", 8)
+    }
+    writeLines(enc2utf8(sampleNames(eset)), file.path(output_dir, "sample_names.txt"), useBytes = TRUE)
+    writeLines(enc2utf8(featureNames(eset)), file.path(output_dir, "feature_names.txt"), useBytes = TRUE)
+
+    write_table(pData(eset), output_dir, "sample_metadata", feather)
+    write_table(fData(eset), output_dir, "feature_metadata", feather)
+
+    basic_info <- list(
+        num_samples = ncol(expr),
+        num_features = nrow(expr),
+        metadata_format = if (feather) "feather" else "csv",
+        matrix_format = if (sparse) "csr" else "dense"
+    )
+    if (sparse) basic_info$nnz <- nnz
+    write_json(basic_info, file.path(output_dir, "basic_info.json"), auto_unbox = TRUE)
+}
+
+input <- file("stdin", open = "r")
+reply(list(ready = TRUE))
+while (length(line <- readLines(input, n = 1)) > 0) {
+    request <- fromJSON(line)
+    result <- tryCatch({
+        sink(stderr(), type = "output")
+        extract_eset(request$rds, request$output_dir, request$feather, request$sparse_density)
+        sink()
+        list(id = request$id, ok = TRUE)
+    }, error = function(e) {
+        while (sink.number() > 0) sink()
+        list(id = request$id, ok = FALSE, error = conditionMessage(e))
+    })
+    reply(result)
+}
+"""
+
+
+class RWorkerError(RuntimeError):
+    pass
+
+
+class RWorker:
+    """
+    One persistent Rscript process. Requests are sent one at a time; the
+    process is restarted if it dies or stops answering.
+    """
+
+    def __init__(self, rscript="Rscript"):
+        self.rscript = rscript
+        self._process = None
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._script_path = None
+
+    def _start(self):
+        if self._script_path is None or not os.path.exists(self._script_path):
+            fd, self._script_path = tempfile.mkstemp(prefix="eset_worker_", suffix=".R")
+            with os.fdopen(fd, "w") as f:
+                f.write(R_WORKER_SCRIPT)
+        try:
+            self._process = subprocess.Popen(
+                [self.rscript, "--vanilla", self._script_path],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1
+            )
+        except OSError as e:
+            raise RWorkerError(f"Could not start {self.rscript}: {e}") from e
+        reply = self._read_reply(R_STARTUP_TIMEOUT)
+        if not reply.get("ready"):
+            self.stop()
+            raise RWorkerError("R worker did not start")
+
+    def _read_reply(self, timeout):
+        with selectors.DefaultSelector() as selector:
+            selector.register(self._process.stdout, selectors.EVENT_READ)
+            if not selector.select(timeout):
+                self.stop()
+                raise RWorkerError(f"R worker did not answer within {timeout} seconds")
+        line = self._process.stdout.readline()
+        if not line:
+            self.stop()
+            raise RWorkerError("R worker exited (is R with Biobase and jsonlite installed?)")
+        return json.loads(line)
+
+    def stop(self):
+        if self._process is not None:
+            self._process.kill()
+            self._process.wait()
+            self._process = None
+
+    def extract(self, rds_path, output_dir, feather=False, sparse_density=0.0, timeout=R_REQUEST_TIMEOUT):
+        """
+        Writes the ExpressionSet extraction files for rds_path into output_dir.
+        With feather the metadata is written as Feather if R has the arrow package.
+        Sparse assays, and dense ones with at most sparse_density nonzero values,
+        are written as CSR arrays if R has the Matrix package.
+        """
+        with self._lock:
+            if self._process is None or self._process.poll() is not None:
+                self._start()
+            request_id = next(self._ids)
+            self._process.stdin.write(json.dumps({"id": request_id, "rds": rds_path, "output_dir": output_dir, "feather": feather,
+                                                 "sparse_density": sparse_density}) + "\n")
+            self._process.stdin.flush()
+            reply = self._read_reply(timeout)
+        if reply.get("id") != request_id:
+            raise RWorkerError("R worker answered out of order")
+        if not reply.get("ok"):
+            raise RWorkerError(reply.get("error") or "R extraction failed")
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    """
+    Returns the R worker shared by every session of this server, created on first use.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = RWorker()
+        return _worker
@@ -0,0 +1,474 @@
+"""
+Reader for R's serialization format (readRDS), enough to decode Bioconductor
+ExpressionSets without R: XDR and native binary streams (format versions 2
+and 3) compressed with gzip, bzip2 or xz, S4 objects, environments, reference
+tables and the common ALTREP classes. Numeric vectors are decoded straight
+into numpy arrays.
+"""
+import bz2
+import gzip
+import io
+import lzma
+import struct
+
+import numpy as np
+import pandas as pd
+
+NA_INTEGER = -2 ** 31
+
+# SEXP types
+NILSXP, SYMSXP, LISTSXP, CLOSXP, ENVSXP, PROMSXP, LANGSXP = 0, 1, 2, 3, 4, 5, 6
+SPECIALSXP, BUILTINSXP, CHARSXP, LGLSXP, INTSXP, REALSXP = 7, 8, 9, 10, 13, 14
+CPLXSXP, STRSXP, DOTSXP, VECSXP, EXPRSXP, BCODESXP = 15, 16, 17, 19, 20, 21
+EXTPTRSXP, WEAKREFSXP, RAWSXP, S4SXP = 22, 23, 24, 25
+# Pseudo types used only in the serialization stream
+REFSXP, NILVALUE_SXP, GLOBALENV_SXP, UNBOUNDVALUE_SXP = 255, 254, 253, 252
+MISSINGARG_SXP, BASENAMESPACE_SXP, NAMESPACESXP, PACKAGESXP = 251, 250, 249, 248
+PERSISTSXP, EMPTYENV_SXP, BASEENV_SXP = 247, 242, 241
+ATTRLANGSXP, ATTRLISTSXP, ALTREP_SXP = 240, 239, 238
+
+_PAIRLIST_TYPES = (LISTSXP, LANGSXP, CLOSXP, PROMSXP, DOTSXP, ATTRLANGSXP, ATTRLISTSXP)
+_SPECIAL_ENVS = {GLOBALENV_SXP: "R_GlobalEnv", EMPTYENV_SXP: "R_EmptyEnv", BASEENV_SXP: "R_BaseEnv",
+                 BASENAMESPACE_SXP: "R_BaseNamespace"}
+
+
+class RDSError(ValueError):
+    """
+    The stream is not an RDS file, or uses a feature this reader does not decode.
+    """
+
+
+class RSymbol(str):
+    pass
+
+
+class RObject:
+    """
+    A decoded R value: its SEXP type, value (numpy array, list of str/None,
+    list of RObject, or list of (tag, value) pairs for pairlists) and attributes.
+    The CDR that ends a dotted pairlist is kept as a last (None, value) pair.
+    """
+    __slots__ = ("type", "value", "attributes")
+
+    def __init__(self, type, value, attributes=None):
+        self.type = type
+        self.value = value
+        self.attributes = attributes or {}
+
+    def attr(self, name, default=None):
+        return self.attributes.get(name, default)
+
+    @property
+    def classes(self):
+        cls = self.attributes.get("class")
+        return list(cls.value) if cls is not None else []
+
+    def __repr__(self):
+        return f"RObject(type={self.type}, classes={self.classes})"
+
+
+class REnvironment:
+    """
+    An R environment: its bindings by name (from the frame and the hash table).
+    """
+
+    def __init__(self):
+        self.bindings = {}
+        self.enclosure = None
+        self.attributes = {}
+        self.locked = False
+
+    def get(self, name, default=None):
+        return self.bindings.get(name, default)
+
+
+def _open_stream(source):
+    """
+    Returns a binary stream of the uncompressed serialization from a path,
+    bytes or file object, detecting gzip, bzip2 and xz by their magic bytes.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        raw = io.BytesIO(source)
+    elif isinstance(source, str):
+        raw = open(source, "rb")
+    else:
+        raw = source
+    raw = io.BufferedReader(raw) if not hasattr(raw, "peek") else raw
+    magic = raw.peek(6)[:6]
+    if magic[:2] == b"\x1f\x8b":
+        return io.BufferedReader(gzip.GzipFile(fileobj=raw), buffer_size=1024 * 1024)
+    if magic[:3] == b"BZh":
+        return io.BufferedReader(bz2.BZ2File(raw), buffer_size=1024 * 1024)
+    if magic[:6] == b"\xfd7zXZ\x00":
+        return io.BufferedReader(lzma.LZMAFile(raw), buffer_size=1024 * 1024)
+    return raw
+
+
+class _Unserializer:
+    def __init__(self, stream):
+        self.stream = stream
+        self.refs = []
+        header = self._read(2)
+        if header == b"X\n":
+            self.endian = ">"
+        elif header == b"B\n":
+            self.endian = "<"
+        elif header == b"A\n":
+            raise RDSError("ASCII RDS files are not supported")
+        else:
+            raise RDSError("Not an RDS file (unknown serialization format)")
+        self.int = np.dtype(f"{self.endian}i4")
+        self._scalar = struct.Struct(f"{self.endian}i")
+        self.double = np.dtype(f"{self.endian}f8")
+        self.version = self._int()
+        self._int()  # R version that wrote the file
+        self._int()  # minimal R version to read it
+        if self.version == 3:
+            self._read(self._int())  # native encoding
+        elif self.version != 2:
+            raise RDSError(f"Unsupported serialization version {self.version}")
+
+    def _read(self, n):
+        data = self.stream.read(n)
+        if len(data) != n:
+            raise RDSError("Unexpected end of RDS stream")
+        return data
+
+    def _int(self):
+        return self._scalar.unpack(self._read(4))[0]
+
+    def _length(self):
+        length = self._int()
+        if length == -1:
+            upper, lower = self._int(), self._int()
+            length = (upper << 32) + (lower & 0xFFFFFFFF)
+        return length
+
+    def _array(self, dtype, n):
+        # Converted to native byte order so numpy (and pandas) work on it directly
+        return np.frombuffer(self._read(n * dtype.itemsize), dtype=dtype).astype(dtype.newbyteorder("="))
+
+    def _charsxp(self, flags):
+        length = self._int()
+        if length == -1:
+            return None
+        data = self._read(length)
+        levels = flags >> 12
+        if levels & (1 << 2):
+            return data.decode("latin-1")
+        return data.decode("utf-8", errors="replace")
+
+    def _attributes(self, pairlist):
+        attributes = {}
+        for tag, value in pairlist.value if isinstance(pairlist, RObject) else []:
+            attributes[str(tag)] = value
+        return attributes
+
+    def read_item(self, flags=None):
+        flags = self._int() if flags is None else flags
+        sexp_type = flags & 0xFF
+        has_attr = bool(flags & (1 << 9))
+
+        if sexp_type == NILVALUE_SXP:
+            return None
+        if sexp_type in _SPECIAL_ENVS:
+            return RSymbol(_SPECIAL_ENVS[sexp_type])
+        if sexp_type in (UNBOUNDVALUE_SXP, MISSINGARG_SXP):
+            return None
+        if sexp_type == REFSXP:
+            index = flags >> 8 or self._int()
+            return self.refs[index - 1]
+        if sexp_type in (PERSISTSXP, NAMESPACESXP, PACKAGESXP):
+            if self._int() != 0:
+                raise RDSError("Unexpected persistent string vector")
+            names = [self._charsxp(self._int()) for _ in range(self._int())]
+            value = RSymbol(":".join(name or "" for name in names))
+            self.refs.append(value)
+            return value
+        if sexp_type == SYMSXP:
+            value = RSymbol(self.read_item() or "")
+            self.refs.append(value)
+            return value
+        if sexp_type == ENVSXP:
+            env = REnvironment()
+            self.refs.append(env)
+            env.locked = bool(self._int())
+            env.enclosure = self.read_item()
+            frame = self.read_item()
+            hashtab = self.read_item()
+            env.attributes = self._attributes(self.read_item())
+            for pairlist in [frame] + (hashtab.value if isinstance(hashtab, RObject) else []):
+                if isinstance(pairlist, RObject):
+                    for tag, value in pairlist.value:
+                        env.bindings[str(tag)] = value
+            return env
+        if sexp_type in _PAIRLIST_TYPES:
+            return self._pairlist(sexp_type, flags)
+        if sexp_type == ALTREP_SXP:
+            return self._altrep()
+        if sexp_type in (EXTPTRSXP, WEAKREFSXP):
+            value = RObject(sexp_type, None)
+            self.refs.append(value)
+            if sexp_type == EXTPTRSXP:
+                self.read_item()
+                self.read_item()
+        elif sexp_type in (SPECIALSXP, BUILTINSXP):
+            value = RObject(sexp_type, self._read(self._int()).decode("ascii"))
+        elif sexp_type == CHARSXP:
+            return self._charsxp(flags)
+        elif sexp_type in (LGLSXP, INTSXP):
+            value = RObject(sexp_type, self._array(self.int, self._length()))
+        elif sexp_type == REALSXP:
+            value = RObject(sexp_type, self._array(self.double, self._length()))
+        elif sexp_type == CPLXSXP:
+            parts = self._array(self.double, 2 * self._length())
+            value = RObject(sexp_type, parts[0::2] + 1j * parts[1::2])
+        elif sexp_type == STRSXP:
+            n = self._length()
+            value = RObject(sexp_type, [self._charsxp(self._int()) for _ in range(n)])
+        elif sexp_type in (VECSXP, EXPRSXP):
+            n = self._length()
+            value = RObject(sexp_type, [self.read_item() for _ in range(n)])
+        elif sexp_type == RAWSXP:
+            value = RObject(sexp_type, np.frombuffer(self._read(self._length()), dtype=np.uint8))
+        elif sexp_type == S4SXP:
+            value = RObject(sexp_type, None)
+        elif sexp_type == BCODESXP:
+            raise RDSError("Byte-compiled code is not supported")
+        else:
+            raise RDSError(f"Unsupported SEXP type {sexp_type}")
+        if has_attr:
+            value.attributes = self._attributes(self.read_item())
+        return value
+
+    def _pairlist(self, sexp_type, flags):
+        # Walked iteratively along the CDR so long pairlists do not recurse
+        items = []
+        result = RObject(sexp_type, items)
+        if sexp_type in (ATTRLANGSXP, ATTRLISTSXP):
+            flags |= 1 << 9
+        first = True
+        while True:
+            has_attr = bool(flags & (1 << 9))
+            has_tag = bool(flags & (1 << 10))
+            attributes = self._attributes(self.read_item()) if has_attr else {}
+            if first:
+                result.attributes = attributes
+                first = False
+            tag = self.read_item() if has_tag else None
+            items.append((tag, self.read_item()))
+            flags = self._int()
+            cdr_type = flags & 0xFF
+            if cdr_type == NILVALUE_SXP:
+                return result
+            if cdr_type not in _PAIRLIST_TYPES:
+                # Dotted pair, as in the CONS(value, info) state of ALTREP wrappers
+                items.append((None, self.read_item(flags)))
+                return result
+
+    def _altrep(self):
+        info = self.read_item()
+        state = self.read_item()
+        attributes = self._attributes(self.read_item())
+        class_name = str(info.value[0][1]) if isinstance(info, RObject) else ""
+        if class_name in ("compact_intseq", "compact_realseq"):
+            n, start, step = state.value[:3]
+            values = start + step * np.arange(int(n))
+            sexp_type = INTSXP if class_name == "compact_intseq" else REALSXP
+            value = RObject(sexp_type, values.astype(np.int32 if sexp_type == INTSXP else np.float64))
+        elif class_name == "deferred_string":
+            source = state.value[0][1] if state.type in _PAIRLIST_TYPES else state
+            value = RObject(STRSXP, _as_character(source))
+        elif class_name.startswith("wrap_"):
+            # The state is CONS(wrapped vector, metadata)
+            value = state.value[0][1] if state.type in _PAIRLIST_TYPES else state.value[0]
+        else:
+            raise RDSError(f"Unsupported ALTREP class {class_name}")
+        value.attributes = {**value.attributes, **attributes}
+        return value
+
+
+def _as_character(obj):
+    """
+    as.character() of an integer or double vector, as a deferred_string holds it.
+    """
+    if obj.type == INTSXP:
+        return [None if v == NA_INTEGER else str(v) for v in obj.value.tolist()]
+    return [None if np.isnan(v) else f"{v:.15g}" for v in obj.value.tolist()]
+
+
+def read_rds(source):
+    """
+    Decodes an RDS file (path, bytes or binary file object) into RObject,
+    REnvironment and RSymbol values.
+    """
+    stream = _open_stream(source)
+    try:
+        return _Unserializer(stream).read_item()
+    finally:
+        if isinstance(source, str):
+            stream.close()
+
+
+def slot(obj, name):
+    """
+    Slot of an S4 object; slots are stored as attributes.
+    """
+    if not isinstance(obj, RObject) or name not in obj.attributes:
+        raise RDSError(f"Missing slot {name}")
+    return obj.attributes[name]
+
+
+def vector_to_numpy(obj):
+    """
+    Atomic R vector as a numpy/pandas array: factors become Categoricals,
+    integer and logical NAs become pandas nullable types, dates datetimes.
+    """
+    if obj is None:
+        return np.array([])
+    if obj.type == STRSXP:
+        return np.array(obj.value, dtype=object)
+    values = obj.value
+    classes = obj.classes
+    if obj.type == INTSXP and "factor" in classes:
+        levels = slot(obj, "levels").value
+        return pd.Categorical.from_codes(np.where(values == NA_INTEGER, -1, values - 1), categories=levels,
+                                         ordered="ordered" in classes)
+    if obj.type in (INTSXP, LGLSXP):
+        missing = values == NA_INTEGER
+        if obj.type == LGLSXP:
+            return pd.arrays.BooleanArray(values != 0, missing) if missing.any() else values != 0
+        return pd.arrays.IntegerArray(values, missing) if missing.any() else values
+    if obj.type == REALSXP and "Date" in classes:
+        return pd.to_datetime(values, unit="D", origin="unix")
+    if obj.type == REALSXP and "POSIXct" in classes:
+        return pd.to_datetime(values, unit="s", origin="unix")
+    return values
+
+
+def row_names(obj, n):
+    """
+    row.names of a data.frame; the compact form c(NA, -n) means 1..n.
+    """
+    names = obj.attr("row.names")
+    if names is None:
+        return [str(i) for i in range(1, n + 1)]
+    if names.type == INTSXP:
+        values = names.value
+        if len(values) == 2 and values[0] == NA_INTEGER:
+            return [str(i) for i in range(1, abs(int(values[1])) + 1)]
+        return [str(v) for v in values.tolist()]
+    return list(names.value)
+
+
+def data_frame(obj):
+    """
+    R data.frame (a list with names and row.names) as a pandas DataFrame.
+    """
+    if obj is None or obj.type != VECSXP:
+        raise RDSError("Expected a data.frame")
+    names = list(obj.attr("names").value) if obj.attr("names") is not None else []
+    columns = {}
+    n = None
+    for name, column in zip(names, obj.value):
+        if not isinstance(column, RObject) or column.type == VECSXP:
+            # List columns are left out; they have no flat representation
+            continue
+        columns[name] = vector_to_numpy(column)
+        n = len(columns[name])
+    if n is None:
+        compact = obj.attr("row.names")
+        n = abs(int(compact.value[1])) if compact is not None and compact.type == INTSXP and \
+            len(compact.value) == 2 and compact.value[0] == NA_INTEGER else \
+            (len(compact.value) if compact is not None else 0)
+    return pd.DataFrame(columns, index=pd.Index(row_names(obj, n)))
+
+
+def _assay_element(assay_data, name):
+    if isinstance(assay_data, REnvironment):
+        return assay_data.get(name)
+    if isinstance(assay_data, RObject) and assay_data.type == VECSXP:
+        names = list(assay_data.attr("names").value)
+        if name in names:
+            return assay_data.value[names.index(name)]
+    return None
+
+
+def _dimnames(dimnames):
+    features = samples = None
+    if dimnames is not None:
+        if dimnames.value[0] is not None:
+            features = list(dimnames.value[0].value)
+        if dimnames.value[1] is not None:
+            samples = list(dimnames.value[1].value)
+    return features, samples
+
+
+def sparse_expression_matrix(matrix):
+    """
+    A Matrix package dgCMatrix (features x samples, compressed by column) is
+    already a CSR matrix of samples x features: its slots are used as they are.
+    """
+    from scipy.sparse import csr_matrix
+
+    n_features, n_samples = (int(v) for v in slot(matrix, "Dim").value)
+    X = csr_matrix((slot(matrix, "x").value, slot(matrix, "i").value, slot(matrix, "p").value),
+                   shape=(n_samples, n_features))
+    return (X, *_dimnames(matrix.attr("Dimnames")))
+
+
+def expression_matrix(matrix):
+    """
+    Returns (samples x features array, feature names or None, sample names or None)
+    from an R matrix, which is stored column-major as features x samples. A
+    dgCMatrix gives a scipy CSR matrix instead of an array.
+    """
+    if isinstance(matrix, RObject) and "dgCMatrix" in matrix.classes:
+        return sparse_expression_matrix(matrix)
+    if not isinstance(matrix, RObject) or matrix.type not in (REALSXP, INTSXP, LGLSXP):
+        raise RDSError("exprs is not a numeric matrix")
+    n_features, n_samples = (int(v) for v in matrix.attr("dim").value)
+    values = matrix.value.astype(np.float64, copy=False)
+    if matrix.type in (INTSXP, LGLSXP):
+        values[matrix.value == NA_INTEGER] = np.nan
+    return (values.reshape(n_samples, n_features), *_dimnames(matrix.attr("dimnames")))
+
+
+def read_expression_set(source):
+    """
+    Decodes an ExpressionSet RDS into a dict with the expression matrix
+    (samples x features float64, scipy CSR for a dgCMatrix), sample and
+    feature names, and the phenoData/featureData tables. Raises RDSError for
+    anything else, including layouts this reader does not know, so callers
+    can fall back to R.
+    """
+    try:
+        return _expression_set(read_rds(source))
+    except RDSError:
+        raise
+    except (OSError, EOFError, lzma.LZMAError, IndexError, KeyError, AttributeError, TypeError, ValueError) as e:
+        raise RDSError(f"Could not decode RDS stream: {e}") from e
+
+
+def _expression_set(eset):
+    if not isinstance(eset, RObject) or "ExpressionSet" not in eset.classes:
+        raise RDSError("Not an ExpressionSet")
+    exprs = _assay_element(slot(eset, "assayData"), "exprs")
+    if exprs is None:
+        raise RDSError("ExpressionSet has no exprs assay")
+    X, features, samples = expression_matrix(exprs)
+    sample_meta = data_frame(slot(slot(eset, "phenoData"), "data"))
+    feature_meta = data_frame(slot(slot(eset, "featureData"), "data"))
+    # Sample and feature names are the row names of the annotation tables when the matrix has none
+    samples = samples or list(sample_meta.index)
+    features = features or list(feature_meta.index)
+    if len(samples) != X.shape[0] or len(features) != X.shape[1]:
+        raise RDSError("ExpressionSet dimensions do not match its annotations")
+    if len(sample_meta) != len(samples):
+        sample_meta = pd.DataFrame(index=samples)
+    if len(feature_meta) != len(features):
+        feature_meta = pd.DataFrame(index=features)
+    sample_meta.index = pd.Index(samples)
+    feature_meta.index = pd.Index(features)
+    return {"X": X, "samples": samples, "features": features,
+            "sample_meta": sample_meta, "feature_meta": feature_meta}
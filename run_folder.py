@@ -0,0 +1,144 @@
+import os
+import xml.etree.ElementTree as ET
+
+BCL_SUFFIXES = (".bcl", ".bcl.gz", ".bcl.bgzf", ".cbcl")
+# RTAComplete.txt is what bcl2fastq waits for; the others are written by the instrument copy step
+COMPLETION_MARKERS = ["RTAComplete.txt", "CopyComplete.txt", "SequenceComplete.txt"]
+
+
+def parse_run_info(run_dir):
+    """
+    Parses RunInfo.xml into run id, instrument, flowcell, read structure and
+    flowcell layout. Returns None if the file is missing or unreadable.
+    """
+    try:
+        root = ET.parse(os.path.join(run_dir, "RunInfo.xml")).getroot()
+    except (OSError, ET.ParseError):
+        return None
+    run = root.find("Run")
+    if run is None:
+        return None
+    reads = [
+        {
+            "number": int(read.get("Number", i + 1)),
+            "cycles": int(read.get("NumCycles", 0)),
+            "is_index": read.get("IsIndexedRead", "N") == "Y",
+        }
+        for i, read in enumerate(run.findall("./Reads/Read"))
+    ]
+    layout = run.find("FlowcellLayout")
+    lanes = surfaces = swaths = tiles_per_swath = 1
+    tile_names = []
+    if layout is not None:
+        lanes = int(layout.get("LaneCount", 1))
+        surfaces = int(layout.get("SurfaceCount", 1))
+        swaths = int(layout.get("SwathCount", 1))
+        tiles_per_swath = int(layout.get("TileCount", 1))
+        tile_names = [tile.text for tile in layout.findall("./TileSet/Tiles/Tile")]
+    return {
+        "run_id": run.get("Id"),
+        "instrument": run.findtext("Instrument"),
+        "flowcell": run.findtext("Flowcell"),
+        "date": run.findtext("Date"),
+        "reads": reads,
+        "cycles": sum(read["cycles"] for read in reads),
+        "lanes": lanes,
+        "surfaces": surfaces,
+        "swaths": swaths,
+        "tiles_per_swath": tiles_per_swath,
+        "tiles": len(tile_names) or lanes * surfaces * swaths * tiles_per_swath,
+    }
+
+
+def parse_run_parameters(run_dir):
+    """
+    Picks instrument type, control software, RTA version and chemistry out of
+    RunParameters.xml (runParameters.xml on MiSeq/HiSeq). Tag names differ per
+    instrument, so the first match at any depth wins.
+    """
+    for name in ("RunParameters.xml", "runParameters.xml"):
+        try:
+            root = ET.parse(os.path.join(run_dir, name)).getroot()
+            break
+        except (OSError, ET.ParseError):
+            continue
+    else:
+        return None
+    fields = {
+        "instrument_type": ("InstrumentType", "InstrumentName", "ScannerID", "InstrumentID"),
+        "application": ("ApplicationName", "Application"),
+        "rta_version": ("RTAVersion", "RtaVersion"),
+        "chemistry": ("Chemistry", "ReagentKitVersion", "SbsConsumableVersion"),
+        "experiment": ("ExperimentName",),
+    }
+    parameters = {}
+    for field, tags in fields.items():
+        parameters[field] = next(
+            (element.text for tag in tags for element in root.iter(tag) if element.text and element.text.strip()),
+            None
+        )
+    return parameters
+
+
+def scan_run_folder(run_dir):
+    """
+    Single os.scandir walk: top-level entries, completion markers and the number
+    and total size of BCL files under Data/Intensities/BaseCalls.
+    """
+    with os.scandir(run_dir) as entries:
+        top_level = sorted(entry.name + ("/" if entry.is_dir() else "") for entry in entries)
+    markers = {marker: marker in top_level for marker in COMPLETION_MARKERS}
+    bcl_files = 0
+    bcl_bytes = 0
+    stack = [os.path.join(run_dir, "Data", "Intensities", "BaseCalls")]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.name.endswith(BCL_SUFFIXES):
+                    bcl_files += 1
+                    bcl_bytes += entry.stat(follow_symlinks=False).st_size
+    return {"top_level": top_level, "markers": markers, "bcl_files": bcl_files, "bcl_bytes": bcl_bytes}
+
+
+def suggest_bases_mask(reads, index_lengths=None):
+    """
+    --use-bases-mask from the read structure, e.g. Y151,I8,I8,Y151. When the
+    sample sheet indexes are shorter than the index reads the rest is masked
+    (I8n2); index reads with no index in the sample sheet are skipped (n8).
+    """
+    masks = []
+    index_read = 0
+    for read in reads:
+        if not read["is_index"]:
+            masks.append(f"Y{read['cycles']}")
+            continue
+        used = read["cycles"]
+        if index_lengths is not None:
+            used = min(index_lengths[index_read], read["cycles"]) if index_read < len(index_lengths) else 0
+        index_read += 1
+        if used == 0:
+            masks.append(f"n{read['cycles']}")
+        elif used < read["cycles"]:
+            masks.append(f"I{used}n{read['cycles'] - used}")
+        else:
+            masks.append(f"I{used}")
+    return ",".join(masks)
+
+
+def inspect_run_folder(run_dir):
+    """
+    Everything the submission page shows about a run folder, in one pass.
+    """
+    run_info = parse_run_info(run_dir)
+    return {
+        "run_info": run_info,
+        "run_parameters": parse_run_parameters(run_dir),
+        "bases_mask": suggest_bases_mask(run_info["reads"]) if run_info else None,
+        **scan_run_folder(run_dir),
+    }
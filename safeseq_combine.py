@@ -0,0 +1,193 @@
+import pandas as pd
+
+from path_ingest import open_source, read_tab
+
+# SafeSeq combine step. Nothing in here touches streamlit state, so it can run in the shared job pool.
+# scipy and statsmodels are imported inside the functions that use them to keep page start-up cheap.
+
+# Genes whose SafeSeq calls are back-checked against the CHIP (BC) experiment
+DEFAULT_GENE_PANEL = ['TP53', 'KRAS']
+CHIP_COLUMNS = ['SampleId','CDSChange', 'AAChange', '#UIDs/Amplicon','#Supermutants', 'Gene Name', 'Call', 'MAF[%]', 'MutantMolecules', 'GE']
+CHIP_CHUNK_ROWS = 200000
+
+def read_raw_data(tabfile):
+    df = read_tab(tabfile)
+    df = df[~df['SampleId'].str.contains('PC')]
+    df = df[~df['SampleId'].str.contains('NC')]
+    return df
+
+def read_chip_data(tabfile, gene_panel, chunksize=CHIP_CHUNK_ROWS):
+    """
+    Streams the CHIP .tab file in chunks and keeps only panel genes, the CHIP
+    columns and non-control samples, so memory follows the matching rows.
+    """
+    chunks = []
+    for chunk in read_tab(tabfile, usecols=CHIP_COLUMNS, chunksize=chunksize):
+        chunk = chunk[chunk['Gene Name'].isin(gene_panel)]
+        sample_ids = chunk['SampleId'].astype(str)
+        chunk = chunk[~(sample_ids.str.contains('PC') | sample_ids.str.contains('NC'))]
+        chunks.append(chunk)
+    if not chunks:
+        return pd.DataFrame(columns=CHIP_COLUMNS)
+    return pd.concat(chunks, ignore_index=True)
+
+def calculate_p_value_and_odds_ratio_MM(row):
+    from scipy.stats import fisher_exact
+    tumor_var = row['MM_Safeseq_t']
+    tumor_ref = row['MM_Safeseq_ref']
+    normal_var = row['MM_BC_t']
+    normal_ref = row['MM_BC_ref']
+    # Add continuity correction to avoid zeros
+    tumor_var += 0.1
+    tumor_ref += 0.1
+    normal_var += 0.1
+    normal_ref += 0.1
+    # Construct contingency table
+    contingency_table = [
+        [tumor_var, tumor_ref],
+        [normal_var, normal_ref]
+        ]
+    # Perform Fisher's Exact Test
+    odds_ratio, p_value = fisher_exact(contingency_table, alternative='greater')
+    return pd.Series({'p_value': p_value, 'odds_ratio': odds_ratio})
+
+def two_proportion_ztest(row):
+    import numpy as np
+    from statsmodels.stats.proportion import proportions_ztest
+    tumor_var = row['MM_Safeseq_t']
+    tumor_ref = row['MM_Safeseq_ref']
+    normal_var = row['MM_BC_t']
+    normal_ref = row['MM_BC_ref']    
+    # Number of "successes" in each group
+    count = np.array([tumor_var, normal_var])
+    # Total observations in each group
+    nobs = np.array([tumor_var + tumor_ref, normal_var + normal_ref])
+    stat, p_value = proportions_ztest(count, nobs, alternative='larger')
+    return pd.Series({'z_stat': stat, 'p_value': p_value})
+
+def chi_squared_test(row):
+    from scipy.stats import chi2_contingency
+    tumor_var = row['MM_Safeseq_t']
+    tumor_ref = row['MM_Safeseq_ref']
+    normal_var = row['MM_BC_t']
+    normal_ref = row['MM_BC_ref']
+    contingency_table = [[tumor_var, tumor_ref],
+                         [normal_var, normal_ref]]
+    chi2, p_value, dof, expected = chi2_contingency(contingency_table)
+    return pd.Series({'chi2': chi2, 'p_value': p_value, 'dof': dof})
+
+
+def update_result_review(df):
+    """
+    Updates the dataframe based on specific conditions for 'fisher_p_value', 'fisher_odds_ratio', and 'Call' columns.
+    Parameters:
+        df (pd.DataFrame): The input dataframe.
+    Returns:
+        pd.DataFrame: The updated dataframe.
+    """
+    # Define conditions
+    condition = (
+        (df['fisher_p_value'] > 0.01) | (df['fisher_odds_ratio'] < 2)
+    ) & (df['Call'] == 'MD')
+    # Identify rows to be changed
+    changed_rows = df[condition]
+    # Print rows that will be changed
+    print("Rows that have been changed:")
+    print(changed_rows)
+    # Apply updates based on conditions
+    df.loc[condition, 'Call'] = 'NMD'
+    df.loc[condition, 'Comment Call (Internal)'] = (
+        df['Comment Call (Internal)'].fillna('') +
+        " BC experiment did not support this mutant being detected"
+    )
+    return df, changed_rows
+
+def chip_data_process(chipdatafile, df_ResultReview_import, gene_panel=DEFAULT_GENE_PANEL):
+    df_chip_filter_selected = read_chip_data(chipdatafile, gene_panel)
+    df_chip_filter_selected['SampleId']= df_chip_filter_selected['SampleId'].astype(str).str.replace(r'BC', '', regex=True)
+    df_chip_filter_selected = df_chip_filter_selected.rename(columns={"SampleId":"SampleID"})
+    df_ResultReview_import_selected = df_ResultReview_import[((df_ResultReview_import['Call']=='MD') & (df_ResultReview_import['Gene Name'].isin(gene_panel)))]
+    merged_df = pd.merge(
+        df_ResultReview_import_selected,
+        df_chip_filter_selected,
+        on=['SampleID', 'CDSChange', 'AAChange'],
+        suffixes=('_tumor', '_normal'),
+        how='left'
+        )
+    merged_df_wBC = merged_df[~merged_df['#UIDs/Amplicon_normal'].isna()]
+    merged_df_nBC = merged_df[merged_df['#UIDs/Amplicon_normal'].isna()]
+    merged_df_wBC['MM_Safeseq_t'] = merged_df_wBC['#Supermutants_tumor']*merged_df_wBC['GE_tumor']/merged_df_wBC['#UIDs/Amplicon_tumor'] 
+    merged_df_wBC['MM_Safeseq_ref'] = (merged_df_wBC['#UIDs/Amplicon_tumor'] - merged_df_wBC['#Supermutants_tumor'])*merged_df_wBC['GE_tumor']/merged_df_wBC['#UIDs/Amplicon_tumor']
+    merged_df_wBC['MM_BC_t'] = merged_df_wBC['#Supermutants_normal']*merged_df_wBC['GE_normal']/merged_df_wBC['#UIDs/Amplicon_normal'] 
+    merged_df_wBC['MM_BC_ref'] = (merged_df_wBC['#UIDs/Amplicon_normal'] - merged_df_wBC['#Supermutants_normal'])*merged_df_wBC['GE_normal']/merged_df_wBC['#UIDs/Amplicon_normal']
+    # Combine the columns into one list
+    columns_to_fill = ['MM_Safeseq_t', 'MM_Safeseq_ref', 'MM_BC_t', 'MM_BC_ref']
+    merged_df_wBC[['fisher_p_value', 'fisher_odds_ratio']] = merged_df_wBC.apply(calculate_p_value_and_odds_ratio_MM, axis=1)
+    rows_to_update = merged_df_wBC[(merged_df_wBC['fisher_p_value'] > 0.01) | (merged_df_wBC['fisher_odds_ratio'] < 2)]
+    merged_df_wBC['key'] = merged_df_wBC['SampleID'] + '_' + merged_df_wBC['CDSChange'] + '_' + merged_df_wBC['AAChange']
+    df_ResultReview_import['key'] = df_ResultReview_import['SampleID'] + '_' + df_ResultReview_import['CDSChange'] + '_' + df_ResultReview_import['AAChange']
+    df_ResultReview_import_wBC = df_ResultReview_import.merge(
+        merged_df_wBC[['key', 'fisher_p_value', 'fisher_odds_ratio']],
+        on='key',
+        how='left'
+        )
+    df_ResultReview_import_wBC_upaded, changed_rows = update_result_review(df_ResultReview_import_wBC)
+    if changed_rows.shape == 0:  # Check if the number of rows is 0
+        print("No data need to update in this Run")
+    df_ResultReview_import.drop(columns=['key'], inplace=True)
+    return df_ResultReview_import_wBC_upaded, merged_df_wBC, rows_to_update, merged_df_nBC
+
+
+def combine_safeseq_files(raw_summary_file, run_summary_file, sample_list_file, chipdatafile=None, gene_panel=DEFAULT_GENE_PANEL):
+    """
+    Runs the whole combine step on job_input() values and returns a dict of the
+    resulting tables. The CHIP tables are only present when chipdatafile is given.
+    """
+    # Read and preprocess the raw summary file
+    df1_summary_tab = read_tab(raw_summary_file)
+    df1_summary_tab = df1_summary_tab[~df1_summary_tab['SampleId'].str.contains('PC')]
+    df1_summary_tab = df1_summary_tab[~df1_summary_tab['SampleId'].str.contains('NTC')]
+    Samplelist = list(set(df1_summary_tab['SampleId'].to_list()))
+        
+    # Read the run summary file
+    df_RunSumm = pd.read_excel(open_source(run_summary_file), sheet_name='7 Run Summary').dropna()
+    df_AE_input = pd.read_excel(open_source(run_summary_file), sheet_name='9 SafeSEQ AE input')
+    FlowCellID = df_AE_input.loc[df_AE_input['[Header]'] == 'Description', 'Unnamed: 1'].values[0]
+    df_RunSumm.loc[:, 'FlowcellID'] = FlowCellID
+    df_RunSumm = df_RunSumm.drop(columns=['#'])
+
+    # Read the sample list file
+    dfs_slf_samplelist = pd.read_excel(open_source(sample_list_file), sheet_name='Sample List 2.1', skiprows=4)
+    filtered_df = dfs_slf_samplelist[dfs_slf_samplelist['Inostics ID'].isin(Samplelist)]
+    filtered_df = filtered_df[['Inostics ID', 'External ID1\n(Patient ID-Visit)',
+                               'External ID2\n(Collection datetime)', 'Scan External Barcode ']]
+    filtered_df['External ID2\n(Collection datetime)'] = filtered_df['External ID2\n(Collection datetime)'].astype(str).str.replace(r'\.0$', '', regex=True)
+    Sample_mapping = filtered_df.groupby("Inostics ID", as_index=False).first()
+    sample_mapping_df = Sample_mapping.rename(columns={
+        'Inostics ID': 'Inostics ID',
+        'External ID1\n(Patient ID-Visit)': 'External ID1',
+        'External ID2\n(Collection datetime)': 'External ID2',
+        'Scan External Barcode ': 'External ID3'
+    })
+
+    df_ResultsReview = df1_summary_tab.rename(columns={'Sample ID':'SampleID', 'Total DNA Amount (GE)':'GE', 'Amplicon ID':'AmpliconID', 'CDS Change':'CDSChange', 'AA Change':'AAChange', 'MAF [%]':'MAF[%]', 'Mutant Molecules':'MutantMolecules', 'COSMIC ID':'COSMICID', 'Base specific Cut-off':'Cutoff', 'Comment Call':'UpdateComment'})
+    merged_df = df_ResultsReview.merge(sample_mapping_df, left_on='SampleId', right_on='Inostics ID', how='right')
+    columns_to_drop = ['Raw Call', 'Reference Transcript ID', 'RUNID', 'SWVersion', 'Config File Name', 'userid', 'machineid', 'ChangeType', 'AvgMutantBaseQuality', 'CoverageStatus', '#positiveWells', 'LoB', 'LoQ', 'MutationHash', 'Mutation classification', 'timestamp', 'indexPlate', 'ampliconPosition', 'ML Plasma', 'MM/ML Plasma', 'MM corrected']
+    merged_df = merged_df.drop(columns=columns_to_drop)
+    merged_df2 = merged_df.merge(df_RunSumm, left_on='SampleId', right_on='Sample_ID', how='left')
+    merged_df2 = merged_df2.rename(columns={'SampleId':'SampleID'})
+    columns_to_drop2 = ['Inostics ID','External ID2', 'External ID3', 'Sample_ID', 'Plasma Vol. [mL]', 'FlowcellID']
+    merged_df2 = merged_df2.drop(columns=columns_to_drop2)
+    Order_list = ['FlowCellID', 'SampleID', 'Comment Call (Internal)', 'Comment Call (External)', 'Call', 'AmpliconID', 'GE', 'Gene Name', 'CDSChange', 'AAChange', 'MAF[%]', 'MutantMolecules', 'CosmicID', 'dbSNP', 'ClinVar', 'Raw Call', 'OOS', 'hg19Pos', '#UIDs/Amplicon', '#Supermutants', 'Cutoff', 'UpdateComment', 'Assay variant', 'Qubit Run ID', 'UID-PCR input (ng/116µl)', 'UID-PCR ID', 'UID-PCR wells', 'Index-PCR ID', 'NextSeq ID']
+    df_ResultReview_import = merged_df2.reindex(columns=Order_list)
+    results = {
+        "df1_summary_tab": df1_summary_tab,
+        "df_RunSumm": df_RunSumm,
+        "sample_mapping_df": sample_mapping_df,
+    }
+    ###Add integrate code after this step if CHIP data is available
+    if chipdatafile is not None:
+        df_ResultReview_import, merged_df_wBC ,rows_to_update, merged_df_nBC = chip_data_process(chipdatafile, df_ResultReview_import, gene_panel)
+        results.update(merged_df_wBC=merged_df_wBC, rows_to_update=rows_to_update, merged_df_nBC=merged_df_nBC)
+    results["df_ResultReview_import"] = df_ResultReview_import
+    return results
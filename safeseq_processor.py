@@ -0,0 +1,252 @@
+import pandas as pd
+
+from path_ingest import open_source
+
+# SafeSeq processor step. Nothing in here touches streamlit state, so it can run in the shared job pool.
+
+
+def load_processor_inputs(sample_list_file, result_review_file):
+    """
+    Reads the sample list and result review workbooks from job_input() values.
+    Returns (df_SampleData, df_RR_Sample_Information, df_RR_RawData).
+    """
+    df_SampleData = pd.read_excel(open_source(sample_list_file), sheet_name='SampleDataFile')
+    df_RR_Sample_Information = pd.read_excel(open_source(result_review_file), sheet_name='Sample Information')
+    df_RR_RawData = pd.read_excel(open_source(result_review_file), sheet_name='RawData')
+    df_SampleData['ReportDate'] = df_SampleData['ReportDate'].astype(str)
+    return df_SampleData, df_RR_Sample_Information, df_RR_RawData
+
+
+def build_sample_information(df_RR_Sample_Information):
+    # Prepare final sample info (as you did previously)
+    df_final_sample_inf = df_RR_Sample_Information.rename(columns={
+        'Sample ID': 'SAMPID',
+        'External ID1': 'SUBJID',
+        'External ID2': 'SPECID',
+        'External ID3': 'SPECID2',
+        'Volume (mL)': 'VOLUME'
+    })
+    return df_final_sample_inf
+
+
+def build_variant_summary(df_SampleData, df_RR_RawData):
+    df_RR_Variants = df_RR_RawData[df_RR_RawData['Call'] == 'MD']
+    df_merged = pd.merge(
+        df_SampleData,
+        df_RR_Variants,
+        left_on='InosticsID',   # key in df_SampleData
+        right_on='Sample ID', # key in df_RR_Variants
+        how='right'           # or 'left', 'right', 'outer' depending on your needs
+        )
+    df_merged = df_merged.rename(columns={
+        'Study': 'PROTOCOL',
+        'Visit': 'VISIT',
+        'Collection Date': 'CTDNADT',
+        'Collection Time': 'CTDNATM',
+        'SampleID': 'SUBJID',
+        'InosticsID': 'SAMPID',
+        'Total DNA Amount (GE)': 'TOTDNAMT',
+        'Gene Name': 'GNNAME',
+        'COSMIC ID': 'Cosmic ID',
+        'MAF [%]': 'MAF[%]',
+        'Mutant Molecules': 'MUTMOL',
+        'Call': 'CALL',
+        'Base specific Cut-off': 'Base Specific Cut-off',
+        '#UIDs/Amplicon': 'UIDAMP',
+        '#Supermutants': 'SUPMUT',
+        'Comment Call': 'COMMCALL'
+         # If you want to standardize Amplicon ID, CDS Change, AA Change, ClinVar, dbSNP
+            # just leave them as is or rename them accordingly
+    })
+    final_columns = [
+        'PROTOCOL', 'VISIT', 'CTDNADT', 'CTDNATM', 'SAMPID', 'SUBJID',
+        'TOTDNAMT', 'GNNAME', 'Amplicon ID', 'CDS Change', 'AA Change',
+        'Cosmic ID', 'ClinVar', 'dbSNP', 'MAF[%]', 'MUTMOL', 'CALL',
+        'Base Specific Cut-off', 'UIDAMP', 'SUPMUT', 'COMMCALL'
+        ]
+    df_final_variants = df_merged[final_columns]
+    def variant_data_format_modification(df):
+        df['PROTOCOL'] = df['PROTOCOL'].apply(lambda x: x.split()[0])
+        df['CTDNADT'] = pd.to_datetime(df['CTDNADT'], errors='coerce').dt.strftime('%d %b %Y')
+        df['CTDNATM'] = df['CTDNATM'].astype(str).str.replace(r'(\d{2}:\d{2}):\d{2}', r'\1', regex=True)
+        df['SUPMUT'] = df['SUPMUT'].astype(int).astype(str)
+        df = df.astype(str)
+        return df
+    df_final_variants = variant_data_format_modification(df_final_variants)
+    return df_final_variants
+
+
+def build_gene_summary(df_SampleData, df_RR_Sample_Information, df_RR_RawData):
+    tmp_merged_table = df_RR_Sample_Information
+    gene_list = list(set(df_RR_RawData['Gene Name'].to_list()))
+    gene_subtables = {}
+    for gene in gene_list:
+        # Filter for 'Gene Name' == gene and 'Call' == "MD"
+        gene_subtables[gene] = df_RR_RawData[
+        (df_RR_RawData['Gene Name'] == gene) & (df_RR_RawData['Call'] == "MD")
+        ]
+        # Select specific columns
+        # Check if the table is empty
+        if gene_subtables[gene].empty:
+            gene_subtables[gene][gene] = "NMD"
+        else:
+            # Add a column 'Status' with the gene name for non-empty tables
+            gene_subtables[gene][gene] = 'MD'
+            gene_subtables[gene] = gene_subtables[gene][['Sample ID', gene]]
+
+        tmp_merged_table = pd.merge(tmp_merged_table,
+                gene_subtables[gene][['Sample ID', gene]],
+                on='Sample ID',
+                how='left')
+        tmp_merged_table[gene] = tmp_merged_table[gene].fillna('NMD')
+
+    df_total_ge = df_RR_RawData[["Sample ID", 'Total DNA Amount (GE)']].groupby('Sample ID').first().reset_index()
+    tmp_merged_table['Overall Status'] = tmp_merged_table[gene_list].apply(
+        lambda row: 'MD' if 'MD' in row.values else 'NMD',
+        axis=1
+        )
+    tmp_merged_table = pd.merge(tmp_merged_table,
+        df_total_ge,
+        on='Sample ID',
+        how='left')
+    column_order = ['Sample ID', 'External ID1', 'External ID2', 'External ID3',
+       'Total DNA Amount (GE)', 'Overall Status'] + gene_list
+    df_gene_summary = tmp_merged_table[column_order]
+    df_merged_gene_summary = pd.merge(
+        df_SampleData,
+        df_gene_summary,
+        left_on='InosticsID',   # key in df_SampleData
+        right_on='Sample ID', # key in df_RR_Variants
+        how='right'           # or 'left', 'right', 'outer' depending on your needs
+        )
+    df_merged_gene_summary = df_merged_gene_summary.rename(columns={
+        'Study': 'PROTOCOL',
+        'Visit': 'VISIT',
+        'Collection Date': 'CTDNADT',
+        'Collection Time': 'CTDNATM',
+        'SampleID': 'SUBJID',
+        'InosticsID': 'SAMPID',
+        'Total DNA Amount (GE)': 'TOTDNAMT',
+        'Gene Name': 'GNNAME',
+        'COSMIC ID': 'Cosmic ID',
+        'MAF [%]': 'MAF[%]',
+        'Mutant Molecules': 'MUTMOL',
+        'Call': 'CALL',
+        'Base specific Cut-off': 'Base Specific Cut-off',
+        '#UIDs/Amplicon': 'UIDAMP',
+        '#Supermutants': 'SUPMUT',
+        'External ID3': 'SPECID',
+        'External ID2': 'SPECID2',
+        'Sample Comment': 'COMMENT',
+        'Overall Status':'STATUS',
+        # If you want to standardize Amplicon ID, CDS Change, AA Change, ClinVar, dbSNP
+        # just leave them as is or rename them accordingly
+         })
+    final_columns_gene = ['PROTOCOL', 'VISIT', 'CTDNADT', 'CTDNATM', 'SAMPID', 'SUBJID', 'SPECID',
+             'SPECID2', 'TOTDNAMT', 'STATUS' ] + gene_list + ['COMMENT']
+    df_final_genes = df_merged_gene_summary[final_columns_gene]
+    def gene_data_format_modification(df):
+        df['PROTOCOL'] = df['PROTOCOL'].apply(lambda x: x.split()[0])
+        df['CTDNATM'] = df['CTDNATM'].astype(str).str.replace(r'(\d{2}:\d{2}):\d{2}', r'\1', regex=True)
+        df['CTDNADT'] = pd.to_datetime(df['CTDNADT'], errors='coerce').dt.strftime('%d %b %Y')
+        df = df.astype(str)
+    df_final_genes = gene_data_format_modification(df_final_genes)
+    df_final_genes = df_merged_gene_summary[final_columns_gene]
+    df_final_genes['CTDNADT'] = df_final_genes['CTDNADT'].astype("string")
+    df_final_genes['CTDNATM'] = df_final_genes['CTDNATM'].astype("string")
+    return df_final_genes
+
+
+def build_mutant_summary(df_SampleData, df_RR_Sample_Information, df_RR_RawData):
+    tmp_merged_table = df_RR_Sample_Information
+    gene_list = list(set(df_RR_RawData['Gene Name'].to_list()))
+    gene_subtables = {}
+    for gene in gene_list:
+        # Filter for 'Gene Name' == gene and 'Call' == "MD"
+        gene_subtables[gene] = df_RR_RawData[
+            (df_RR_RawData['Gene Name'] == gene) & (df_RR_RawData['Call'] == "MD")
+        ]
+        # Select specific columns
+        # Check if the table is empty
+        if gene_subtables[gene].empty:
+            gene_subtables[gene][gene] = "NMD"
+        else:
+            # Add a column 'Status' with the gene name for non-empty tables
+            gene_subtables[gene][gene] = 'MD'
+            gene_subtables[gene] = gene_subtables[gene][['Sample ID', gene]]
+
+        tmp_merged_table = pd.merge(tmp_merged_table,
+                gene_subtables[gene][['Sample ID', gene]],
+                on='Sample ID',
+                how='left')
+        tmp_merged_table[gene] = tmp_merged_table[gene].fillna('NMD')
+
+    df_total_ge = df_RR_RawData[["Sample ID", 'Total DNA Amount (GE)']].groupby('Sample ID').first().reset_index()
+    tmp_merged_table['Overall Status'] = tmp_merged_table[gene_list].apply(
+        lambda row: 'MD' if 'MD' in row.values else 'NMD',
+        axis=1
+        )
+    tmp_merged_table = pd.merge(tmp_merged_table,
+        df_total_ge,
+        on='Sample ID',
+        how='left')
+    def get_description(row, df_RR_RawData):
+        # Genes to check
+        gene_list = list(set(df_RR_RawData['Gene Name'].to_list()))
+        genes = gene_list
+        # List to store mutation descriptions
+        descriptions = []
+        # Check each gene with MD status
+        for gene in genes:
+            try:  
+                if row[gene] == 'MD':
+                # Filter the raw data based on Sample ID, Call, and Gene Name
+                    mutant_df = df_RR_RawData[
+                        (df_RR_RawData['Sample ID'] == row['Sample ID']) &
+                        (df_RR_RawData['Call'] == 'MD') &
+                        (df_RR_RawData['Gene Name'] == gene)
+                        ]
+                    # If mutations found, format each mutation
+                    if not mutant_df.empty:
+                        for _, mut_row in mutant_df.iterrows():
+                            description = f"{mut_row['Gene Name']} | {mut_row['CDS Change']} | {mut_row['MAF [%]']} | {mut_row['Mutant Molecules']}"
+                            descriptions.append(description)
+                    # Join multiple descriptions with newline if multiple exist
+            except Exception as e:
+                pass
+        return '\n'.join(descriptions) if descriptions else 'NMD'
+            # Apply the function to create the Description column
+    tmp_merged_table['Description   | Gene Name | CDS Change | MAF | MM'] = tmp_merged_table.apply(
+            lambda row: get_description(row, df_RR_RawData),
+            axis=1
+            )
+    df_mutant_summary = tmp_merged_table
+    df_merged_mutant_summary = pd.merge(
+        df_SampleData,
+        df_mutant_summary,
+        left_on='InosticsID',   # key in df_SampleData
+        right_on='Sample ID', # key in df_RR_Variants
+        how='right'           # or 'left', 'right', 'outer' depending on your needs
+        )
+    df_merged_mutant_summary_rename = df_merged_mutant_summary.rename(columns={
+        'Study': 'PROTOCOL',
+        'Visit': 'VISIT',
+        'Collection Date': 'CTDNADT',
+        'Collection Time': 'CTDNATM',
+        'InosticsID': 'SAMPID',
+        'External ID1':'SUBJID',
+        'External ID2':'SPECID',
+        'External ID3':'SPECID2',
+        'Overall Status':'STATUS',
+        'Total DNA Amount (GE)':'TOTDNAMT',
+        'Description   | Gene Name | CDS Change | MAF | MM':'DESCRP',
+        })
+    final_order = ['PROTOCOL', 'VISIT', 'CTDNADT', 'CTDNATM', 'SAMPID', 'SUBJID', 'SPECID', 'SPECID2', 'TOTDNAMT', 'STATUS', 'DESCRP']
+    df_mutant_summary_rename_reorder = df_merged_mutant_summary_rename[final_order]
+    def mutant_data_format_modification(df):
+        df['PROTOCOL'] = df['PROTOCOL'].apply(lambda x: x.split()[0])
+        df['CTDNATM'] = df['CTDNATM'].astype(str).str.replace(r'(\d{2}:\d{2}):\d{2}', r'\1', regex=True)
+        df['CTDNADT'] = pd.to_datetime(df['CTDNADT'], errors='coerce').dt.strftime('%d %b %Y')
+        return df
+    df_final_mutant_summary = mutant_data_format_modification(df_mutant_summary_rename_reorder)
+    return df_final_mutant_summary
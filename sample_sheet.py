@@ -0,0 +1,158 @@
+import csv
+import hashlib
+
+import pandas as pd
+
+REQUIRED_COLUMNS = ["Sample_ID", "Sample_Name", "index"]
+# Sections bcl2fastq reads; anything else is kept but reported
+KNOWN_SECTIONS = ("Header", "Reads", "Settings", "Data", "ManifestFiles")
+
+
+class SampleSheet:
+    """
+    A sample sheet parsed in one pass: key/value [Header] and [Settings],
+    [Reads] cycle counts, the [Data] table and line-numbered diagnostics.
+    """
+
+    def __init__(self):
+        self.header = {}
+        self.reads = []
+        self.settings = {}
+        self.sections = []
+        self.data_columns = []
+        self.data = pd.DataFrame()
+        # (line number, "error" or "warning", message)
+        self.diagnostics = []
+
+    @property
+    def errors(self):
+        return [d for d in self.diagnostics if d[1] == "error"]
+
+    @property
+    def warnings(self):
+        return [d for d in self.diagnostics if d[1] == "warning"]
+
+    @property
+    def is_valid(self):
+        return not self.errors
+
+    def message(self):
+        """
+        Summary line for the page, in the style of the old validate_sample_sheet messages.
+        """
+        if self.is_valid:
+            return "Sample sheet is valid"
+        line, _, text = self.errors[0]
+        return f"{text} (line {line})" if line else text
+
+    def index_lengths(self):
+        """
+        Longest i7 and i5 index in the [Data] section, for the bases mask.
+        """
+        return [
+            int(self.data[column].str.len().max()) if column in self.data.columns and len(self.data) else 0
+            for column in ("index", "index2")
+        ]
+
+    def _add(self, line, level, message):
+        self.diagnostics.append((line, level, message))
+
+
+def content_hash(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def parse_sample_sheet(content):
+    """
+    Parses sample sheet text into a SampleSheet. Never raises: problems are
+    collected as diagnostics so the page can show all of them at once.
+    """
+    sheet = SampleSheet()
+    if not content or not content.strip():
+        sheet._add(0, "error", "Sample sheet is empty")
+        return sheet
+
+    section = None
+    data_rows = []
+    data_lines = []
+    seen = set()
+    # Illumina Experiment Manager pads every line with trailing commas
+    for number, row in enumerate(csv.reader(content.lstrip("\ufeff").splitlines()), start=1):
+        while row and not row[-1].strip():
+            row.pop()
+        if not row:
+            continue
+        first = row[0].strip()
+        if first.startswith("[") and first.endswith("]"):
+            section = first[1:-1]
+            if section in seen:
+                sheet._add(number, "error", f"Duplicate [{section}] section")
+            elif section not in KNOWN_SECTIONS:
+                sheet._add(number, "warning", f"Unknown section [{section}]")
+            seen.add(section)
+            sheet.sections.append(section)
+            continue
+        if section is None:
+            sheet._add(number, "error", "Line outside of any section")
+        elif section in ("Header", "Settings"):
+            target = sheet.header if section == "Header" else sheet.settings
+            target[first] = row[1].strip() if len(row) > 1 else ""
+        elif section == "Reads":
+            try:
+                sheet.reads.append(int(first))
+            except ValueError:
+                sheet._add(number, "error", f"[Reads] entry is not a cycle count: {first}")
+        elif section == "Data":
+            if not sheet.data_columns:
+                sheet.data_columns = [column.strip() for column in row]
+                continue
+            cells = [cell.strip() for cell in row]
+            if len(cells) > len(sheet.data_columns):
+                sheet._add(number, "error",
+                           f"Row has {len(cells)} fields but the [Data] header has {len(sheet.data_columns)}")
+                cells = cells[:len(sheet.data_columns)]
+            data_rows.append(cells + [""] * (len(sheet.data_columns) - len(cells)))
+            data_lines.append(number)
+
+    if "Header" not in seen:
+        sheet._add(0, "error", "Missing [Header] section")
+    if "Data" not in seen:
+        sheet._add(0, "error", "Missing [Data] section")
+        return sheet
+    if not data_rows:
+        sheet._add(0, "error", "No sample data found in [Data] section")
+        return sheet
+
+    for column in REQUIRED_COLUMNS:
+        if column not in sheet.data_columns:
+            sheet._add(0, "error", f"Missing required column: {column}")
+    duplicated_columns = {c for c in sheet.data_columns if sheet.data_columns.count(c) > 1}
+    if duplicated_columns:
+        sheet._add(0, "error", f"Duplicate [Data] columns: {', '.join(sorted(duplicated_columns))}")
+        return sheet
+
+    sheet.data = pd.DataFrame(data_rows, columns=sheet.data_columns)
+    sheet.data.index = pd.Index(data_lines, name="line")
+    _check_data(sheet)
+    return sheet
+
+
+def _check_data(sheet):
+    df = sheet.data
+    if "Sample_ID" in df.columns:
+        for line in df.index[df["Sample_ID"] == ""]:
+            sheet._add(line, "error", "Empty Sample_ID")
+        # The same sample may be loaded on several lanes, but only once per lane
+        keys = ["Lane", "Sample_ID"] if "Lane" in df.columns else ["Sample_ID"]
+        duplicated = df[df.duplicated(keys, keep="first") & (df["Sample_ID"] != "")]
+        for line, sample_id in duplicated["Sample_ID"].items():
+            sheet._add(line, "error", f"Duplicate Sample_ID: {sample_id}")
+    for column in ("index", "index2"):
+        if column not in df.columns:
+            continue
+        invalid = df[(df[column] != "") & ~df[column].str.upper().str.fullmatch(r"[ACGTN]+")]
+        for line, value in invalid[column].items():
+            sheet._add(line, "error", f"Invalid {column} sequence: {value}")
+        lengths = df.loc[df[column] != "", column].str.len()
+        if lengths.nunique() > 1:
+            sheet._add(0, "warning", f"{column} lengths differ: {', '.join(map(str, sorted(lengths.unique())))}")
@@ -1,15 +1,27 @@
-import io
-import os
-import pandas as pd
 import streamlit as st
 import warnings
 
+from export_queue import submit_export, render_export_status
+from job_pool import job_result, job_state, render_job_status, submit_job
+from path_ingest import file_input, input_key, job_input, source_name
+from safeseq_processor import (
+    build_gene_summary,
+    build_mutant_summary,
+    build_sample_information,
+    build_variant_summary,
+    load_processor_inputs,
+)
+
 warnings.filterwarnings("ignore")  # Suppress warnings
 
 st.title("SafeSaq Data Processor")
 
-sample_list_file = st.file_uploader("Upload Sample List File", type=["xlsx"])
-result_review_file = st.file_uploader("Upload Result Review File", type=["xlsx"])
+# Large workbooks can be read straight from the server instead of going through the browser upload
+input_mode = st.radio("Input source", ["Upload files", "Server paths"], horizontal=True)
+server_path = input_mode == "Server paths"
+
+sample_list_file = file_input("Upload Sample List File", ["xlsx"], "sample_list_file", server_path)
+result_review_file = file_input("Upload Result Review File", ["xlsx"], "result_review_file", server_path)
 
 def display_dataframe(df, title):
     st.subheader(title)
@@ -35,308 +47,90 @@ if "df_final_genes" not in st.session_state:
 if "df_final_mutant_summary" not in st.session_state:
     st.session_state.df_final_mutant_summary = None
 
+###Background processing and export jobs
+for section_key in ["sample", "variant", "gene", "mutant"]:
+    if f"{section_key}_job_id" not in st.session_state:
+        st.session_state[f"{section_key}_job_id"] = None
+        st.session_state[f"{section_key}_output_path"] = None
+        st.session_state[f"{section_key}_export_id"] = None
+
+def processing_section(section_key, button_label, path_label, default_path, fn, args, result_key, sheet_name, download_label):
+    """
+    Output path, button and status for one processing step. The step runs in the
+    shared worker pool and its workbook is written by the background export queue.
+    """
+    output_path = st.text_input(path_label, default_path)
+    if st.button(button_label):
+        st.session_state[f"{section_key}_job_id"] = submit_job(fn, *args)
+        st.session_state[f"{section_key}_output_path"] = output_path
+        # Identical inputs reuse the finished job, so make sure its result is applied and exported again
+        st.session_state[f"{section_key}_job_applied"] = None
+
+    def apply_result(df):
+        st.session_state[result_key] = df
+        if not df.empty:
+            st.session_state[f"{section_key}_export_id"] = submit_export(st.session_state[f"{section_key}_output_path"], [(sheet_name, df)])
+
+    if st.session_state[f"{section_key}_job_id"] is not None:
+        render_job_status(st.session_state[f"{section_key}_job_id"], f"{section_key}_job", apply_result)
+    if st.session_state[f"{section_key}_export_id"] is not None:
+        render_export_status(st.session_state[f"{section_key}_export_id"], download_label, key=f"{section_key}_export")
 
-if sample_list_file and result_review_file:
-    st.success("Files uploaded successfully!")
 
+if sample_list_file and result_review_file:
     # Display file names
-    st.write("**Sample List File:**", sample_list_file.name)
-    st.write("**Result Review File:**", result_review_file.name)
-
-    # Read data
-    df_SampleData = pd.read_excel(sample_list_file, sheet_name='SampleDataFile')
-    df_RR_Sample_Information = pd.read_excel(result_review_file, sheet_name='Sample Information')
-    df_RR_RawData = pd.read_excel(result_review_file, sheet_name='RawData')
-    df_SampleData['ReportDate'] = df_SampleData['ReportDate'].astype(str)
-    tmp_merged_table = df_RR_Sample_Information
-
-    st.session_state.df_SampleData = df_SampleData
-    st.session_state.df_RR_RawData = df_RR_RawData
-
-    output_file_path_sample = st.text_input("Enter the full path for the Sample Information File", "/Users/user_defined_path/Sample_output.xlsx")
-
-    # Button to combine and process
-    if st.button("Combine and Process Sample Information"):
-        # Prepare final sample info (as you did previously)
-        df_final_sample_inf = df_RR_Sample_Information.rename(columns={
-            'Sample ID': 'SAMPID',
-            'External ID1': 'SUBJID',
-            'External ID2': 'SPECID',
-            'External ID3': 'SPECID2',
-            'Volume (mL)': 'VOLUME'
-        })
-
-#        st.subheader("Final Sample Information")
-#        st.dataframe(df_final_sample_inf)
-        st.session_state.df_final_sample_inf = df_final_sample_inf
-
-        # Try to save to the specified local path exactly as in the working code
-        if not df_final_sample_inf.empty:
-            try:
-                # Write to the specified output file
-                with pd.ExcelWriter(output_file_path_sample, engine='openpyxl') as writer:
-                    df_final_sample_inf.to_excel(writer, sheet_name="Sample_Info", index=False)
-            
-                st.success(f"File saved successfully to: {output_file_path_sample}")
-
-            except Exception as e:
-                st.error(f"Failed to save the file locally: {e}")
+    st.write("**Sample List File:**", source_name(sample_list_file))
+    st.write("**Result Review File:**", source_name(result_review_file))
+
+    # Read data in the shared worker pool. The job is submitted once per pair of inputs, so reruns
+    # do not hash the full uploads again just to find it; a failed load is resubmitted on request
+    inputs_key = (input_key(sample_list_file), input_key(result_review_file))
+    if st.session_state.get("inputs_job_key") != inputs_key or job_state(st.session_state.inputs_job_id) is None \
+            or st.session_state.pop("inputs_job_retry", False):
+        st.session_state.inputs_job_id = submit_job(load_processor_inputs, job_input(sample_list_file), job_input(result_review_file))
+        st.session_state.inputs_job_key = inputs_key
+    inputs_job_id = st.session_state.inputs_job_id
+    if job_state(inputs_job_id) != "done":
+        render_job_status(inputs_job_id, "inputs_job", lambda result: None)
+        if job_state(inputs_job_id) == "failed":
+            st.button("Retry loading the files", on_click=lambda: st.session_state.update(inputs_job_retry=True))
+    else:
+        st.success("Files loaded successfully!")
+        df_SampleData, df_RR_Sample_Information, df_RR_RawData = job_result(inputs_job_id)
+
+        st.session_state.df_SampleData = df_SampleData
+        st.session_state.df_RR_RawData = df_RR_RawData
+
+        processing_section(
+            "sample", "Combine and Process Sample Information",
+            "Enter the full path for the Sample Information File", "/Users/user_defined_path/Sample_output.xlsx",
+            build_sample_information, (df_RR_Sample_Information,),
+            "df_final_sample_inf", "Sample_Info", "Download Sample Information File"
+        )
 
 ####
-    output_file_path_variant = st.text_input("Enter the full path for the Variants Summary Information File", "/Users/user_defined_path/Variant_output.xlsx")
-    if st.button("Combine and Process Variants Information"):
-        df_RR_Variants = df_RR_RawData[df_RR_RawData['Call'] == 'MD']
-        df_merged = pd.merge(
-            df_SampleData,
-            df_RR_Variants,
-            left_on='InosticsID',   # key in df_SampleData
-            right_on='Sample ID', # key in df_RR_Variants
-            how='right'           # or 'left', 'right', 'outer' depending on your needs
-            )
-        df_merged = df_merged.rename(columns={
-            'Study': 'PROTOCOL',
-            'Visit': 'VISIT',
-            'Collection Date': 'CTDNADT',
-            'Collection Time': 'CTDNATM',
-            'SampleID': 'SUBJID',
-            'InosticsID': 'SAMPID',
-            'Total DNA Amount (GE)': 'TOTDNAMT',
-            'Gene Name': 'GNNAME',
-            'COSMIC ID': 'Cosmic ID',
-            'MAF [%]': 'MAF[%]',
-            'Mutant Molecules': 'MUTMOL',
-            'Call': 'CALL',
-            'Base specific Cut-off': 'Base Specific Cut-off',
-            '#UIDs/Amplicon': 'UIDAMP',
-            '#Supermutants': 'SUPMUT',
-            'Comment Call': 'COMMCALL'
-             # If you want to standardize Amplicon ID, CDS Change, AA Change, ClinVar, dbSNP
-                # just leave them as is or rename them accordingly
-        })
-        final_columns = [
-            'PROTOCOL', 'VISIT', 'CTDNADT', 'CTDNATM', 'SAMPID', 'SUBJID',
-            'TOTDNAMT', 'GNNAME', 'Amplicon ID', 'CDS Change', 'AA Change',
-            'Cosmic ID', 'ClinVar', 'dbSNP', 'MAF[%]', 'MUTMOL', 'CALL',
-            'Base Specific Cut-off', 'UIDAMP', 'SUPMUT', 'COMMCALL'
-            ]
-        df_final_variants = df_merged[final_columns]
-        def variant_data_format_modification(df):
-            df['PROTOCOL'] = df['PROTOCOL'].apply(lambda x: x.split()[0])
-            df['CTDNADT'] = pd.to_datetime(df['CTDNADT'], errors='coerce').dt.strftime('%d %b %Y')
-            df['CTDNATM'] = df['CTDNATM'].astype(str).str.replace(r'(\d{2}:\d{2}):\d{2}', r'\1', regex=True)
-            df['SUPMUT'] = df['SUPMUT'].astype(int).astype(str)
-            df = df.astype(str)
-            return df
-        df_final_variants = variant_data_format_modification(df_final_variants)
-        st.session_state.df_final_variants = df_final_variants      
-
-        if not df_final_variants.empty:
-            try:
-                # Write to the specified output file
-                with pd.ExcelWriter(output_file_path_variant, engine='openpyxl') as writer:
-                    df_final_variants.to_excel(writer, sheet_name="Sample_Info", index=False)
-
-                st.success(f"File saved successfully to: {output_file_path_variant}")
-
-            except Exception as e:
-                st.error(f"Failed to save the file locally: {e}")
+        processing_section(
+            "variant", "Combine and Process Variants Information",
+            "Enter the full path for the Variants Summary Information File", "/Users/user_defined_path/Variant_output.xlsx",
+            build_variant_summary, (df_SampleData, df_RR_RawData),
+            "df_final_variants", "Sample_Info", "Download Variants Summary Information File"
+        )
 
 ####Process Gene Information
-    output_file_path_gene = st.text_input("Enter the full path for the Gene Summary Information File", "/Users/user_defined_path/Gene_output.xlsx")
-    if st.button("Combine and Process Genes Information"):
-        gene_list = list(set(df_RR_RawData['Gene Name'].to_list()))
-        gene_subtables = {}
-        for gene in gene_list:
-            # Filter for 'Gene Name' == gene and 'Call' == "MD"
-            gene_subtables[gene] = df_RR_RawData[
-            (df_RR_RawData['Gene Name'] == gene) & (df_RR_RawData['Call'] == "MD")
-            ]
-            # Select specific columns
-            # Check if the table is empty
-            if gene_subtables[gene].empty:
-                gene_subtables[gene][gene] = "NMD"
-            else:
-                # Add a column 'Status' with the gene name for non-empty tables
-                gene_subtables[gene][gene] = 'MD'
-                gene_subtables[gene] = gene_subtables[gene][['Sample ID', gene]]
-
-            tmp_merged_table = pd.merge(tmp_merged_table,
-                    gene_subtables[gene][['Sample ID', gene]],
-                    on='Sample ID',
-                    how='left')
-            tmp_merged_table[gene] = tmp_merged_table[gene].fillna('NMD')
+        processing_section(
+            "gene", "Combine and Process Genes Information",
+            "Enter the full path for the Gene Summary Information File", "/Users/user_defined_path/Gene_output.xlsx",
+            build_gene_summary, (df_SampleData, df_RR_Sample_Information, df_RR_RawData),
+            "df_final_genes", "Sample_Info", "Download Gene Summary Information File"
+        )
 
-        df_total_ge = df_RR_RawData[["Sample ID", 'Total DNA Amount (GE)']].groupby('Sample ID').first().reset_index()
-        tmp_merged_table['Overall Status'] = tmp_merged_table[gene_list].apply(
-            lambda row: 'MD' if 'MD' in row.values else 'NMD',
-            axis=1
-            )
-        tmp_merged_table = pd.merge(tmp_merged_table,
-            df_total_ge,
-            on='Sample ID',
-            how='left')
-        column_order = ['Sample ID', 'External ID1', 'External ID2', 'External ID3',
-           'Total DNA Amount (GE)', 'Overall Status'] + gene_list
-        df_gene_summary = tmp_merged_table[column_order]
-        df_merged_gene_summary = pd.merge(
-            df_SampleData,
-            df_gene_summary,
-            left_on='InosticsID',   # key in df_SampleData
-            right_on='Sample ID', # key in df_RR_Variants
-            how='right'           # or 'left', 'right', 'outer' depending on your needs
-            )
-        df_merged_gene_summary = df_merged_gene_summary.rename(columns={
-            'Study': 'PROTOCOL',
-            'Visit': 'VISIT',
-            'Collection Date': 'CTDNADT',
-            'Collection Time': 'CTDNATM',
-            'SampleID': 'SUBJID',
-            'InosticsID': 'SAMPID',
-            'Total DNA Amount (GE)': 'TOTDNAMT',
-            'Gene Name': 'GNNAME',
-            'COSMIC ID': 'Cosmic ID',
-            'MAF [%]': 'MAF[%]',
-            'Mutant Molecules': 'MUTMOL',
-            'Call': 'CALL',
-            'Base specific Cut-off': 'Base Specific Cut-off',
-            '#UIDs/Amplicon': 'UIDAMP',
-            '#Supermutants': 'SUPMUT',
-            'External ID3': 'SPECID',
-            'External ID2': 'SPECID2',
-            'Sample Comment': 'COMMENT',
-            'Overall Status':'STATUS',
-            # If you want to standardize Amplicon ID, CDS Change, AA Change, ClinVar, dbSNP
-            # just leave them as is or rename them accordingly
-             })
-        final_columns_gene = ['PROTOCOL', 'VISIT', 'CTDNADT', 'CTDNATM', 'SAMPID', 'SUBJID', 'SPECID',
-                 'SPECID2', 'TOTDNAMT', 'STATUS' ] + gene_list + ['COMMENT']
-        df_final_genes = df_merged_gene_summary[final_columns_gene]
-        def gene_data_format_modification(df):
-            df['PROTOCOL'] = df['PROTOCOL'].apply(lambda x: x.split()[0])
-            df['CTDNATM'] = df['CTDNATM'].astype(str).str.replace(r'(\d{2}:\d{2}):\d{2}', r'\1', regex=True)
-            df['CTDNADT'] = pd.to_datetime(df['CTDNADT'], errors='coerce').dt.strftime('%d %b %Y')
-            df = df.astype(str)
-        df_final_genes = gene_data_format_modification(df_final_genes)
-        df_final_genes = df_merged_gene_summary[final_columns_gene]
-        df_final_genes['CTDNADT'] = df_final_genes['CTDNADT'].astype("string")
-        df_final_genes['CTDNATM'] = df_final_genes['CTDNATM'].astype("string")
-
-        st.session_state.df_final_genes = df_final_genes
-         
-        if not df_final_genes.empty:
-            try:
-                # Write to the specified output file
-                with pd.ExcelWriter(output_file_path_gene, engine='openpyxl') as writer:
-                    df_final_genes.to_excel(writer, sheet_name="Sample_Info", index=False)
-                st.success(f"File saved successfully to: {output_file_path_gene}")
-            except Exception as e:
-                st.error(f"Failed to save the file locally: {e}")
-   
 ####Process Mutants Summary Information
-    
-    output_file_path_mutant = st.text_input("Enter the full path for the Mutants Summary Information File", "/Users/user_defined_path/mutant_output.xlsx")
-    if st.button("Combine and Process Mutants Information"):
-        gene_list = list(set(df_RR_RawData['Gene Name'].to_list()))
-        gene_subtables = {}
-        for gene in gene_list:
-            # Filter for 'Gene Name' == gene and 'Call' == "MD"
-            gene_subtables[gene] = df_RR_RawData[
-                (df_RR_RawData['Gene Name'] == gene) & (df_RR_RawData['Call'] == "MD")
-            ]
-            # Select specific columns
-            # Check if the table is empty
-            if gene_subtables[gene].empty:
-                gene_subtables[gene][gene] = "NMD"
-            else:
-                # Add a column 'Status' with the gene name for non-empty tables
-                gene_subtables[gene][gene] = 'MD'
-                gene_subtables[gene] = gene_subtables[gene][['Sample ID', gene]]
-
-            tmp_merged_table = pd.merge(tmp_merged_table,
-                    gene_subtables[gene][['Sample ID', gene]],
-                    on='Sample ID',
-                    how='left')
-            tmp_merged_table[gene] = tmp_merged_table[gene].fillna('NMD')
-
-        df_total_ge = df_RR_RawData[["Sample ID", 'Total DNA Amount (GE)']].groupby('Sample ID').first().reset_index()
-        tmp_merged_table['Overall Status'] = tmp_merged_table[gene_list].apply(
-            lambda row: 'MD' if 'MD' in row.values else 'NMD',
-            axis=1
-            )
-        tmp_merged_table = pd.merge(tmp_merged_table,
-            df_total_ge,
-            on='Sample ID',
-            how='left')
-        def get_description(row, df_RR_RawData):
-            # Genes to check
-            gene_list = list(set(df_RR_RawData['Gene Name'].to_list()))
-            genes = gene_list
-            # List to store mutation descriptions
-            descriptions = []
-            # Check each gene with MD status
-            for gene in genes:
-                try:  
-                    if row[gene] == 'MD':
-                    # Filter the raw data based on Sample ID, Call, and Gene Name
-                        mutant_df = df_RR_RawData[
-                            (df_RR_RawData['Sample ID'] == row['Sample ID']) &
-                            (df_RR_RawData['Call'] == 'MD') &
-                            (df_RR_RawData['Gene Name'] == gene)
-                            ]
-                        # If mutations found, format each mutation
-                        if not mutant_df.empty:
-                            for _, mut_row in mutant_df.iterrows():
-                                description = f"{mut_row['Gene Name']} | {mut_row['CDS Change']} | {mut_row['MAF [%]']} | {mut_row['Mutant Molecules']}"
-                                descriptions.append(description)
-                        # Join multiple descriptions with newline if multiple exist
-                except Exception as e:
-                    pass
-            return '\n'.join(descriptions) if descriptions else 'NMD'
-                # Apply the function to create the Description column
-        tmp_merged_table['Description   | Gene Name | CDS Change | MAF | MM'] = tmp_merged_table.apply(
-                lambda row: get_description(row, df_RR_RawData),
-                axis=1
-                )
-        df_mutant_summary = tmp_merged_table
-        df_merged_mutant_summary = pd.merge(
-            df_SampleData,
-            df_mutant_summary,
-            left_on='InosticsID',   # key in df_SampleData
-            right_on='Sample ID', # key in df_RR_Variants
-            how='right'           # or 'left', 'right', 'outer' depending on your needs
-            )
-        df_merged_mutant_summary_rename = df_merged_mutant_summary.rename(columns={
-            'Study': 'PROTOCOL',
-            'Visit': 'VISIT',
-            'Collection Date': 'CTDNADT',
-            'Collection Time': 'CTDNATM',
-            'InosticsID': 'SAMPID',
-            'External ID1':'SUBJID',
-            'External ID2':'SPECID',
-            'External ID3':'SPECID2',
-            'Overall Status':'STATUS',
-            'Total DNA Amount (GE)':'TOTDNAMT',
-            'Description   | Gene Name | CDS Change | MAF | MM':'DESCRP',
-            })
-        final_order = ['PROTOCOL', 'VISIT', 'CTDNADT', 'CTDNATM', 'SAMPID', 'SUBJID', 'SPECID', 'SPECID2', 'TOTDNAMT', 'STATUS', 'DESCRP']
-        df_mutant_summary_rename_reorder = df_merged_mutant_summary_rename[final_order]
-        def mutant_data_format_modification(df):
-            df['PROTOCOL'] = df['PROTOCOL'].apply(lambda x: x.split()[0])
-            df['CTDNATM'] = df['CTDNATM'].astype(str).str.replace(r'(\d{2}:\d{2}):\d{2}', r'\1', regex=True)
-            df['CTDNADT'] = pd.to_datetime(df['CTDNADT'], errors='coerce').dt.strftime('%d %b %Y')
-            return df
-        df_final_mutant_summary = mutant_data_format_modification(df_mutant_summary_rename_reorder)
-
-        st.session_state.df_final_mutant_summary = df_final_mutant_summary
-        
-        if not df_final_mutant_summary.empty:
-            try:
-                # Write to the specified output file
-                with pd.ExcelWriter(output_file_path_mutant, engine='openpyxl') as writer:
-                    df_final_mutant_summary.to_excel(writer, sheet_name="Mutant_Info", index=False)
-                st.success(f"File saved successfully to: {output_file_path_mutant}")
-            except Exception as e:
-                st.error(f"Failed to save the file locally: {e}")
+        processing_section(
+            "mutant", "Combine and Process Mutants Information",
+            "Enter the full path for the Mutants Summary Information File", "/Users/user_defined_path/mutant_output.xlsx",
+            build_mutant_summary, (df_SampleData, df_RR_Sample_Information, df_RR_RawData),
+            "df_final_mutant_summary", "Mutant_Info", "Download Mutants Summary Information File"
+        )
 
 else:
     st.warning("Please upload both files to proceed.")
@@ -1,10 +1,16 @@
 import streamlit as st
 
+# Pages are only executed when opened, so each tool's heavy imports load on first use
 create_page = st.Page("second_step_process_streamlit_prod_v3.py", title="Soham_Tool", icon=":material/add_circle:")
 create_page2 = st.Page("first_step_process_streamlit_pord_v2.py", title="BD_Tools", icon=":material/add_circle:")
+bcl2fastq_page = st.Page("streamlit_bcl2fastq.py", title="BCL2FASTQ", icon=":material/dns:")
+bcl2fastq_jobs_page = st.Page("streamlit_bcl2fastq_jobs.py", title="BCL2FASTQ Jobs", icon=":material/list:")
+robj_page = st.Page("streamlit_review_robj_v2.py", title="ExpressionSet_Viewer", icon=":material/table_view:")
 
-pg = st.navigation([create_page, create_page2])
+pg = st.navigation({
+    "SafeSeq": [create_page, create_page2],
+    "Sequencing": [bcl2fastq_page, bcl2fastq_jobs_page],
+    "Expression": [robj_page],
+})
 st.set_page_config(page_title="Centralized Data manager", page_icon=":material/edit:")
 pg.run()
-
-
@@ -1,131 +1,189 @@
 import streamlit as st
 import pandas as pd
 import os
-import subprocess
-import tempfile
-import re
-import threading
-import time
+
+import bcl2fastq_scheduler as scheduler
+import job_pool
+from barcodes import MAX_BARCODE_MISMATCHES, find_collisions
+from bcl2fastq_logs import new_tail, tail_log
+from bcl2fastq_progress import format_duration, read_progress
+from bcl2fastq_tuning import storage_type, tune_threads
+from fastq_qc import fastq_stats, qc_table, sample_fastqs
+from run_folder import inspect_run_folder, suggest_bases_mask
+from sample_sheet import content_hash, parse_sample_sheet
+from undetermined import count_indexes, profile_table, undetermined_files
 
 st.set_page_config(page_title="BCL2FASTQ Demultiplexer", layout="wide")
 
-def validate_sample_sheet(content):
+@st.cache_data(max_entries=16, show_spinner=False)
+def _parse_sample_sheet_cached(digest, _content):
+    return parse_sample_sheet(_content)
+
+@st.cache_data(max_entries=16, show_spinner=False)
+def barcode_collisions(digest, _df):
+    return find_collisions(_df)
+
+def load_sample_sheet(content):
     """
-    Validates the sample sheet format.
-    Returns (is_valid, error_message)
+    Parses the sample sheet once per distinct content; validation, preview and
+    submission all use the returned SampleSheet.
     """
-    # Check if content is empty
-    if not content:
-        return False, "Sample sheet is empty"
-    
-    # Basic format checks
-    lines = content.strip().split('\n')
-    
-    # Check for header section
-    if not any(line.startswith('[Header]') for line in lines):
-        return False, "Missing [Header] section"
-    
-    # Check for Data section
-    if not any(line.startswith('[Data]') for line in lines):
-        return False, "Missing [Data] section"
-    
-    # Extract the data section for validation
-    in_data_section = False
-    data_lines = []
-    
-    for line in lines:
-        if line.startswith('[Data]'):
-            in_data_section = True
-            continue
-        if in_data_section and line.strip() and not line.startswith('['):
-            data_lines.append(line)
-    
-    # Check if we have data rows
-    if len(data_lines) < 2:  # At least one header line and one data line
-        return False, "No sample data found in [Data] section"
-    
-    # Check for required columns in the data section
-    header = data_lines[0].split(',')
-    required_columns = ['Sample_ID', 'Sample_Name', 'index']
-    
-    for col in required_columns:
-        if col not in header:
-            return False, f"Missing required column: {col}"
-    
-    # Check for duplicate Sample_IDs
-    try:
-        # Parse data section into a dataframe for validation
-        df = pd.read_csv(pd.StringIO('\n'.join(data_lines)))
-        if df['Sample_ID'].duplicated().any():
-            duplicate_ids = df[df['Sample_ID'].duplicated()]['Sample_ID'].unique()
-            return False, f"Duplicate Sample_IDs found: {', '.join(duplicate_ids)}"
-    except Exception as e:
-        return False, f"Error parsing data section: {str(e)}"
-    
-    # All checks passed
-    return True, "Sample sheet is valid"
+    return _parse_sample_sheet_cached(content_hash(content), content)
 
-def parse_sample_sheet_to_dataframe(content):
+def show_log_tail(job):
     """
-    Parses a sample sheet content into a pandas DataFrame for display
+    Shows the most recent log lines, reading only what was appended since the last rerun
     """
-    # Locate the [Data] section
-    lines = content.strip().split('\n')
-    data_start = None
-    
-    for i, line in enumerate(lines):
-        if line.startswith('[Data]'):
-            data_start = i + 1
-            break
-    
-    if data_start is None or data_start >= len(lines):
-        return pd.DataFrame()
-    
-    # Extract data section and parse as CSV
-    data_content = '\n'.join(lines[data_start:])
-    return pd.read_csv(pd.StringIO(data_content))
+    tails = st.session_state.setdefault("log_tails", {})
+    tail = tails.setdefault(job["id"], new_tail())
+    st.code("\n".join(tail_log(scheduler.log_path(job), tail)), language="bash")
 
-def run_bcl2fastq(input_dir, output_dir, sample_sheet_path, threads=4):
+def show_progress(job):
     """
-    Runs bcl2fastq with the provided parameters
-    Returns (success, output_message)
+    Shows real progress written by the job runner: tiles processed from the
+    bcl2fastq log, FASTQ output growth, throughput and ETA
     """
-    cmd = [
-        "bcl2fastq",
-        "--input-dir", input_dir,
-        "--output-dir", output_dir,
-        "--sample-sheet", sample_sheet_path,
-        "--no-lane-splitting",
-        "--processing-threads", str(threads)
-    ]
-    
-    try:
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
+    progress = read_progress(job["job_dir"])
+    if progress is None:
+        st.progress(0, text="Waiting for the first progress update...")
+        return
+    if progress["fraction"] is not None:
+        tiles = f"{progress['tiles_done']}/{progress['tiles_total']} tiles"
+        st.progress(progress["fraction"], text=f"{progress['fraction']:.0%} · {tiles} · ETA {format_duration(progress['eta_seconds'])}")
+    else:
+        st.progress(0, text=f"{progress['tiles_done']} tiles processed (run layout unknown, no ETA)")
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Elapsed", format_duration(progress["elapsed_seconds"]))
+    col2.metric("Clusters/s", f"{progress['clusters_per_s']:,.0f}")
+    col3.metric("FASTQ MB/s", f"{progress['fastq_mb_per_s']:.1f}")
+    col4.metric("FASTQ on disk (GB)", f"{progress['fastq_bytes'] / 1024 ** 3:.2f}")
+    if progress["stalled"]:
+        st.warning("⚠️ No new tiles and no FASTQ growth for a while - the job may be stalled.")
+
+@st.cache_data(max_entries=32, show_spinner="Inspecting run folder...")
+def inspect_run_folder_cached(input_dir, mtime_ns):
+    """
+    Run folder summary cached by path and folder mtime
+    """
+    return inspect_run_folder(input_dir)
+
+def show_run_summary(run_summary):
+    """
+    Shows RunInfo/RunParameters details, BCL volume and completion markers of a run folder
+    """
+    run_info = run_summary["run_info"]
+    parameters = run_summary["run_parameters"] or {}
+    if run_info is None:
+        st.warning("⚠️ No readable RunInfo.xml - is this a run folder?")
+    else:
+        read_structure = " + ".join(
+            f"{read['cycles']}{' (index)' if read['is_index'] else ''}" for read in run_info["reads"]
         )
-        stdout, stderr = process.communicate()
-        
-        if process.returncode != 0:
-            return False, f"bcl2fastq failed with error code {process.returncode}:\n{stderr}"
-        
-        return True, f"bcl2fastq completed successfully.\nOutput:\n{stdout}"
-    except Exception as e:
-        return False, f"Failed to run bcl2fastq: {str(e)}"
+        st.write(f"**Run:** {run_info['run_id']}  \n"
+                 f"**Instrument:** {run_info['instrument']} {parameters.get('instrument_type') or parameters.get('application') or ''}  \n"
+                 f"**Flowcell:** {run_info['flowcell']}  \n"
+                 f"**Reads:** {read_structure}")
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("Lanes", run_info["lanes"])
+        c2.metric("Tiles", run_info["tiles"])
+        c3.metric("Cycles", run_info["cycles"])
+        c4.metric("BCL data (GB)", f"{run_summary['bcl_bytes'] / 1024 ** 3:.1f}")
+        if parameters.get("rta_version"):
+            st.caption(f"RTA {parameters['rta_version']}" + (f" · {parameters['chemistry']}" if parameters.get("chemistry") else ""))
+    markers = run_summary["markers"]
+    st.write(" ".join(f"{'✅' if present else '❌'} {marker}" for marker, present in markers.items()))
+    if not markers["RTAComplete.txt"]:
+        st.warning("⚠️ RTAComplete.txt is missing - the run may still be sequencing or copying.")
+    with st.expander(f"View directory contents ({len(run_summary['top_level'])} files/folders, {run_summary['bcl_files']} BCL files)"):
+        st.write(run_summary["top_level"])
 
-def background_process(input_dir, output_dir, sample_sheet_path, status_key):
-    """Background thread for running bcl2fastq"""
-    try:
-        success, message = run_bcl2fastq(input_dir, output_dir, sample_sheet_path)
-        st.session_state[status_key] = {"complete": True, "success": success, "message": message}
-    except Exception as e:
-        st.session_state[status_key] = {"complete": True, "success": False, "message": str(e)}
+def file_jobs_fragment(job_ids, was_pending, label, show_results):
+    """
+    Polls per-file jobs in the shared process pool and calls
+    show_results({path: result}) once all of them are done
+    """
+    states = [job_pool.job_state(job_id) for job_id in job_ids.values()]
+    if was_pending and not any(state in ("pending", "running") for state in states):
+        # Finished since the last poll: rerun the page once to stop polling
+        st.rerun()
+    if None in states:
+        st.warning("These jobs are no longer available, please start them again.")
+    elif "failed" in states:
+        error = next(job_pool.job_error(job_id) for job_id in job_ids.values() if job_pool.job_state(job_id) == "failed")
+        st.error(f"❌ {label} failed: {error}")
+    elif any(state in ("pending", "running") for state in states):
+        done = states.count("done")
+        st.progress(done / len(states), text=f"{label}... {done}/{len(states)} files")
+    else:
+        show_results({path: job_pool.job_result(job_id) for path, job_id in job_ids.items()})
 
-# Initialize session state variables if they don't exist
-if 'job_status' not in st.session_state:
-    st.session_state.job_status = {"running": False, "complete": False, "success": False, "message": ""}
+def run_file_jobs(key, button_label, fn, paths, label, show_results):
+    """
+    Button that submits fn(path, mtime_ns) for every file, then the polling fragment
+    """
+    if st.button(button_label, key=f"{key}_button"):
+        st.session_state[key] = {path: job_pool.submit_job(fn, path, os.stat(path).st_mtime_ns) for path in paths}
+    job_ids = st.session_state.get(key)
+    if job_ids:
+        pending = any(job_pool.job_state(job_id) in ("pending", "running") for job_id in job_ids.values())
+        st.fragment(file_jobs_fragment, run_every=1.0 if pending else None)(job_ids, pending, label, show_results)
+
+def show_undetermined_profile(job):
+    """
+    Post-job stage: most frequent index sequences in the Undetermined FASTQs,
+    counted in the shared process pool, one job per file
+    """
+    st.header("Undetermined Reads")
+    files = undetermined_files(job["output_dir"])
+    if not files:
+        st.info("No Undetermined FASTQ files found in the output directory.")
+        return
+    sizes = sum(os.path.getsize(path) for path in files)
+    st.write(f"{len(files)} Undetermined read 1 files ({sizes / 1024 ** 3:.2f} GB)")
+    with open(scheduler.sample_sheet_path(job)) as f:
+        sheet = load_sample_sheet(f.read())
+
+    def show_results(counters):
+        table, total, error = profile_table(list(counters.items()), sheet.data)
+        st.write(f"{total:,} undetermined reads counted" + (f" (counts may be up to {error:,} low)" if error else ""))
+        st.dataframe(table, hide_index=True, column_config={
+            "% of Undetermined": st.column_config.NumberColumn(format="%.2f")
+        })
+
+    run_file_jobs(f"undetermined_jobs_{job['id']}", "Profile Undetermined barcodes", count_indexes, files,
+                  "Counting index sequences", show_results)
+
+def show_fastq_qc(job):
+    """
+    Post-job stage: reads, yield and quality per sample and lane, one pool job per FASTQ
+    """
+    st.header("FASTQ Quality")
+    files = sample_fastqs(job["output_dir"])
+    if not files:
+        st.info("No sample FASTQ files found in the output directory.")
+        return
+    st.write(f"{len(files)} sample FASTQ files")
+
+    def show_results(results):
+        table = qc_table(files, [results[f["path"]] for f in files], job["output_dir"])
+        flagged = table["Flags"] != ""
+        if flagged.any():
+            st.warning(f"⚠️ {flagged.sum()} of {len(table)} sample/lane rows are flagged.")
+        st.dataframe(table, hide_index=True, column_config={
+            "Mean quality": st.column_config.NumberColumn(format="%.1f"),
+            "% >= Q30": st.column_config.NumberColumn(format="%.1f"),
+            "% of reads": st.column_config.NumberColumn(format="%.2f"),
+        })
+
+    run_file_jobs(f"fastq_qc_jobs_{job['id']}", "Compute FASTQ statistics", fastq_stats,
+                  [f["path"] for f in files], "Reading FASTQ files", show_results)
+
+# Jobs are kept in the scheduler's job table; the session only remembers which one it submitted
+if 'job_id' not in st.session_state:
+    st.session_state.job_id = None
+
+# Resume scheduling of queued/running jobs after a server restart
+scheduler.ensure_scheduler()
 
 # App title and description
 st.title("BCL2FASTQ Demultiplexer")
@@ -142,13 +200,12 @@ with col1:
     input_dir = st.text_input("BCL Input Directory", 
                              placeholder="Path to the NGS data folder containing BaseCalls")
     
+    run_summary = None
     if input_dir and os.path.exists(input_dir):
         st.success(f"✅ Directory exists: {input_dir}")
-        # Show directory contents
-        files = os.listdir(input_dir)
-        st.write(f"Directory contains {len(files)} files/folders")
-        with st.expander("View directory contents"):
-            st.write(files)
+        # Scanned once per folder state; a new marker or file at the top level changes the mtime
+        run_summary = inspect_run_folder_cached(input_dir, os.stat(input_dir).st_mtime_ns)
+        show_run_summary(run_summary)
     elif input_dir:
         st.error(f"❌ Directory does not exist: {input_dir}")
     
@@ -194,14 +251,25 @@ with col2:
     # Sample sheet validation and preview
     st.header("4. Sample Sheet Validation")
     
-    if sample_sheet_content:
-        is_valid, message = validate_sample_sheet(sample_sheet_content)
+    sheet = load_sample_sheet(sample_sheet_content) if sample_sheet_content else None
+    if sheet is not None:
+        if sheet.is_valid:
+            st.success(f"✅ {sheet.message()}")
+        else:
+            st.error(f"❌ {sheet.message()}")
+        if sheet.diagnostics:
+            with st.expander(f"Diagnostics ({len(sheet.errors)} errors, {len(sheet.warnings)} warnings)",
+                             expanded=not sheet.is_valid):
+                st.dataframe(pd.DataFrame(sheet.diagnostics, columns=["Line", "Level", "Message"]),
+                             hide_index=True)
         
-        if is_valid:
-            st.success(f"✅ {message}")
+        if sheet.is_valid:
+            if sheet.header or sheet.reads:
+                with st.expander("Header, reads and settings"):
+                    st.write({"Header": sheet.header, "Reads": sheet.reads, "Settings": sheet.settings})
             
             # Display sample data in a table
-            df = parse_sample_sheet_to_dataframe(sample_sheet_content)
+            df = sheet.data
             if not df.empty:
                 st.subheader("Sample Data Preview")
                 st.dataframe(df)
@@ -209,17 +277,21 @@ with col2:
                 # Sample stats
                 st.info(f"Total samples: {len(df)}")
                 
-                # Show unique indexes
-                with st.expander("Index Distribution"):
-                    if 'index' in df.columns:
-                        index_counts = df['index'].value_counts()
-                        st.write(index_counts)
-                        
-                        # Check for potential index collisions
-                        if len(index_counts) < len(df):
-                            st.warning("⚠️ Some indexes are used multiple times!")
-        else:
-            st.error(f"❌ {message}")
+                # Barcode distances per lane, i7 and i5 checked separately as bcl2fastq does
+                collisions, collision_summary = barcode_collisions(content_hash(sample_sheet_content), df)
+                with st.expander("Barcode Collisions", expanded=not collisions.empty):
+                    if collision_summary.empty:
+                        st.info("No index columns to check.")
+                    else:
+                        st.dataframe(collision_summary, hide_index=True)
+                        per_lane = collision_summary["Recommended --barcode-mismatches"]
+                        if per_lane.isna().any():
+                            st.error("❌ Some samples share identical barcodes in the same lane!")
+                        elif (per_lane < 1).any():
+                            st.warning("⚠️ Some barcodes are too close for the default of 1 mismatch.")
+                    if not collisions.empty:
+                        st.write("Barcode pairs limiting --barcode-mismatches:")
+                        st.dataframe(collisions, hide_index=True)
     
     # Job submission section
     st.header("5. Job Submission")
@@ -227,84 +299,131 @@ with col2:
     # Requirements check
     requirements_met = input_dir and os.path.exists(input_dir) and \
                       output_dir and \
-                      sample_sheet_content and validate_sample_sheet(sample_sheet_content)[0]
+                      sheet is not None and sheet.is_valid
     
     if not requirements_met:
         st.warning("Please complete all previous steps before submitting the job.")
     
+    # Pre-filled from the run folder; editable before submission
+    suggested_mask = run_summary["bases_mask"] if run_summary else None
+    if suggested_mask and sheet is not None and sheet.is_valid:
+        # Mask index cycles the sample sheet indexes do not use
+        suggested_mask = suggest_bases_mask(run_summary["run_info"]["reads"], sheet.index_lengths())
+    use_bases_mask = st.text_input(
+        "--use-bases-mask", value=suggested_mask or "", key=f"bases_mask_{input_dir}_{suggested_mask}",
+        help="Suggested from the RunInfo.xml read structure and the sample sheet index lengths. "
+             "Leave empty to let bcl2fastq decide."
+    )
+    
+    # Defaults to the largest setting the barcodes allow, capped at bcl2fastq's default of 1
+    recommended_mismatches = 1
+    if sheet is not None and sheet.is_valid and not sheet.data.empty:
+        collision_summary = barcode_collisions(content_hash(sample_sheet_content), sheet.data)[1]
+        if not collision_summary.empty:
+            per_lane = collision_summary["Recommended --barcode-mismatches"]
+            recommended_mismatches = 0 if per_lane.isna().any() else int(min(1, per_lane.min()))
+    barcode_mismatches = st.number_input(
+        "--barcode-mismatches", min_value=0, max_value=MAX_BARCODE_MISMATCHES, value=recommended_mismatches,
+        key=f"barcode_mismatches_{recommended_mismatches}",
+        help="Pre-set from the barcode collision check; higher values can assign reads to the wrong sample."
+    )
+    
+    lanes = run_summary["run_info"]["lanes"] if run_summary and run_summary["run_info"] else 1
+    lane_shards = st.checkbox(
+        f"Split by lane ({lanes} parallel bcl2fastq processes)", value=False, disabled=lanes < 2,
+        help="Each lane is demultiplexed by its own bcl2fastq process with a share of the threads; "
+             "the FASTQs and Stats.json are merged per sample when all lanes are done."
+    )
+    
     # Threads selection
-    threads = st.slider("Number of processing threads", min_value=1, max_value=32, value=4)
+    cores = scheduler.available_cores()
+    thread_mode = st.radio("Threads", ["Auto-tune", "Manual"], horizontal=True)
+    # Also stored with the job: the scheduler counts I/O threads as cores by the same rule as the tuner
+    input_storage = storage_type(input_dir) if input_dir and os.path.exists(input_dir) else "ssd"
+    output_storage = storage_type(output_dir) if output_dir and os.path.exists(output_dir) else input_storage
+    if thread_mode == "Auto-tune":
+        concurrent_jobs = scheduler.active_job_count()
+        samples = len(sheet.data) if sheet is not None and sheet.is_valid else None
+        tuned = tune_threads(cores, input_storage, output_storage, concurrent_jobs, samples)
+        loading_threads, threads, writing_threads = tuned["loading"], tuned["processing"], tuned["writing"]
+        st.write(f"Loading **{loading_threads}** · processing **{threads}** · writing **{writing_threads}**")
+        st.caption(f"{cores} cores shared with {concurrent_jobs} active jobs; "
+                   f"input on {input_storage}, output on {output_storage} storage.")
+    else:
+        threads = st.slider("Number of processing threads", min_value=1, max_value=max(32, cores), value=4)
+        loading_threads = st.slider("Number of loading threads", min_value=1, max_value=16, value=4)
+        writing_threads = st.slider("Number of writing threads", min_value=1, max_value=16, value=4)
+    memory_reservation = st.number_input(
+        "Memory reservation (GB)", min_value=1, value=scheduler.DEFAULT_JOB_MEMORY_GB,
+        help="Used by the scheduler to decide how many jobs can run side by side"
+    )
     
     # Submit button
     submit_button = st.button("Submit Demultiplexing Job", disabled=not requirements_met)
     
     if submit_button:
-        # Create a temporary file for the sample sheet
-        with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.csv') as temp_file:
-            temp_file.write(sample_sheet_content)
-            sample_sheet_path = temp_file.name
-        
-        # Set status and start background process
-        st.session_state.job_status = {
-            "running": True, 
-            "complete": False, 
-            "success": False,
-            "message": "Job started...",
-            "sample_sheet_path": sample_sheet_path
-        }
-        
-        # Start background thread
-        bg_thread = threading.Thread(
-            target=background_process,
-            args=(input_dir, output_dir, sample_sheet_path, 'job_status')
+        # The scheduler copies the sample sheet into the job directory and starts the job
+        # once enough cores and memory are free
+        st.session_state.job_id = scheduler.submit_job(
+            input_dir, output_dir, sample_sheet_content, threads, memory_reservation,
+            options={"use_bases_mask": use_bases_mask.strip(), "barcode_mismatches": int(barcode_mismatches),
+                     "lane_shards": lane_shards, "loading_threads": loading_threads, "writing_threads": writing_threads,
+                     "input_storage": input_storage, "output_storage": output_storage}
         )
-        bg_thread.start()
-        
-        st.experimental_rerun()
+        st.rerun()
 
-# Display job status
-if st.session_state.job_status["running"]:
-    st.header("Job Status")
+def job_status_fragment(job_id, was_active):
+    """
+    Job status area. While the job is active only this fragment is re-run on the
+    refresh interval, reading just the job record, progress file and log tail.
+    """
+    job = scheduler.get_job(job_id)
+    if job is None:
+        return
+    if was_active and job["status"] not in scheduler.ACTIVE_STATUSES:
+        # Finished since the last refresh: rerun the page once to stop polling
+        st.rerun()
+
+    st.header(f"Job Status (job {job['id']})")
+    st.caption("All jobs, including those of other users, are listed on the BCL2FASTQ Jobs page.")
     
-    if not st.session_state.job_status["complete"]:
+    if job["status"] == "queued":
+        st.info("⏳ Job is queued and will start when enough cores and memory are free.")
+    elif job["status"] == "running":
         st.info("⏳ Job is running... This might take several minutes.")
         
-        # Add a progress bar that doesn't actually track real progress
-        progress_bar = st.progress(0)
-        status_text = st.empty()
+        show_progress(job)
         
-        # A placeholder for moving progress 
-        if not hasattr(st.session_state, 'progress_value'):
-            st.session_state.progress_value = 0
-            
-        # Increment progress for visual feedback
-        st.session_state.progress_value = (st.session_state.progress_value + 1) % 101
-        progress_bar.progress(st.session_state.progress_value)
-        status_text.text(f"Processing... {st.session_state.progress_value}%")
-        
-        # Check again in 0.5 seconds
-        time.sleep(0.5)
-        st.experimental_rerun()
+        with st.expander("Live job log", expanded=True):
+            show_log_tail(job)
     else:
         # Job completed
-        if st.session_state.job_status["success"]:
+        if job["status"] == "succeeded":
             st.success("✅ Job completed successfully!")
+        elif job["status"] == "cancelled":
+            st.warning("Job was cancelled.")
         else:
             st.error("❌ Job failed!")
         
         # Show output message
         with st.expander("View job output"):
-            st.code(st.session_state.job_status["message"], language="bash")
-            
-        # Cleanup the temporary sample sheet file
-        if "sample_sheet_path" in st.session_state.job_status:
-            try:
-                os.unlink(st.session_state.job_status["sample_sheet_path"])
-            except:
-                pass
+            st.write(job["message"])
+            show_log_tail(job)
                 
         # Reset button
         if st.button("Start New Job"):
-            st.session_state.job_status = {"running": False, "complete": False, "success": False, "message": ""}
-            st.experimental_rerun()
+            st.session_state.job_id = None
+            st.rerun()
 
+# Display job status
+refresh_interval = st.sidebar.number_input(
+    "Job status refresh interval (seconds)", min_value=0.5, max_value=60.0, value=2.0, step=0.5
+)
+if st.session_state.job_id is not None:
+    job = scheduler.get_job(st.session_state.job_id)
+    if job is not None:
+        active = job["status"] in scheduler.ACTIVE_STATUSES
+        st.fragment(job_status_fragment, run_every=refresh_interval if active else None)(job["id"], active)
+        if job["status"] == "succeeded":
+            show_fastq_qc(job)
+            show_undetermined_profile(job)
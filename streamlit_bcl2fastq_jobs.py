@@ -0,0 +1,72 @@
+import streamlit as st
+import pandas as pd
+import datetime
+
+import bcl2fastq_scheduler as scheduler
+
+st.title("BCL2FASTQ Jobs")
+st.markdown("""
+Shared list of demultiplexing jobs submitted from any session on this server.
+""")
+
+# Resume scheduling of queued/running jobs after a server restart
+scheduler.ensure_scheduler()
+
+def format_time(timestamp):
+    if timestamp is None or pd.isna(timestamp):
+        return ""
+    return datetime.datetime.fromtimestamp(timestamp).strftime("%Y-%m-%d %H:%M:%S")
+
+refresh_interval = st.sidebar.number_input(
+    "Job list refresh interval (seconds)", min_value=1.0, max_value=300.0, value=5.0, step=1.0
+)
+
+@st.fragment(run_every=refresh_interval)
+def job_table_fragment():
+    """
+    Job table and resource usage, refreshed on its own without rerunning the page
+    """
+    jobs = scheduler.list_jobs()
+    memory = scheduler.memory_gb()
+    running = [job for job in jobs if job["status"] == "running"]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Running jobs", len(running))
+    col2.metric("Threads in use", f"{sum(scheduler.job_threads(job) for job in running)} / {scheduler.available_cores()}")
+    if memory is not None:
+        col3.metric("Available memory (GB)", f"{memory[1]:.0f} / {memory[0]:.0f}")
+
+    if not jobs:
+        st.info("No jobs have been submitted yet.")
+        return
+
+    jobs_df = pd.DataFrame([{
+        "Job": job["id"],
+        "Status": job["status"],
+        "Input": job["input_dir"],
+        "Output": job["output_dir"],
+        "Threads": job["threads"],
+        "Memory (GB)": job["memory_gb"],
+        "PID": job["pid"],
+        "Submitted": format_time(job["submitted_at"]),
+        "Started": format_time(job["started_at"]),
+        "Finished": format_time(job["finished_at"]),
+        "Message": job["message"],
+    } for job in jobs])
+    st.dataframe(jobs_df, hide_index=True)
+
+job_table_fragment()
+
+jobs = scheduler.list_jobs()
+if not jobs:
+    st.stop()
+
+# Cancel or retry a single job
+job_id = st.selectbox("Select a job", [job["id"] for job in jobs])
+job = scheduler.get_job(job_id)
+col1, col2 = st.columns(2)
+if col1.button("Cancel job", disabled=job["status"] not in scheduler.ACTIVE_STATUSES):
+    scheduler.cancel_job(job_id)
+    st.rerun()
+if col2.button("Retry job", disabled=job["status"] in scheduler.ACTIVE_STATUSES):
+    new_job_id = scheduler.retry_job(job_id)
+    st.success(f"✅ Queued job {new_job_id}")
@@ -2,197 +2,346 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import os
-import tempfile
-import subprocess
-import json
+import time
+
+import job_pool
+from eset_catalog import catalog_table, dataset_labels, feature_overlap, ingest_rds, is_current, load_index, scan_rds_files, update_index
+from eset_dataset import MISSING_GROUP, bundle_bytes, model_inputs
+from eset_explore import clustered_heatmap, store_pca
+from eset_loader import content_digest, extraction_dir, load_expression_set
+from expression_store import ExpressionStore
+from metadata_profile import column_detail, profile_metadata
+from path_ingest import allowed_roots, is_allowed, resolve_allowed_dir
+from r_worker import RWorkerError
 
 st.title("R ExpressionSet Object Viewer")
 
+# altair is imported inside the plotting functions so opening this page does not pay for it
+
+def catalog_jobs_fragment(job_ids):
+    """
+    Polls the ingestion jobs and adds their entries to the catalog index once all are finished
+    """
+    states = {path: job_pool.job_state(job_id) for path, job_id in job_ids.items()}
+    pending = [path for path, state in states.items() if state in ("pending", "running")]
+    if pending:
+        done = len(states) - len(pending)
+        st.progress(done / len(states), text=f"Ingesting... {done}/{len(states)} files")
+        return
+    entries = {}
+    failures = {}
+    for path, job_id in job_ids.items():
+        if states[path] == "done":
+            entries[path] = job_pool.job_result(job_id)
+        else:
+            failures[path] = str(job_pool.job_error(job_id) or "job no longer available")
+    update_index(entries)
+    st.session_state.catalog_failures = failures
+    del st.session_state.catalog_jobs
+    st.rerun()
+
+def plot_class_balance(entries, labels):
+    import altair as alt
+    df = pd.DataFrame([
+        {"Dataset": labels[path], "Class": label, "Samples": count}
+        for path, entry in entries.items() for label, count in (entry["class_counts"] or {}).items()
+    ])
+    if df.empty:
+        st.info("None of the selected datasets has a Class column.")
+        return
+    chart = alt.Chart(df).mark_bar().encode(
+        y=alt.Y("Dataset:N"),
+        x=alt.X("Samples:Q", stack="normalize", title="Share of samples"),
+        color=alt.Color("Class:N"),
+        tooltip=["Dataset", "Class", "Samples"]
+    )
+    st.altair_chart(chart, width="stretch")
+
+def show_catalog():
+    """
+    Catalog mode: ingest every RDS file of a directory into the extraction
+    cache in the process pool and compare the datasets from the index
+    """
+    st.header("Dataset Catalog")
+    directory = st.text_input("Directory with RDS files - server path", key="catalog_dir")
+    if not directory:
+        st.info("Enter a directory to scan for RDS files.")
+        return
+    try:
+        directory = resolve_allowed_dir(directory)
+    except (ValueError, FileNotFoundError) as e:
+        st.error(f"❌ {e}")
+        return
+    # Symlinks under the directory must not lead out of the allowed roots either
+    roots = allowed_roots()
+    paths = [path for path in scan_rds_files(directory) if is_allowed(os.path.realpath(path), roots)]
+    index = load_index()
+    stale = [path for path in paths if not is_current(index.get(path), path)]
+    st.write(f"{len(paths)} RDS files, {len(paths) - len(stale)} indexed")
+    if "catalog_jobs" in st.session_state:
+        job_ids = st.session_state.catalog_jobs
+        pending = any(job_pool.job_state(job_id) in ("pending", "running") for job_id in job_ids.values())
+        st.fragment(catalog_jobs_fragment, run_every=1.0 if pending else None)(job_ids)
+    elif stale and st.button(f"Ingest {len(stale)} new or changed files"):
+        # An unchanged file that is stale again gets a new job instead of the finished one
+        st.session_state.catalog_jobs = {
+            path: job_pool.submit_job(ingest_rds, path, os.stat(path).st_mtime_ns, time.time_ns() if path in index else None)
+            for path in stale
+        }
+        st.rerun()
+    for path, error in st.session_state.get("catalog_failures", {}).items():
+        st.error(f"{os.path.basename(path)}: {error}")
+    
+    entries = {path: index[path] for path in paths if is_current(index.get(path), path)}
+    if not entries:
+        return
+    st.subheader("Datasets")
+    st.dataframe(catalog_table(entries, directory).drop(columns="Path"), hide_index=True)
+    
+    st.subheader("Comparison")
+    labels = dataset_labels(entries, directory)
+    selected = st.multiselect("Datasets to compare", list(entries), default=list(entries), format_func=labels.get)
+    if not selected:
+        return
+    selected_entries = {path: entries[path] for path in selected}
+    plot_class_balance(selected_entries, labels)
+    shared, common = feature_overlap(selected_entries, directory)
+    st.write(f"Features present in all {len(selected)} datasets: {common}")
+    st.write("Shared features between datasets:")
+    st.dataframe(shared)
+
+mode = st.sidebar.radio("Mode", ["Single file", "Catalog"])
+if mode == "Catalog":
+    show_catalog()
+    st.stop()
+
 # File uploader
 uploaded_file = st.file_uploader("Choose an RDS file", type="rds")
 
+# A resource, not data: the memory-mapped matrix is shared, never pickled or copied
+@st.cache_resource(max_entries=8, show_spinner="Extracting ExpressionSet...")
+def load_uploaded_eset(digest, dataset_name, _data):
+    """
+    Extraction of an uploaded RDS, cached by its content hash. Files are decoded
+    in Python; the R worker only runs for ones the Python reader cannot read.
+    """
+    return load_expression_set(digest, dataset_name, data=_data)
+
+@st.cache_resource(max_entries=8, show_spinner="Building chunked expression store...")
+def load_store(digest, dtype):
+    """
+    Column-chunked store of an extracted matrix, built on first use.
+    """
+    return ExpressionStore(extraction_dir(digest), dtype)
+
+@st.cache_data(max_entries=16)
+def sample_metadata_profile(digest, _sample_meta):
+    """
+    Column profiles of the sample metadata, computed once per file.
+    """
+    return profile_metadata(_sample_meta)
+
+@st.cache_data(max_entries=32, show_spinner="Computing principal components...")
+def pca_scores(digest, dtype, n_features):
+    """
+    Randomized PCA per file and feature count; changing axes or colors reuses it.
+    """
+    return store_pca(load_store(digest, dtype), n_features)
+
+@st.cache_data(max_entries=32, show_spinner="Clustering...")
+def heatmap_values(digest, dtype, n_features, n_samples):
+    return clustered_heatmap(load_store(digest, dtype), n_features, n_samples)
+
+def plot_projection(scores, explained, x_axis, y_axis, colors, color_by):
+    import altair as alt
+    df = scores[[x_axis, y_axis]].rename_axis("Sample").reset_index()
+    encoding = {
+        "x": alt.X(f"{x_axis}:Q", title=f"{x_axis} ({explained[scores.columns.get_loc(x_axis)]:.1%})"),
+        "y": alt.Y(f"{y_axis}:Q", title=f"{y_axis} ({explained[scores.columns.get_loc(y_axis)]:.1%})"),
+        "tooltip": ["Sample"],
+    }
+    if colors is not None:
+        df[color_by] = colors.to_numpy()
+        encoding["color"] = alt.Color(f"{color_by}:N")
+        encoding["tooltip"] = ["Sample", color_by]
+    st.altair_chart(alt.Chart(df).mark_circle(size=40).encode(**encoding).interactive(), width="stretch")
+
+def plot_heatmap(values):
+    import altair as alt
+    df = values.rename_axis("Sample").reset_index().melt(id_vars="Sample", var_name="Feature", value_name="z")
+    chart = alt.Chart(df).mark_rect().encode(
+        x=alt.X("Feature:N", sort=list(values.columns), axis=alt.Axis(labels=len(values.columns) <= 60)),
+        y=alt.Y("Sample:N", sort=list(values.index), axis=alt.Axis(labels=len(values.index) <= 60)),
+        color=alt.Color("z:Q", scale=alt.Scale(scheme="redblue", domain=[-3, 3], clamp=True, reverse=True)),
+        tooltip=["Sample", "Feature", alt.Tooltip("z:Q", format=".2f")]
+    )
+    st.altair_chart(chart, width="stretch")
+
 if uploaded_file is not None:
-    # Save the uploaded file temporarily
-    with tempfile.NamedTemporaryFile(suffix='.rds', delete=False) as f:
-        temp_filename = f.name
-        f.write(uploaded_file.getvalue())
-    
-    # Create an R script to extract information from the RDS file
-    r_script = """
-    library(Biobase)
-    library(jsonlite)
-    
-    args <- commandArgs(trailingOnly = TRUE)
-    rds_file <- args[1]
-    output_dir <- args[2]
+    # Hash each upload once, not on every rerun
+    digests = st.session_state.setdefault("rds_digests", {})
+    if uploaded_file.file_id not in digests:
+        digests[uploaded_file.file_id] = content_digest(uploaded_file.getvalue())
+    digest = digests[uploaded_file.file_id]
     
-    # Read the RDS file
-    eset <- readRDS(rds_file)
+    try:
+        eset = load_uploaded_eset(digest, os.path.splitext(uploaded_file.name)[0], uploaded_file.getvalue())
+    except RWorkerError as e:
+        st.error(f"This file needs R to be read, and R failed: {str(e)}")
+        st.stop()
+    except Exception as e:
+        st.error(f"Error processing data: {str(e)}")
+        st.stop()
     
-    # Extract expression data
-    expr_data <- t(exprs(eset))
-    write.csv(expr_data, file.path(output_dir, "expression_data.csv"))
+    basic_info = eset["basic_info"]
+    X = eset["X"]
+    if X is None:
+        st.error("Failed to extract expression data from the RDS file.")
+        st.stop()
+    sample_meta = eset["sample_meta"]
+    if sample_meta is None:
+        st.warning("No sample metadata found in the RDS file.")
+        sample_meta = pd.DataFrame(index=eset["samples"])
+    feature_meta = eset["feature_meta"]
+    if feature_meta is None:
+        st.info("No feature metadata found in the RDS file.")
+        feature_meta = pd.DataFrame(index=eset["features"])
+    classes = eset["classes"]
+    survival_data = eset["survival_data"]
     
-    # Extract sample metadata
-    sample_meta <- pData(eset)
-    write.csv(sample_meta, file.path(output_dir, "sample_metadata.csv"))
+    # Display the extracted information
+    st.header(f"Dataset: {basic_info['dataset_name']}")
+    st.write(f"Number of samples: {basic_info['num_samples']}")
+    st.write(f"Number of features: {basic_info['num_features']}")
     
-    # Extract feature metadata if available
-    if (exists("fData") && is.function(fData)) {
-        feature_meta <- fData(eset)
-        write.csv(feature_meta, file.path(output_dir, "feature_metadata.csv"))
-    } else {
-        # Create an empty file to indicate no feature metadata
-        file.create(file.path(output_dir, "no_feature_metadata.txt"))
-    }
-    
-    # Extract basic information
-    basic_info <- list(
-        dataset_name = basename(rds_file),
-        num_samples = ncol(exprs(eset)),
-        num_features = nrow(exprs(eset)),
-        sample_names = sampleNames(eset),
-        feature_names = featureNames(eset)
-    )
+    # Create tabs for different components
+    tab1, tab2, tab3, tab4, tab5 = st.tabs(["Expression Data", "Sample Metadata", 
+                                          "Feature Metadata", "Classes/Survival", "Explore"])
     
-    # Save as JSON
-    write_json(basic_info, file.path(output_dir, "basic_info.json"))
+    with tab1:
+        st.subheader("Expression Data")
+        st.write(f"Shape: {X.shape} - {X.shape[0]} samples × {X.shape[1]} features")
+        store_dtype = "float32" if st.checkbox("Store as float32 (half the memory and disk)", value=True) else "float64"
+        store = load_store(digest, store_dtype)
+        if store.sparse:
+            st.write(f"Sparse matrix: {store.nnz:,} nonzero values "
+                     f"({store.nnz / max(1, X.shape[0] * X.shape[1]):.1%} of entries)")
+        
+        # Only the chunks holding the visible columns are read
+        col1, col2, col3, col4 = st.columns(4)
+        first_row = col1.number_input("First sample", min_value=0, max_value=max(0, X.shape[0] - 1), value=0)
+        num_rows = col2.number_input("Samples shown", min_value=1, max_value=200, value=10)
+        first_col = col3.number_input("First feature", min_value=0, max_value=max(0, X.shape[1] - 1), value=0)
+        num_cols = col4.number_input("Features shown", min_value=1, max_value=200, value=20)
+        st.dataframe(store.window(slice(first_row, first_row + num_rows), slice(first_col, first_col + num_cols)))
+        
+        # Per-feature statistics, computed once while the store was built
+        st.subheader("Summary Statistics")
+        stats = store.feature_stats()
+        col1, col2 = st.columns(2)
+        search = col1.text_input("Search features")
+        sort_by = col2.selectbox("Sort by", ["Feature order", "mean", "std", "min", "max", "nonzero", "missing"])
+        if search:
+            stats = stats[stats.index.str.contains(search, case=False, regex=False)]
+        if sort_by != "Feature order":
+            stats = stats.sort_values(sort_by, ascending=False)
+        page_size = 100
+        num_pages = max(1, -(-len(stats) // page_size))
+        page = st.number_input(f"Page (of {num_pages})", min_value=1, max_value=num_pages, value=1)
+        st.write(f"{len(stats)} features")
+        st.dataframe(stats.iloc[(page - 1) * page_size:page * page_size])
     
-    # If 'Class' column exists in sample metadata, extract it
-    if ("Class" %in% colnames(sample_meta)) {
-        classes <- sample_meta$Class
-        write.csv(data.frame(Class=classes), file.path(output_dir, "classes.csv"))
-    }
+    with tab2:
+        st.subheader("Sample Metadata")
+        st.dataframe(sample_meta)
+        
+        # Display column info: one profile table, details for one column on request
+        if not sample_meta.empty and len(sample_meta.columns) > 0:
+            st.subheader("Sample Metadata Columns")
+            st.dataframe(sample_metadata_profile(digest, sample_meta))
+            detail_column = st.selectbox("Column details", ["None"] + list(sample_meta.columns))
+            if detail_column != "None":
+                st.dataframe(column_detail(sample_meta[detail_column]), hide_index=True)
     
-    # If 'Status' and 'Survival_in_days' columns exist in sample metadata, extract them
-    if (all(c("Status", "Survival_in_days") %in% colnames(sample_meta))) {
-        surv_data <- sample_meta[, c("Status", "Survival_in_days")]
-        write.csv(surv_data, file.path(output_dir, "survival_data.csv"))
-    }
-    """
+    with tab3:
+        st.subheader("Feature Metadata")
+        st.dataframe(feature_meta)
     
-    # Create a temporary directory to store output files
-    with tempfile.TemporaryDirectory() as temp_dir:
-        # Save the R script to a file
-        r_script_path = os.path.join(temp_dir, "extract_data.R")
-        with open(r_script_path, "w") as f:
-            f.write(r_script)
+    with tab4:
+        if classes is not None:
+            st.subheader("Classes")
+            classes_df = pd.DataFrame({"Class": classes})
+            st.write("Class Distribution:")
+            st.write(classes_df["Class"].value_counts())
+            st.bar_chart(classes_df["Class"].value_counts())
         
-        try:
-            # Run the R script
-            subprocess.run(["Rscript", r_script_path, temp_filename, temp_dir], check=True)
-            
-            # Load the extracted data
-            basic_info_path = os.path.join(temp_dir, "basic_info.json")
-            if os.path.exists(basic_info_path):
-                with open(basic_info_path, "r") as f:
-                    basic_info = json.load(f)
-            else:
-                st.error("Failed to extract basic information from the RDS file.")
-                if os.path.exists(temp_filename):
-                    os.unlink(temp_filename)
-                st.stop()
-            
-            # Load expression data
-            expr_data_path = os.path.join(temp_dir, "expression_data.csv")
-            if os.path.exists(expr_data_path):
-                X = pd.read_csv(expr_data_path, index_col=0)
-            else:
-                st.error("Failed to extract expression data from the RDS file.")
-                if os.path.exists(temp_filename):
-                    os.unlink(temp_filename)
-                st.stop()
-            
-            # Load sample metadata
-            sample_meta_path = os.path.join(temp_dir, "sample_metadata.csv")
-            if os.path.exists(sample_meta_path):
-                sample_meta = pd.read_csv(sample_meta_path, index_col=0)
-            else:
-                st.warning("No sample metadata found in the RDS file.")
-                sample_meta = pd.DataFrame(index=X.index)
-            
-            # Load feature metadata if available
-            feature_meta_path = os.path.join(temp_dir, "feature_metadata.csv")
-            if os.path.exists(feature_meta_path):
-                feature_meta = pd.read_csv(feature_meta_path, index_col=0)
-            else:
-                st.info("No feature metadata found in the RDS file.")
-                feature_meta = pd.DataFrame(index=X.columns)
-            
-            # Load class information if available
-            classes_path = os.path.join(temp_dir, "classes.csv")
-            if os.path.exists(classes_path):
-                classes = pd.read_csv(classes_path)["Class"].values
-            else:
-                classes = None
-            
-            # Load survival data if available
-            survival_path = os.path.join(temp_dir, "survival_data.csv")
-            if os.path.exists(survival_path):
-                survival_data = pd.read_csv(survival_path)
-            else:
-                survival_data = None
-            
-            # Display the extracted information
-            st.header(f"Dataset: {basic_info['dataset_name']}")
-            st.write(f"Number of samples: {basic_info['num_samples']}")
-            st.write(f"Number of features: {basic_info['num_features']}")
-            
-            # Create tabs for different components
-            tab1, tab2, tab3, tab4 = st.tabs(["Expression Data", "Sample Metadata", 
-                                            "Feature Metadata", "Classes/Survival"])
-            
-            with tab1:
-                st.subheader("Expression Data")
-                st.write(f"Shape: {X.shape} - {X.shape[0]} samples × {X.shape[1]} features")
-                st.dataframe(X.head())
-                
-                # Summary statistics
-                st.subheader("Summary Statistics")
-                st.dataframe(X.describe())
-            
-            with tab2:
-                st.subheader("Sample Metadata")
-                st.dataframe(sample_meta)
-                
-                # Display column info
-                if not sample_meta.empty and len(sample_meta.columns) > 0:
-                    st.subheader("Sample Metadata Columns")
-                    for col in sample_meta.columns:
-                        st.write(f"**{col}**: {sample_meta[col].dtype}")
-                        if sample_meta[col].dtype == 'object' or pd.api.types.is_categorical_dtype(sample_meta[col]):
-                            st.write(sample_meta[col].value_counts())
-                        else:
-                            st.write(sample_meta[col].describe())
-            
-            with tab3:
-                st.subheader("Feature Metadata")
-                st.dataframe(feature_meta)
-            
-            with tab4:
-                if classes is not None:
-                    st.subheader("Classes")
-                    classes_df = pd.DataFrame({"Class": classes})
-                    st.write("Class Distribution:")
-                    st.write(classes_df["Class"].value_counts())
-                    st.bar_chart(classes_df["Class"].value_counts())
-                
-                if survival_data is not None:
-                    st.subheader("Survival Data")
-                    st.dataframe(survival_data.head(20))
-                    st.write("Summary statistics of survival time:")
-                    st.write(survival_data["Survival_in_days"].describe())
-            
-        except subprocess.CalledProcessError as e:
-            st.error(f"Error running R script: {str(e)}")
-        except Exception as e:
-            st.error(f"Error processing data: {str(e)}")
+        if survival_data is not None:
+            st.subheader("Survival Data")
+            st.dataframe(survival_data.head(20))
+            st.write("Summary statistics of survival time:")
+            st.write(survival_data["Survival_in_days"].describe())
+        
+        # X, y, groups and weights as the modelling jobs use them
+        st.subheader("Model Inputs")
+        analyses = (["clf"] if "Class" in sample_meta else []) + (["surv"] if survival_data is not None else [])
+        if not analyses:
+            st.info("No Class or survival columns in the sample metadata.")
+        else:
+            analysis = st.radio("Analysis", analyses, horizontal=True,
+                                format_func={"clf": "Classification", "surv": "Survival"}.get)
+            inputs = model_inputs(eset, analysis)
+            if inputs["dropped_samples"]:
+                st.warning(f"{inputs['dropped_samples']} samples without a Class are left out of the model inputs.")
+            if inputs["missing_groups"]:
+                st.warning(f"{inputs['missing_groups']} samples without a Group are put in group \"{MISSING_GROUP}\".")
+            st.write(f"X: {inputs['X'].shape}, y: {inputs['y'].shape} ({inputs['y'].dtype})")
+            if inputs["class_labels"] is not None:
+                st.write("Class codes: " + ", ".join(f"{code} = {label}" for code, label in enumerate(inputs["class_labels"])))
+            if inputs["groups"] is not None:
+                st.write(f"Groups: {len(np.unique(inputs['groups']))}, sample weights "
+                         f"{inputs['sample_weights'].min():.3g} to {inputs['sample_weights'].max():.3g}"
+                         + (", group weights included" if inputs["group_weights"] is not None else ""))
+            st.download_button(
+                "Download model inputs (.npz)",
+                data=lambda: bundle_bytes(digest, inputs, analysis),
+                file_name=f"{basic_info['dataset_name']}_{analysis}.npz",
+                mime="application/octet-stream"
+            )
     
-    # Clean up the temporary file
-    if os.path.exists(temp_filename):
-        os.unlink(temp_filename)
+    with tab5:
+        st.subheader("Principal Components")
+        color_columns = [column for column in ("Class", "Group") if column in sample_meta]
+        col1, col2 = st.columns(2)
+        # A slider needs a range: small datasets use all their features
+        if X.shape[1] > 10:
+            pca_features = col1.slider("Most variable features used", min_value=10, max_value=min(10000, X.shape[1]),
+                                       value=min(2000, X.shape[1]), step=10)
+        else:
+            pca_features = X.shape[1]
+        color_by = col2.selectbox("Color by", ["None"] + color_columns)
+        scores, explained, features_used = pca_scores(digest, store_dtype, pca_features)
+        if scores.shape[1] < 2:
+            st.info("Not enough variable features or samples for a projection.")
+        else:
+            col1, col2 = st.columns(2)
+            x_axis = col1.selectbox("X axis", scores.columns, index=0)
+            y_axis = col2.selectbox("Y axis", scores.columns, index=1)
+            plot_projection(scores, explained, x_axis, y_axis,
+                            sample_meta[color_by].astype(str) if color_by != "None" else None, color_by)
+            st.caption(f"Randomized PCA on {features_used} features; "
+                       f"{explained.sum():.1%} of their variance in the first {len(explained)} components.")
+        
+        st.subheader("Clustered Heatmap")
+        col1, col2 = st.columns(2)
+        heatmap_features = X.shape[1]
+        if X.shape[1] > 2:
+            heatmap_features = col1.slider("Features", min_value=2, max_value=min(200, X.shape[1]),
+                                           value=min(50, X.shape[1]))
+        heatmap_samples = X.shape[0]
+        if X.shape[0] > 2:
+            heatmap_samples = col2.slider("Samples (random sample)", min_value=2, max_value=min(500, X.shape[0]),
+                                          value=min(100, X.shape[0]))
+        if X.shape[0] >= 2 and X.shape[1] >= 2:
+            plot_heatmap(heatmap_values(digest, store_dtype, heatmap_features, heatmap_samples))
 else:
     st.info("Please upload an RDS file to view its contents.")
-
-
-
@@ -0,0 +1,169 @@
+import gzip
+import os
+import re
+from collections import Counter
+from itertools import islice
+
+import pandas as pd
+
+# Distinct barcodes kept per counter; counts of rarer ones are dropped and bounded by `error`
+TOP_K = 10000
+# Reads counted exactly before they are folded into the bounded counter
+BATCH_READS = 1000000
+
+_COMPLEMENT = str.maketrans("ACGTN", "TGCAN")
+_LANE = re.compile(r"_L(\d{3})_")
+
+
+class TopKCounter:
+    """
+    Bounded heavy-hitter counter (mergeable Misra-Gries/space-saving summary).
+    At most `capacity` barcodes are kept; every count is a lower bound that is
+    at most `error` below the true count, so frequent barcodes are exact enough
+    while memory stays fixed however many reads are streamed.
+    """
+
+    def __init__(self, capacity=TOP_K):
+        self.capacity = capacity
+        self.counts = {}
+        self.total = 0
+        self.error = 0
+
+    def update(self, counts):
+        """
+        Adds a mapping of barcode -> count, e.g. a Counter of one batch of reads.
+        """
+        merged = Counter(self.counts)
+        merged.update(counts)
+        self.total += sum(counts.values())
+        if len(merged) > self.capacity:
+            ranked = merged.most_common()
+            # Everything below the cut loses at most the count of the first dropped barcode
+            self.error += ranked[self.capacity][1]
+            merged = dict(ranked[:self.capacity])
+        self.counts = dict(merged)
+
+    def merge(self, other):
+        self.update(other.counts)
+        # update() already added other's reads to the total
+        self.total += other.total - sum(other.counts.values())
+        self.error += other.error
+
+    def most_common(self, n=None):
+        return Counter(self.counts).most_common(n)
+
+
+def undetermined_files(output_dir):
+    """
+    Read 1 Undetermined FASTQs below a bcl2fastq output directory, with or without lane splitting.
+    """
+    found = []
+    for root, _, names in os.walk(output_dir):
+        for name in names:
+            if name.startswith("Undetermined_") and "_R1_" in name and name.endswith((".fastq.gz", ".fastq")):
+                found.append(os.path.join(root, name))
+    return sorted(found)
+
+
+def file_lane(path):
+    match = _LANE.search(os.path.basename(path))
+    return str(int(match.group(1))) if match else "all"
+
+
+def count_indexes(path, mtime_ns=None, capacity=TOP_K, max_reads=None):
+    """
+    Streams one FASTQ(.gz) and counts the index sequences from its read headers
+    (`@... 1:N:0:ACGTACGT+TTGGCCAA`). Only every fourth line is looked at and
+    reads are counted in exact batches folded into a TopKCounter.
+    mtime_ns only makes the job id change when the file is rewritten.
+    """
+    counter = TopKCounter(capacity)
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        headers = islice(f, 0, None, 4)
+        if max_reads is not None:
+            headers = islice(headers, max_reads)
+        while True:
+            batch = Counter(line[line.rfind(b":") + 1:].rstrip() for line in islice(headers, BATCH_READS))
+            if not batch:
+                break
+            counter.update(batch)
+    counter.counts = {barcode.decode("ascii", errors="replace"): n for barcode, n in counter.counts.items()}
+    return counter
+
+
+def reverse_complement(sequence):
+    return sequence.translate(_COMPLEMENT)[::-1]
+
+
+def explain_barcode(barcode, i7_lookup, i5_lookup, i5_rc_lookup):
+    """
+    Why a barcode may be undetermined: which sample sheet indexes it contains,
+    including an i5 sequenced in the other orientation or swapped index reads.
+    """
+    i7, _, i5 = barcode.partition("+")
+    if set(i7) == {"N"} or set(i7) == {"G"}:
+        return "No index signal (all N/G)"
+    if i5 and i7 in i7_lookup and i5 in i5_rc_lookup and i7_lookup[i7] & i5_rc_lookup[i5]:
+        return f"i5 reverse-complemented: {', '.join(sorted(i7_lookup[i7] & i5_rc_lookup[i5]))}"
+    if i5 and i5 in i7_lookup and i7 in i5_lookup:
+        return f"i7/i5 swapped: {', '.join(sorted(i7_lookup[i5] | i5_lookup[i7]))}"
+    if i5 and i7 in i7_lookup and i5 in i5_lookup:
+        return f"Index hopping: i7 of {', '.join(sorted(i7_lookup[i7]))}, i5 of {', '.join(sorted(i5_lookup[i5]))}"
+    if i7 in i7_lookup:
+        return f"i7 of {', '.join(sorted(i7_lookup[i7]))}" + (", unknown i5" if i5 else "")
+    if i5 and i5 in i5_lookup:
+        return f"i5 of {', '.join(sorted(i5_lookup[i5]))}, unknown i7"
+    if i5 and i5 in i5_rc_lookup:
+        return f"Reverse-complemented i5 of {', '.join(sorted(i5_rc_lookup[i5]))}, unknown i7"
+    if reverse_complement(i7) in i7_lookup:
+        return f"Reverse-complemented i7 of {', '.join(sorted(i7_lookup[reverse_complement(i7)]))}"
+    return ""
+
+
+def _lookup(df, column, length, transform=None):
+    lookup = {}
+    if column not in df.columns:
+        return lookup
+    for sample_id, sequence in zip(df["Sample_ID"], df[column].str.upper()):
+        if not sequence:
+            continue
+        if transform:
+            sequence = transform(sequence)
+        lookup.setdefault(sequence[:length], set()).add(sample_id)
+    return lookup
+
+
+def profile_table(counters, sample_data, top_n=100):
+    """
+    Merges the per-file counters into one table of the most frequent
+    undetermined barcodes per lane with their share of reads and a sample
+    sheet match. Returns (table, reads counted, error bound).
+    """
+    lanes = {}
+    for path, counter in counters:
+        lane = lanes.setdefault(file_lane(path), TopKCounter(counter.capacity))
+        lane.merge(counter)
+    rows = []
+    for lane, counter in sorted(lanes.items()):
+        if not counter.counts:
+            continue
+        i7_length, _, i5_length = next(iter(counter.counts)).partition("+")
+        i7_length, i5_length = len(i7_length), len(i5_length)
+        lane_data = sample_data
+        if "Lane" in sample_data.columns and lane != "all":
+            lane_data = sample_data[sample_data["Lane"] == lane]
+        i7_lookup = _lookup(lane_data, "index", i7_length)
+        i5_lookup = _lookup(lane_data, "index2", i5_length)
+        i5_rc_lookup = _lookup(lane_data, "index2", i5_length, reverse_complement)
+        for barcode, reads in counter.most_common(top_n):
+            rows.append({
+                "Lane": lane,
+                "Barcode": barcode,
+                "Reads": reads,
+                "% of Undetermined": 100 * reads / counter.total if counter.total else 0.0,
+                "Sample sheet match": explain_barcode(barcode, i7_lookup, i5_lookup, i5_rc_lookup),
+            })
+    total = sum(counter.total for counter in lanes.values())
+    error = max((counter.error for counter in lanes.values()), default=0)
+    return pd.DataFrame(rows), total, error